@@ -0,0 +1,745 @@
+#!/usr/bin/env python
+'''
+The gpsparser command-line interface (see C{gpsparser.py -h}).
+
+@author: Val Schmidt
+@organization: Center for Coastal and Ocean Mapping, University of New Hampshire
+@license: GPL
+'''
+from __future__ import print_function
+import os
+import sys
+import datetime
+import itertools
+from collections import OrderedDict
+from gpsparser import GPSString, SENTENCES, Parser, eprint
+from stages import (Filter, Decimator, Deduplicator, BucketAverager, RunStats,
+                    ErrorAggregator)
+from readers import LogReader, LogMerger, Inventory, COMPRESSED_SUFFIXES
+import timestamps
+import writers
+
+def main():
+    ''' Parses GPS logs as directed by the command-line arguments.'''
+
+    supportedstrings = ' '.join(sorted(SENTENCES))
+
+    ''' Handle options'''
+    import argparse
+    parser = argparse.ArgumentParser(description=("Parse GPS NMEA0183 ASCII "
+    "text data file(s), to one of: "
+    "1) stdout (default) "
+    "2) a file of the same as the input filename appended with 'parsed_STR.txt' "
+    "3) a user specified filename "
+    "4) a MATLAB compatible .mat file. (not yet supported)"))
+    
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('-f','--filename', dest='filename',action='store',
+                            help='specify the filename, default stdin', default=sys.stdin)
+    group.add_argument('-g','--directory', dest='directory',action='store',
+                            help=('alternatively, specify a directory and a suffix '
+                            'pattern (e.g. /path/::.gps). The directory will be '
+                            'searched recursively and files matching the suffix '
+                            'specified after :: will be parsed. The output will '
+                            ' go to separate output files if -o <directory> or '
+                            ' -o i is specified.' ), 
+                            default="") 
+    parser.add_argument('-s','--stringtype',dest='stringtype',action='store',
+                           help=('specify which string to parse by specifying '
+                           'the three-letter identifier (Currently supported '
+                           'strings: '+ supportedstrings + ')'))
+    parser.add_argument('-o', dest='output',action='store',
+                        default=None,
+                       help=('A directory or filename. If a directory, output' 
+                       'data to a file within the specified directory having '
+                       'a file name of directory/<inputfilename>_STR_parsed.txt)'
+                       ' where STR is the specified string to parse. If a file' 
+                       ' name, output to that explicit file. If -o is omitted,'
+                       ' data is written to stdout.'))
+    parser.add_argument('-m',dest='matflag',action='store_true',
+                        help='Write the output file in MATLAB .mat format. (NOT YET SUPPORTED)',
+                        default=False)
+    parser.add_argument('-v',dest='verbose',action='count',
+                         help='Verbose output. (-v, -vv, -vvv, etc.)')
+    parser.add_argument('--numeric', dest='numeric', action='store',
+                        default='decimal', choices=Parser.NUMERIC,
+                        help=('Parse numeric fields as Decimal (default), '
+                        'keeping the precision of the string, or as float, '
+                        'which is several times faster.'))
+    parser.add_argument('--times', dest='times', action='store',
+                        default='datetime', choices=list(Parser.TIMES),
+                        help=('The format of times: date-time vectors '
+                        '(datetime, the default), seconds since 1970 '
+                        '(epoch), MATLAB serial time (datenum) or GPS week '
+                        'and seconds of the week (gpsweek). Numeric times '
+                        'are computed directly from the strings and time '
+                        'stamps, which is faster.'))
+    parser.add_argument('--stats', dest='stats', action='store', nargs='?',
+                        const='-', default=None, metavar='FILE.json',
+                        help=('Collect run statistics (line, sentence and '
+                        'failure counts and time spent in each stage). A '
+                        'summary is written to stderr, or to FILE.json in '
+                        'JSON format if a file name is given.'))
+    parser.add_argument('--project', dest='project', action='store',
+                        default=None, metavar='SPEC',
+                        help=('Append projected coordinates to each record. '
+                        'SPEC is one of utm (zone selected from the first '
+                        'fix), utm:ZONE, enu (origin at the first fix) or '
+                        'enu:LAT,LON[,HEIGHT]. Requires numpy.'))
+    parser.add_argument('--where', dest='where', action='append',
+                        default=[], metavar='EXPR',
+                        help=('Only write records satisfying EXPR, a '
+                        'condition of the form FIELD OP VALUE where OP is one '
+                        'of < <= > >= == != (e.g. --where quality>=4). May be '
+                        'repeated. Conditions are tested before the rest of '
+                        'the string is parsed.'))
+    parser.add_argument('--bbox', dest='bbox', action='store', default=None,
+                        metavar='MINLAT,MINLON,MAXLAT,MAXLON',
+                        help='Only write records within a bounding box.')
+    parser.add_argument('--start', dest='start', action='store', default=None,
+                        help=('Only write records with a GPS time at or after '
+                        'START (e.g. 2008-08-13T18:31:00).'))
+    parser.add_argument('--end', dest='end', action='store', default=None,
+                        help='Only write records with a GPS time at or before END.')
+    parser.add_argument('--decimate', dest='decimate', action='append',
+                        default=[], metavar='[TYPE:]MODE:VALUE',
+                        help=('Reduce the output rate. MODE is every (keep '
+                        'every VALUE-th string), first (keep the first string '
+                        'in each VALUE second bucket of GPS time) or mean '
+                        '(average each VALUE second bucket). every and first '
+                        'are applied before the string is parsed. TYPE '
+                        'defaults to the -s string type. May be repeated.'))
+    parser.add_argument('--dedup', dest='dedup', action='store', nargs='?',
+                        const='sentence', default=None,
+                        choices=Deduplicator.KEYS,
+                        help=('Drop duplicate strings, such as those from '
+                        'redundant loggers or overlapping files, keyed on the '
+                        'whole string (default) or on the talker, string type '
+                        'and GPS time. In directory mode duplicates are found '
+                        'across files.'))
+    parser.add_argument('--dedup-window', dest='dedupwindow', action='store',
+                        type=int, default=100000, metavar='N',
+                        help=('The number of recent strings remembered when '
+                        'looking for duplicates (default 100000).'))
+    parser.add_argument('--summary', dest='summary', action='store_true',
+                        default=False,
+                        help=('Write summary statistics of each file (time '
+                        'span, bounding box, the range, mean and standard '
+                        'deviation of each numeric field and histograms of '
+                        'fix quality and satellites) as a line of JSON, '
+                        'instead of the records. In directory mode a total '
+                        'is also written.'))
+    parser.add_argument('--monitor', dest='monitor', action='store_true',
+                        default=False,
+                        help=('Instead of parsing, monitor the data rate of '
+                        'every stream (talker and string type) in GPS and '
+                        'logger time. Gaps and rate changes are written as '
+                        'lines of JSON as they are found, followed by the '
+                        'nominal rate, jitter, gap count and logger clock '
+                        'drift of each stream. -s is not needed.'))
+    parser.add_argument('--follow', dest='follow', action='store_true',
+                        default=False,
+                        help=('Follow the input as it is written, like tail '
+                        '-f, or until the end of a pipe (i.e. from a network '
+                        'logger). Compressed input cannot be followed.'))
+    parser.add_argument('--merge', dest='merge', action='store', nargs='?',
+                        const='logger', default=None,
+                        choices=LogMerger.KEYS,
+                        help=('In directory mode, merge the files into a '
+                        'single time ordered stream (and output file, '
+                        'merged_parsed_STR.txt) ordered by the logger time '
+                        'stamp (default) or by GPS time.'))
+    parser.add_argument('--inventory', dest='inventory', action='store',
+                        nargs='?', const='counts', default=None,
+                        choices=('counts', 'times'),
+                        help=('Instead of parsing, quickly count the '
+                        'sentences of each talker and string type in each '
+                        'file, without verifying or parsing them, and write '
+                        'the counts as a line of JSON. With "times", the '
+                        'logger time stamps of the first and last of each '
+                        'are included. -s is not needed.'))
+    parser.add_argument('--pipeline', dest='pipeline', action='store_true',
+                        default=False,
+                        help=('Read, parse and write on separate threads, '
+                        'joined by bounded queues, so that waiting on input '
+                        '(i.e. a pipe or network file system) or output '
+                        'overlaps with parsing.'))
+    parser.add_argument('--publish', dest='publish', action='store',
+                        nargs='?', const='', default=None, metavar='NAME',
+                        help=('Publish the records to a ring buffer in '
+                        'shared memory (named by the string type, or NAME), '
+                        'from which other local processes may read the '
+                        'latest fixes with ringbuffer.RingReader, instead of '
+                        'writing them. Usually used with --follow.'))
+    parser.add_argument('--best', dest='best', action='store_true',
+                        default=False,
+                        help=('Where several receivers (talkers, i.e. GPGGA '
+                        'and INGGA) are logged together, write only the best '
+                        'fix of each epoch, by fix quality, GST error and '
+                        'HDOP, with its talker as a last column. Receivers '
+                        'that drop out are failed over.'))
+    parser.add_argument('--sqlite', dest='sqlite', action='store',
+                        default=None, metavar='FILE.db',
+                        help=('Write the records to a table named by the '
+                        'string type in a SQLite database, instead of text. '
+                        'The database is created if needed and appended to '
+                        'otherwise; in directory mode files already written '
+                        'and unchanged since are skipped.'))
+    parser.add_argument('--kinematics', dest='kinematics', action='store',
+                        nargs='?', type=float, const=-1, default=None,
+                        metavar='MAXGAP',
+                        help=('Add the ground speed (m/s), course (degrees), '
+                        'vertical rate (m/s) and along-track distance (m) '
+                        'computed from consecutive fixes to each record, for '
+                        'strings carrying a position (i.e. GGA or GGK). Rates '
+                        'are not computed across gaps longer than MAXGAP '
+                        'seconds, if given. Requires numpy.'))
+    parser.add_argument('--partition', dest='partition', action='store',
+                        default=None,
+                        choices=list(writers.PartitionedWriter.PERIODS),
+                        help=('Write the records to a file for each hour or '
+                        'day of GPS time, STR/YYYY-DDD-HH.txt or '
+                        'STR/YYYY-DDD.txt in the -o directory, however the '
+                        'input logs were cut. Existing files are appended '
+                        'to, so several runs may write to the same '
+                        'partitions at once.'))
+    parser.add_argument('--max-open', dest='maxopen', action='store',
+                        type=int, default=None, metavar='N',
+                        help=('The most partition files held open at once '
+                        '(default %d).' % writers.PartitionedWriter.MAXOPEN))
+            
+    args = parser.parse_args()
+    
+    filename = args.filename
+    directory = args.directory
+    stringtype = args.stringtype
+    verbose = args.verbose
+    output = args.output
+    matflag = args.matflag
+    stats = None
+    if args.stats:
+        stats = RunStats()
+    errors = ErrorAggregator()
+
+            
+    if verbose >= 1:
+        print("Arguments:")
+        arguments = vars(args)
+        for key, value in arguments.iteritems():
+            print("\t%s:\t\t%s" % (key,str(value)))
+
+    if directory:       
+        filestoprocess = []     
+        directory, suffix = directory.split('::')
+        if verbose >= 3:
+            print("directory: " + directory)
+            print("suffix:    " + suffix)
+        for root,subFolders, files in os.walk(directory):
+            for fileval in files:
+                # Compressed logs match too (i.e. log.gps.gz for .gps).
+                for compressed in ('',) + COMPRESSED_SUFFIXES:
+                    if fileval.endswith(suffix + compressed):
+                        filestoprocess.append(os.path.join(root,fileval))
+                        break
+    else:
+        filestoprocess = [filename]
+
+    if filestoprocess.__len__() == 0:
+        print("No files found to process.")
+        sys.exit()
+
+    if args.inventory:
+        inventoryfiles(filestoprocess, args.inventory == 'times')
+        return
+
+    if args.merge:
+        filestoprocess = [LogMerger(filestoprocess, args.merge)]
+
+    if args.monitor:
+        monitorrates(filestoprocess, args.follow)
+        return
+    if args.sqlite and (output or matflag or args.summary):
+        print('--sqlite cannot be combined with -o, -m or --summary.')
+        sys.exit()
+    if (args.sqlite or args.publish is not None) and \
+            args.times not in ('datetime', 'epoch'):
+        print('--sqlite and --publish store times as epoch seconds.')
+        sys.exit()
+    if args.publish is not None and (output or matflag or args.summary or
+                                     args.sqlite):
+        print('--publish cannot be combined with -o, -m, --summary or '
+              '--sqlite.')
+        sys.exit()
+    if args.partition and (matflag or args.summary or args.sqlite or
+                           args.publish is not None):
+        print('--partition cannot be combined with -m, --summary, --sqlite '
+              'or --publish.')
+        sys.exit()
+
+    # Conditions are:
+    # 1) No -o is specified, write to std out.
+    # 2) -o is specified with a directory, write default file name to directory.
+    # 3) -o is specified with a filename. Write to the filename. 
+    outputtofile = False
+    outfilename = None 
+    saveto1file = False
+    # If we specified some kind of output, set it up (otherwise stdout is default)
+    if output:
+        outputtofile = True
+        # We can specify a directory. If so, set it as the output dir. 
+        if os.path.isdir(output):
+            outputdir = output  # outfilename will get set dyamamically based on input file name.
+            if verbose >=1:
+                print("Output directory: " + outputdir)
+                print("Output filename: Not specified")
+
+        # Or we can set a file name directly. Then set everything.
+        # Two things could have happened here. Either the directory did not 
+        # exist, or a filename was specified with it. Here we check to see that 
+        # the directory exists, and if so, we assume that anything further is 
+        # the requested filename. 
+        elif os.path.isdir(os.path.dirname(output)):
+            saveto1file = True
+            outputdir = os.path.dirname(output)
+            outfilename = os.path.basename(output)
+            if verbose >= 1:
+                print("Outputfilename: " + os.path.join(outputdir,outfilename))
+                
+        # Or quicklly specify the output directory as the input directory with an 'i'
+        elif output == 'i':
+            if directory:
+                outputdir = directory
+            else:
+                outputdir = os.path.dirname(filename)
+        else:
+            eprint("The argument to -g is not 'i', a valid directory or a valid/filename")
+            sys.exit()
+    if args.partition and (not output or saveto1file):
+        print('--partition requires -o with a directory.')
+        sys.exit()
+            
+    if matflag:
+        try:
+            import scipy as sci
+            import scipy.io as sio
+        except:
+            print("Output to MATLAB file format requires the scipy module.")
+            sys.exit()
+                
+    if not GPSString.GPS_IDs.has_key(stringtype):
+        print ('Unsupported string type: ' + str(stringtype))
+        sys.exit()
+
+    recordfilter = None
+    if args.where or args.bbox or args.start or args.end:
+        try:
+            recordfilter = Filter(
+                where=args.where,
+                bbox=args.bbox.split(',') if args.bbox else None,
+                start=timestamps.parsetime(args.start) if args.start else None,
+                end=timestamps.parsetime(args.end) if args.end else None)
+        except ValueError as e:
+            print('Invalid filter: %s' % e)
+            sys.exit()
+        fieldnames = set(item[1] for item in SENTENCES[stringtype].fields)
+        unknown = recordfilter.fieldnames() - fieldnames
+        if unknown:
+            print('%s strings have no field(s): %s' % 
+                  (stringtype, ', '.join(sorted(unknown))))
+            sys.exit()
+
+    decimationmodes = {}
+    averager = None
+    for spec in args.decimate:
+        try:
+            decimatetype, mode, value = Decimator.parsespec(spec)
+        except ValueError as e:
+            print(e)
+            sys.exit()
+        if decimatetype not in (None, stringtype):
+            continue
+        if mode == 'mean':
+            if 'datetime' in SENTENCES[stringtype].output:
+                averager = BucketAverager(value, 'datetime', args.times)
+            else:
+                averager = BucketAverager(value, 'pctime', args.times)
+        else:
+            decimationmodes[stringtype] = (mode, value)
+
+    # The filter applied to the raw fields of each string: the record 
+    # filter, then deduplication, then decimation.
+    linefilter = recordfilter
+    deduplicator = None
+    if args.dedup:
+        deduplicator = Deduplicator(args.dedup, args.dedupwindow, 
+                                    filter=linefilter)
+        linefilter = deduplicator
+    if decimationmodes:
+        linefilter = Decimator(decimationmodes, filter=linefilter)
+
+    projector = None
+    if args.project:
+        try:
+            import projection
+        except ImportError:
+            print("Projection of positions requires the numpy module.")
+            sys.exit()
+        if stringtype not in projection.POSITION_FIELDS:
+            print('Cannot project %s strings, which carry no position.' % stringtype)
+            sys.exit()
+        try:
+            projector = projection.Projection.fromspec(args.project)
+        except ValueError as e:
+            print('Invalid projection %s: %s' % (args.project, e))
+            sys.exit()
+            
+        
+    kinematics = None
+    extrafields = ()
+    if args.kinematics is not None:
+        try:
+            import projection
+            import kinematics as kinematicsmodule
+        except ImportError:
+            print("Kinematics require the numpy module.")
+            sys.exit()
+        if stringtype not in projection.POSITION_FIELDS:
+            print('Cannot compute kinematics of %s strings, which carry no '
+                  'position.' % stringtype)
+            sys.exit()
+        kinematics = kinematicsmodule.Kinematics(
+            stringtype, args.kinematics if args.kinematics >= 0 else None,
+            args.times)
+        extrafields = kinematicsmodule.FIELDNAMES
+
+    # Text output is projected by the writer. Other writers take the
+    # projected coordinates as fields of the records.
+    projectrecords = projector and (args.summary or args.sqlite or
+                                    args.publish is not None)
+    if projectrecords:
+        extrafields = tuple(extrafields) + tuple(projector.fieldnames)
+
+    if args.summary:
+        writer = writers.SummaryWriter(stringtype, args.times)
+    elif args.publish is not None:
+        import ringbuffer
+        try:
+            writer = ringbuffer.RingWriter(stringtype, args.publish or None,
+                                           extrafields=extrafields)
+        except ValueError as e:
+            print(e)
+            sys.exit()
+    elif args.sqlite:
+        # Followed logs are written a row at a time, as they arrive.
+        writer = writers.SQLiteWriter(args.sqlite, stringtype,
+                                      1 if args.follow else None, extrafields)
+    elif args.partition:
+        writer = writers.PartitionedWriter(outputdir, stringtype, args.partition,
+                                           args.maxopen, projector, args.times)
+    else:
+        writer = writers.RecordWriter(stringtype, projector)
+
+    # Set up data structures for saving to a MATLAB .mat file.
+    if matflag:
+        mat = {}
+        data={}
+        mat[stringtype] = data
+        
+        # Initialize space for saving data in numpy arrays. 
+        # We need to know the fields we intend to save before we begin reading data.
+        # and the number of data points, which is counted by a quick
+        # inventory of the files (an upper bound, as some strings may fail
+        # to parse). Input from stdin cannot be pre-read, so there we
+        # assume a maximum 10Hz rate for 1 day.
+        matrows = 864000
+        if filename != sys.stdin:
+            inventory = Inventory()
+            for filetoscan in filestoprocess:
+                if isinstance(filetoscan, LogMerger):
+                    for source in filetoscan.sources:
+                        inventory.scan(source)
+                else:
+                    inventory.scan(filetoscan)
+            matrows = inventory.count(stringtype)
+        matfieldnames = writers.assign_fieldnames(stringtype) + list(extrafields)
+        if projector and not projectrecords:
+            matfieldnames += projector.fieldnames
+        for key in matfieldnames:
+            data[key] = sci.zeros((matrows,1),'double')
+            data[key].fill(sci.nan)
+
+    if verbose >=3:
+        print("Entering debug mode")
+
+    selector = None
+    parsetypes = [stringtype]
+    if args.best:
+        import selector as bestselector
+        if 'quality' not in SENTENCES[stringtype].output and \
+                'hdop' not in SENTENCES[stringtype].output:
+            print('Cannot select the best of %s strings, which carry no fix '
+                  'quality.' % stringtype)
+            sys.exit()
+        selector = bestselector.BestSolution(times=args.times)
+        if stringtype != 'GST':
+            # GST errors rank the fixes, but are not written.
+            parsetypes.append('GST')
+
+    lineparser = Parser(parsetypes, numeric=args.numeric, filter=linefilter,
+                        times=args.times)
+
+    if stats:
+        stats.instrument(lineparser)
+        _timedprintfields = stats.timed('printfields', writers.printfields)
+        def printfields(fieldstoprint, fid=None):
+            ''' Counts and times each record written.'''
+            stats.records += 1
+            _timedprintfields(fieldstoprint, fid)
+        writer.printfields = printfields
+        if args.sqlite or args.publish is not None:
+            _timedwrite = stats.timed('sqlite' if args.sqlite else 'publish',
+                                      writer.write)
+            def write(record, fid=None):
+                ''' Counts and times each record inserted.'''
+                stats.records += 1
+                _timedwrite(record, fid)
+            writer.write = write
+        if projectrecords:
+            projector.addcolumns = stats.timed('project', projector.addcolumns)
+        elif projector:
+            writer.project = stats.timed('project', projector)
+        if kinematics:
+            kinematics.addcolumns = stats.timed('kinematics',
+                                                kinematics.addcolumns)
+
+    if args.follow:
+        _flushedprintfields = writer.printfields
+        def printfields(fieldstoprint, fid=None):
+            ''' Writes each record as soon as it is parsed.'''
+            _flushedprintfields(fieldstoprint, fid)
+            (fid or sys.stdout).flush()
+        writer.printfields = printfields
+
+    def parselines(lines):
+        ''' Yields the records parsed from lines (see --pipeline).'''
+        for line in lines:
+            if stats:
+                stats.countline(line)
+
+            # Strings are dated by the PC time stamp added when they were
+            # logged (see Parser), or are otherwise assumed to be from today.
+            status, linetype, record = lineparser.tryparse(line)
+            if status == GPSString.UNRECOGNIZED:
+                errors.add(GPSString.UNRECOGNIZED, None, line)
+                if verbose >= 1:
+                    sys.stderr.write('Unrecognized NMEA string: %s\n' % line)
+                continue
+            if verbose >= 3:
+                print('String Type: ' + linetype)
+
+            # Other string types, and strings rejected by the filters.
+            if status == GPSString.FILTERED:
+                continue
+            if status != GPSString.PARSED:
+                errors.add(status, linetype, line)
+                if verbose >= 1:
+                    sys.stderr.write("%s: %s" % 
+                                     (GPSString.STATUS_NAMES[status].title(), line))
+                continue
+
+            record = record._asdict()
+            if record['pctime'] is None:
+                del record['pctime']
+            if verbose >= 3:
+                print("Fields: " + ','.join(record.keys()))
+
+            if selector:
+                source = bestselector.sourcename(line, linetype)
+                if linetype != stringtype:
+                    selector.adderror(source, record)
+                    continue
+                records = selector.add(source, record)
+            else:
+                records = [record]
+            for record in records:
+                if averager:
+                    record = averager.add(record)
+                    if record is None:
+                        continue
+                yield record
+
+    def flushrecords():
+        ''' Yields the records held back at the end of an input.'''
+        if selector:
+            for record in selector.flush():
+                if averager:
+                    record = averager.add(record)
+                    if record is None:
+                        continue
+                yield record
+        if averager:
+            record = averager.flush()
+            if record is not None:
+                yield record
+
+    #######################            
+    # PROCESS THE FILE(s) #
+    #######################
+    for filename in filestoprocess:
+
+        if args.sqlite and writer.loaded(filename):
+            if verbose >= 1:
+                eprint('Skipping %s, already in %s' % (filename, args.sqlite))
+            continue
+            
+        # Gives status to stdout only when output is not stdout.
+        if verbose >=1 and outputtofile:
+            print('Processing ' + str(filename))
+        # Compressed logs are detected and decompressed by LogReader.
+        if isinstance(filename, LogMerger):
+            filetoread = filename
+        else:
+            filetoread = LogReader(filename, follow=args.follow)
+        if args.summary or args.sqlite:
+            writer.source = getattr(filename, 'name', filename)
+        
+        # When FID is None we print to stdout, by default.
+        # But if we're saving to a file and we've explcity chosen it,
+        # Then the file may be open, in which case don't loose the fid.
+        if not saveto1file:
+            fid = None
+            
+        # Set up the output file name if output to a file is requested. 
+        # The output may be of txt or .mat type.
+        # By now the output directory (outputdir), is already specified.
+        # Partitioned output is named by the time of each record instead.
+        if (outputtofile or matflag) and not args.partition:
+            if outfilename is not None:
+                pass
+            if outfilename == None and not matflag and filename == sys.stdin:
+                outfilename = ('data' +
+                '_parsed_'+ stringtype +'.txt')
+            if isinstance(filename, LogMerger):
+                basename = filename.name
+            elif filename != sys.stdin:
+                basename = os.path.basename(filename)
+                if basename.endswith(COMPRESSED_SUFFIXES):
+                    basename = os.path.splitext(basename)[0]
+            if outfilename == None and not matflag:
+                outfilename = (basename +
+                '_parsed_'+ stringtype +'.txt')
+            elif outfilename == None and matflag:
+                outfilename = (basename +
+                '_parsed_'+ stringtype +'.mat')
+
+            if verbose >=1:
+                print("Writing to %s" % os.path.join(outputdir,outfilename))        
+
+        # If we are saving to a txt file, open the file. 
+        # If it is the first process in the list, always open it. 
+        # If not, then only open a new file if not saving to a single file,
+        # which would happen if the file name was explicitly set.
+        if outputtofile and not matflag and not args.partition:
+            if filename == filestoprocess[0]:
+                fid = file(os.path.join(outputdir,outfilename),'w')
+            elif not saveto1file:
+                fid = file(os.path.join(outputdir,outfilename),'w')
+
+        # By setting outfilename to None here we force creation of a new 
+        # output file for every input file. Otherwise a file for the first one 
+        # is created and this over-written with subseqeunt ones. We could write 
+        # all to a single file, but there are reasons we may not want to do this too.
+        if not saveto1file:
+            outfilename = None        
+        
+        if args.pipeline:
+            from pipeline import Pipeline
+            # Followed logs are passed on a line at a time, as they arrive.
+            records = Pipeline(filetoread,
+                               [lambda lines: list(parselines(lines))],
+                               1 if args.follow else None)
+        else:
+            records = parselines(filetoread)
+        records = itertools.chain(records, flushrecords())
+        if kinematics:
+            # Each input starts a new track. Followed logs are computed a
+            # record at a time, as they arrive.
+            kinematics.reset()
+            records = kinematics.stream(records, 1 if args.follow else None)
+        if projectrecords:
+            records = projector.stream(stringtype, records,
+                                       1 if args.follow else None)
+        for record in records:
+            writer.write(record, fid)
+        
+        ###############################################################
+        ##### END READING FILE ########################################
+        ###############################################################
+
+        writer.flush(fid)
+        filetoread.close()
+                
+        if outputtofile and not saveto1file and not args.partition:
+            fid.close()
+
+    if args.summary and len(filestoprocess) > 1:
+        if outputtofile and not saveto1file:
+            fid = None
+        writer.writetotal(fid)
+    if args.sqlite or args.publish is not None or args.partition:
+        writer.close()
+    if args.partition and verbose >= 1:
+        eprint('Partition files opened %d times.' % writer.opened)
+
+    if selector and verbose >= 1:
+        eprint('Best fixes by source: %s; %d failovers, %d late fixes dropped.' %
+               (', '.join('%s %d' % item for item in selector.chosen.items()),
+                selector.failovers, selector.late))
+    errors.write()
+    if deduplicator:
+        if verbose >= 1:
+            eprint("Dropped %d duplicate strings." % deduplicator.dropped)
+        if stats:
+            stats.duplicates = deduplicator.dropped
+    if stats:
+        stats.write(args.stats)
+
+
+def monitorrates(filestoprocess, follow=False):
+    ''' Writes the data rate events and statistics of each input as JSON.'''
+    import json
+    import monitor
+    for filename in filestoprocess:
+        ratemonitor = monitor.RateMonitor()
+        if isinstance(filename, LogMerger):
+            filetoread = filename
+        else:
+            filetoread = LogReader(filename, follow=follow)
+        try:
+            for line in filetoread:
+                for event in ratemonitor.add(line):
+                    print(json.dumps(event, separators=(',', ':')))
+                    sys.stdout.flush()
+        except KeyboardInterrupt:
+            # Stopping a followed log still reports on it.
+            pass
+        finally:
+            filetoread.close()
+        report = OrderedDict([('source', getattr(filename, 'name', filename)),
+                              ('streams', ratemonitor.report())])
+        print(json.dumps(report, separators=(',', ':')))
+
+
+def inventoryfiles(filestoprocess, loggertimes=False):
+    ''' Writes the sentence inventory of each input as a line of JSON.'''
+    import json
+    for filename in filestoprocess:
+        inventory = Inventory(loggertimes)
+        inventory.scan(filename)
+        report = OrderedDict([('source', getattr(filename, 'name', filename))])
+        report.update(inventory.todict())
+        print(json.dumps(report, separators=(',', ':')))
+
+
+if __name__ == '__main__':
+    main()
@@ -76,13 +76,14 @@ import os
 import sys
 import datetime
 from datetime import timedelta
-import dateutil.parser
 import re
 #import string
 import decimal as dec
 #import pdb
 from operator import xor
 #import exceptions 
+from collections import OrderedDict, namedtuple
+import timestamps
 
 # A function for writing to standard error vs standard out. 
 def eprint(*args, **kwargs):
@@ -94,17 +95,23 @@ class GPSString(object):
     within it. The string must start with the leading $ and end with the *hh 
     where hh is the checksum. 
     '''
-    GPS_IDs = { \
-        'GGA' : 1, \
-            'ZDA' : 2, \
-            'RMC' : 3, \
-            'GST' : 4, \
-            'GSV' : 5, \
-            'VTG' : 6, \
-            'HDT' : 7 ,\
-            'PASHR' : 8,\
-            'GGK' : 9}
-
+    GPS_IDs = {}
+    'Supported strings and their numeric identifiers. See register_sentence().'
+
+    # Status codes returned by tryparse().
+    PARSED = 0
+    FAILED_CHECKSUM = 1
+    FAILED_PARSING = 2
+    UNRECOGNIZED = 3
+    FILTERED = 4
+    STATUS_NAMES = {PARSED : 'parsed',
+                    FAILED_CHECKSUM : 'failed checksum',
+                    FAILED_PARSING : 'failed parsing',
+                    UNRECOGNIZED : 'unrecognized',
+                    FILTERED : 'filtered'}
+
+    filter = None
+    'A Filter (see stages.py) applied to the raw fields before they are parsed.'
 
     def __init__(self,msg):
         '''
@@ -126,12 +133,12 @@ class GPSString(object):
         which is required to parse the string. 
         
         Currently the following message types are supported:
-        GGA, ZDA, RMC, GST, GSV, VTG, HDT, PASHR, GGK
+        GGA, ZDA, RMC, GST, GSV, VTG, HDT, PASHR, GGK, GLL, PAT, HDG, GNS
+        Others may be added with register_sentence().
         '''
-        'A dictionary of supported strings and their numeric indentifiers'
 
-        for key in self.GPS_IDs.keys():
-            if re.search( key, self.msg):
+        for key in SENTENCES:
+            if key in self.msg:
                 # self.id = self.GPS_IDs[key]
                 self.id = key
                 return 
@@ -169,6 +176,11 @@ class GPSString(object):
         units fields of meters for geoid separation in the GGA string is a classic
         example.
 
+        If GPSString.filter is set with a stages.Filter, the raw fields are
+        tested against it before they are converted. parse() returns False
+        (and sets no fields) when the string is rejected, and True
+        otherwise.
+
         '''
 
         ' Verify Checksum'
@@ -179,252 +191,66 @@ class GPSString(object):
         if self.id == None:
             self.identify()
 
-        ' Parse the code'
-        if self.id == 'GGA':
-            'GGA'
-            exp = '(?P<match>\$..GGA.*)\*(?P<chksum>..)'
-            m = re.search(exp,self.msg)
-            if m:
-                gps_extract = m.group('match')
-                fields = gps_extract.split(',')
-
-                'Handle GGA Fields'
-                self.handlegpstime(fields[1])                
-                self.handle_lat( fields[2], fields[3] )
-                self.handle_lon ( fields[4], fields[5] )
-                self.quality = dec.Decimal( fields[6] )
-                self.svs = dec.Decimal( fields[7] )
-                self.hdop = dec.Decimal( fields[8])
-                try:
-                    self.antennaheight = dec.Decimal(fields[9])
-                except dec.InvalidOperation:
-                    if self.debug:
-                        eprint("The field antennaheight may not be present.")
-                        eprint("self.msg")
-                    self.antennaheight = dec.Decimal('NaN')
-                try:
-                    self.geoid = dec.Decimal(fields[11])
-                except dec.InvalidOperation:
-                    if self.debug:
-                        eprint("The field GEOID Height may not be present.")
-                        eprint(self.msg)
-                        #print fields[11]
-                    self.geoid = dec.Decimal('NaN')
-                try:
-                    self.dgpsage = dec.Decimal(fields[13])
-                except dec.InvalidOperation:
-                    if self.debug: 
-                        eprint("The field DGPS Age may not be present.")
-                        eprint(self.msg)                        
-                        #print fields[13]
-                    self.dgpspage = dec.Decimal('NaN')
-                try:
-                    self.stationid = dec.Decimal(fields[14] )
-                except dec.InvalidOperation:
-                    if self.debug: 
-                        eprint("The field DGPS Station ID may not be present.")
-                        eprint(self.msg)
-                        #print 'StationID: %s' % fields[14]
-                    self.stationid = dec.Decimal('NaN')
-                        
-            else:
-                raise self.FailedParsing, 'Failed to parse %s' % self.msg
-                
-        elif self.id == 'ZDA':
-            'ZDA'
-            exp = '(?P<match>\$..ZDA.*)\*(?P<chksum>..)'
-            m = re.search(exp,self.msg)
-            if m:
-                gps_extract = m.group('match')
-                fields = gps_extract.split(',')
-                'Handle ZDA Fields'
-                self.datetime = datetime.date(int( fields[4]), \
-                                                  int(fields[3]), \
-                                                  int(fields[2]))
-                self.handlegpstime(fields[1])
-                try:
-                    self.tzoffsethours = dec.Decimal( fields[5] )
-                except dec.InvalidOperation:
-                    if self.debug:
-                        eprint("Thef ield Local TZ Offset Hours may not be present.")
-                        eprint (fields[5])
-                    self.tzoffsethours = dec.Decimal('NaN')
-
-                try:
-                    self.tzoffsetminutes = dec.Decimal( fields[6] )
-                except dec.InvalidOperation:
-                    if self.debug: 
-                        eprint("The field Local TZ Offset Minutes may not be present.")
-                        eprint(fields[6])
-                    self.tzoffsetminutes = dec.Decimal('NaN')
-            else:
-                raise self.FailedParsing, 'Failed to parse %s' % self.msg
- 
+        return self._parsefields() == self.PARSED
+
+    def tryparse(self):
+        '''
+        Parses the GPSString like parse(), but returns a status code rather 
+        than raising an exception when the string is not recognized, fails 
+        its checksum or cannot be parsed. This avoids the cost of exception 
+        handling for each bad line in noisy logs.
+
+        @return: One of GPSString.PARSED, GPSString.FAILED_CHECKSUM,
+        GPSString.FAILED_PARSING, GPSString.UNRECOGNIZED or 
+        GPSString.FILTERED.
+        '''
+        if not self.checksum(True):
+            return self.FAILED_CHECKSUM
+
+        if self.id == None:
+            try:
+                self.identify()
+            except NotImplementedError:
+                return self.UNRECOGNIZED
+
+        try:
+            return self._parsefields()
+        except (self.FailedParsing, dec.InvalidOperation, 
+                ValueError, IndexError):
+            return self.FAILED_PARSING
+
+    def _parsefields(self):
+        '''
+        Parses the fields of an identified string whose checksum has already
+        been verified. See parse().
+
+        @return: GPSString.PARSED, or GPSString.FILTERED when the string is
+        rejected by GPSString.filter.
+        '''
+        schema = SENTENCES[self.id]
+        m = schema.regex.search(self.msg)
+        if not m:
+            raise self.FailedParsing, 'Failed to parse %s' % self.msg
+        fields = m.group('match').split(',')
+        if self.filter is not None and \
+                not self.filter.accept(self.id, fields, getattr(self, 'date', None)):
+            return self.FILTERED
+        schema.convert(self, fields)
 
-        elif self.id == 'RMC':
-            'RMC' 
-            exp = '(?P<match>\$..RMC.*)\*(?P<chksum>..)'
-            m = re.search(exp,self.msg)
-            if m:
-                gps_extract = m.group('match')
-                fields = gps_extract.split(',')
-                'Handle RMC Fields'
-                'Getting the date first ensure handlegpstime will return a full'
-                'datetime object'      
-                try:
-                    self.datetime = datetime.date(int(fields[9][4:6])+2000,
-                                                  int(fields[9][2:4]),
-                                                  int(fields[9][0:2]))
-                    self.handlegpstime(fields[1])
-                    if fields[2] == 'A':
-                        self.fixstatus = 1
-                    else:
-                        self.fixstatus = 0
-                    self.handle_lat(fields[3], fields[4])
-                    self.handle_lon(fields[5], fields[6])
-                    self.knots = fields[7]
-                    self.cog = fields[8]
-                    self.magneticvariation = fields[10]
-                    if fields[11] == 'W':
-                        self.magneticvariation = '-'+ self.magneticvariation
-                except:
-                    raise self.FailedParsing, 'Failed to parse %s' % self.msg
-            else:
-                raise self.FailedParsing, 'Failed to parse %s' % self.msg
- 
-        elif self.id == 'GST':
-            'GST'
-            exp = '(?P<match>\$..GST.*)\*(?P<chksum>..)'
-            m = re.search(exp,self.msg)
-            if m:
-                gps_extract = m.group('match')
-                fields = gps_extract.split(',')
-                'Handle GST Fields'
-                self.handlegpstime(fields[1])
-                self.residualrms = dec.Decimal(fields[2])
-                self.semimajor = dec.Decimal(fields[3])
-                self.semiminor = dec.Decimal(fields[4])
-                self.orientation = dec.Decimal(fields[5])
-                self.lat1sigma = dec.Decimal(fields[6])
-                self.lon1sigma = dec.Decimal(fields[7])
-                self.height1sigma = dec.Decimal(fields[8])
-            else:
-                raise self.FailedParsing, 'Failed to parse %s' % self.msg
- 
-        elif self.id == 'GSV':
-            'GSV'
-            exp = '(?P<match>\$..GSV.*)\*(?P<chksum>..)'
-            m = re.search(exp,self.msg)
-            if m:
-                gps_extract = m.group('match')
-                fields = gps_extract.split(',')
-                'Handle GSV Fields'
-                self.messages = dec.Decimal( fields[1] )
-                self.messagenum = dec.Decimal ( fields[2] )
-                self.visibleSVs = dec.Decimal ( fields[3] )
-                self.PRN = []
-                self.elevation = []
-                self.azimuth = []
-                self.snr = []
-                if self.debug: 
-                    eprint(fields)
-                for idx in range(4,fields.__len__() - 1, 4):
-                    self.PRN.append(dec.Decimal(fields[idx]))
-                    self.elevation.append(dec.Decimal(fields[idx + 1]))
-                    try:
-                        self.azimuth.append(dec.Decimal(fields[idx + 2]))
-                    except dec.InvalidOperation:
-                        self.azimuth.append(dec.Decimal('NaN'))
-                        eprint("The field Satellite Azimuth may be missing.")
-                        eprint(fields[idx + 3])
-                    try:
-                        self.snr.append(dec.Decimal(fields[idx + 3]))
-                    except dec.InvalidOperation:
-                        # The spec says snr should be null when "not tracking"
-                        self.snr.append(dec.Decimal('NaN'))
-            else:
-                raise self.FailedParsing, 'Failed to parse %s' % self.msg
- 
-        elif self.id == 'VTG':
-            'VTG'
-            exp = '(?P<match>\$..VTG.*)\*(?P<chksum>..)'
-            m = re.search(exp,self.msg)
-            if m:
-                gps_extract = m.group('match')
-                fields = gps_extract.split(',')
-                'Handle VTG Fields'
-                self.cog = dec.Decimal(fields[1])
-                self.knots = dec.Decimal(fields[5])
-                self.kmph = dec.Decimal(fields[7])
-            else:
-                raise self.FailedParsing, 'Failed to parse %s' % self.msg
-                
-
-        elif self.id == 'HDT':
-            'HDT'
-            exp = '(?P<match>\$..HDT.*)\*(?P<chksum>..)'
-            m = re.search(exp,self.msg)
-            if m:
-                gps_extract = m.group('match')
-                fields = gps_extract.split(',')
-                'Handle HDT Fields'
-                self.heading = fields[1]
-            else:
-                raise self.FailedParsing, 'Failed to parse %s' % self.msg
-                 
-                
-        elif self.id == 'PASHR':
-            'PASHR'
-            exp = '(?P<match>\$PASHR.*)\*(?P<chksum>..)'
-            m = re.search(exp,self.msg)
-            if m:
-                gps_extract = m.group('match')
-                fields = gps_extract.split(',')
-                'Handle PASHR Fields'
-                self.handlegpstime(fields[1])
-                self.heading = dec.Decimal(fields[2])
-                self.roll = dec.Decimal(fields[4])
-                self.pitch = dec.Decimal(fields[5])
-                self.heave = dec.Decimal(fields[6])
-                self.rollaccuracy = dec.Decimal(fields[7])
-                self.pitchaccuracy = dec.Decimal(fields[8])
-                self.headingaccuracy = dec.Decimal(fields[9])
-                self.headingalgorithm = dec.Decimal(fields[10])
-                self.imustatus = dec.Decimal(fields[11])
-            else:
-                raise self.FailedParsing, 'Failed to parse %s' % self.msg
- 
-        elif self.id == 'GGK':
-            'GGK'
-            exp = '(?P<match>\GGK.*)\*(?P<chksum>..)'
-            m = re.search(exp,self.msg)
-            if m:
-                gps_extract = m.group('match')
-                fields = gps_extract.split(',')
-                'Handle GGK Fields'
-                print(fields[2])
-                print(fields[2][4:6])
-                self.date = datetime.date(int(fields[2][4:6])+2000,
-                                          int(fields[2][0:2]),
-                                          int(fields[2][2:4]))
-                self.handlegpstime(fields[1])
-                self.handle_lat(fields[3],fields[4])
-                self.handle_lon(fields[5],fields[6])
-                self.quality = dec.Decimal(fields[7])
-                self.svs = dec.Decimal(fields[8])
-                self.dop = dec.Decimal(fields[9])
-                self.eht = dec.Decimal(fields[10][3:fields[10].__len__()])
-            else:
-                raise self.FailedParsing, 'Failed to parse %s' % self.msg
-               
         # Create a dictionary of the fields parsed.
         keys = self.__dict__.keys()
         keys.remove('debug')
         keys.remove('msg')
         keys.remove('id')
+        if 'filter' in keys:
+            keys.remove('filter')
         self.fields = {}
         for item in keys:
-            self.fields[item] = self.__getattribute__(item)
+            value = self.__getattribute__(item)
+            # Skip methods wrapped on the instance (see stages.RunStats.instrument)
+            if not callable(value):
+                self.fields[item] = value
+        return self.PARSED
 
     def handlegpstime(self, timestr):
         '''
@@ -440,14 +266,9 @@ class GPSString(object):
         '''
         tmptime = timestr
         hour = dec.Decimal(tmptime[0:2])
-        try:
-            minute = dec.Decimal(tmptime[2:4])
-        except dec.InvalidOperation:
-            print(timestr)
-            print(tmptime[2:4])
-            print(self.msg)
-            sys.exit()
-            
+        # Malformed fields raise dec.InvalidOperation or ValueError, which
+        # tryparse() returns as FAILED_PARSING.
+        minute = dec.Decimal(tmptime[2:4])
         seconds = int(dec.Decimal(tmptime[4:tmptime.__len__()]))
         microseconds = int( (dec.Decimal(tmptime[4:tmptime.__len__()]) - \
                                  dec.Decimal(seconds) ) * 1000000 )
@@ -458,6 +279,7 @@ class GPSString(object):
             self.datetime = datetime.datetime.combine(self.date, timeval)
         except:
             self.datetime = timeval
+        return self.datetime
 
     def handle_lat(self,lattmp, lathem):
         '''
@@ -473,6 +295,7 @@ class GPSString(object):
         self.latitude = dec.Decimal(self.latitude)
         if lathem == 'S':
             self.latitude = - self.latitude
+        return self.latitude
 
     def handle_lon(self,lontmp, lonhem):
         '''
@@ -487,6 +310,7 @@ class GPSString(object):
         self.longitude = dec.Decimal(self.longitude)
         if lonhem == 'W':
             self.longitude = - self.longitude
+        return self.longitude
 
     def stripisotime(self):
         '''
@@ -498,60 +322,29 @@ class GPSString(object):
         ISO 8601 format, this method will extract and parse them, returning a
         datetime object. 
         '''
-
-        # FIX: Should append .* + self.id to this regexp. 
-        iso_exp = re.compile('(?P<year>\d\d\d\d)-(?P<month>\d\d)-(?P<day>\d\d)T(?P<hour>\d\\d):(?P<minute>\d\d):(?P<seconds>\d\d\.\d+)') 
-        m = re.search(iso_exp,self.msg)
-        if m:
-            year =  int( m.group('year'))
-            month = int( m.group('month'))
-            day =   int( m.group('day'))
-            hour =  int(m.group('hour'))
-            minute = int(m.group('minute'))
-            seconds = int(float(m.group('seconds')))
-            microseconds = int( ( float(m.group('seconds')) - seconds ) * 1000000)
-            dts = datetime.datetime(year, month, day, hour, minute, seconds, microseconds)
-            return dts
+        return timestamps.stripisotime(self.msg)
 
     def stripepochtime(self):
         '''
         Strips an EPOCH time stamp from the GPSString and returns a datetime 
         object
         '''
-        epoch_exp = re.compile('(?P<epochtime>\d+\.\d+).*\$??' + self.id)
-        m = re.search(epoch_exp,self.msg)
-        if m:
-            epochtime = float(m.group('epochtime'))
-            dts = datetime.datetime.utcfromtimestamp(epochtime)
-            return dts
+        return timestamps.stripepochtime(self.msg, self.id)
 
     def strip_timestamp(self):
         '''
         Strips a time stamp in if possible using datutils
         '''
-        date_exp = re.compile('\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d?\.?\d+')
-        m = re.search(date_exp,self.msg)
-        if m:
-            dts = dateutil.parser.parse(m.group())
-            return dts
+        return timestamps.strip_timestamp(self.msg)
 
     def datetimevec(self,dts):
         '''
         Converts a datetime stamp in the form of a datetime object to a
-        tab-delimited vector of numeric values.
+        tab-delimited vector of numeric values. See timestamps.datetimevec().
 
         @param dts: A datetime object.
-
-        For many scientific applications one often desires to import data into MATLAB
-        or Octave. A simple way to do that is to produce a tab-delimited date time 
-        stamp of the form:
-
-        YYYY    MH    DD    HR    MN    SS
-
-        whiich can be converted to MATLABs internal representation of time with 
-        datevec(). This method returns such as time stamp from a datetime object.
         '''
-        return "\t".join(map(str,( dts.year, dts.month, dts.day, dts.hour, dts.minute, float(dts.second) + float(dts.microsecond) / 1000000 )))
+        return timestamps.datetimevec(dts)
 
     def checksum(self, verify = False):
         ''' 
@@ -605,591 +398,631 @@ class GPSString(object):
         '''
 
 
-
 ######################################################################################
-######################## Module Code Ends Here. ######################################
+# Sentence schemas
 ######################################################################################
 
-if __name__ == '__main__':
+REQUIRED = None
+'Missing-value policy for fields that must be present. A missing or invalid value fails the parse.'
+NAN = dec.Decimal('NaN')
+'Missing-value policy for numeric fields that may be empty.'
+
+# How each kind of field is converted, as a Python expression. {value} is
+# replaced with the field itself, and {next} and {next2} with the fields that
+# follow it (e.g. the hemisphere of a latitude).
+FIELD_KINDS = {
+    'decimal' : 'Decimal({value})',
+    'string'  : '{value}',
+    'time'    : 'self.handlegpstime({value})',
+    'lat'     : 'self.handle_lat({value}, {next})',
+    'lon'     : 'self.handle_lon({value}, {next})',
+    'status'  : '1 if {value} == "A" else 0',
+    'signed'  : '-Decimal({value}) if {next} == "W" else Decimal({value})',
+    'eht'     : 'Decimal({value}[3:])',
+    'ddmmyy'  : 'date(int({value}[4:6]) + 2000, int({value}[2:4]), int({value}[0:2]))',
+    'mmddyy'  : 'date(int({value}[4:6]) + 2000, int({value}[0:2]), int({value}[2:4]))',
+    'dd,mm,yyyy' : 'date(int({next2}), int({next}), int({value}))',
+    }
+
+# The same for converters returning records (see Parser), whose times are
+# dated with the date passed in or parsed from the sentence.
+RECORD_KINDS = dict(FIELD_KINDS, time='self.handlegpstime({value}, v_date)')
+
+# The same for records with numeric times (see Parser), whose dates are
+# days since 1970-01-01 and times are converted from them without
+# creating date or datetime objects.
+NUMERIC_RECORD_KINDS = dict(RECORD_KINDS, **{
+    'time'    : 'self.numerictime({value}, v_date)',
+    'ddmmyy'  : 'days(int({value}[4:6]) + 2000, int({value}[2:4]), int({value}[0:2]))',
+    'mmddyy'  : 'days(int({value}[4:6]) + 2000, int({value}[0:2]), int({value}[2:4]))',
+    'dd,mm,yyyy' : 'days(int({next2}), int({next}), int({value}))',
+    })
+
+class SentenceSchema(object):
+    '''
+    A declarative description of a NMEA sentence type, compiled once into a
+    converter function that sets the parsed fields as attributes of a
+    GPSString.
+
+    Each field is described by a tuple of (index, name, kind, missing), where
+    index is the position of the field in the comma delimited sentence, name
+    is the GPSString attribute to set, kind is one of the keys of FIELD_KINDS
+    and missing is the value to use when the field is empty or absent (or
+    REQUIRED when it must be present). Fields are converted in the order
+    given, so a date must come before the time it qualifies.
+
+    Sentences with a variable number of repeated fields (i.e. GSV) may also
+    give a group of (offset, name, kind, missing) tuples, which are parsed
+    into lists, starting at index groupstart.
+    '''
 
-    gpstmp = GPSString('')
-    supportedstrings = gpstmp.GPS_IDs.keys()
-    supportedstrings.sort()
-    supportedstrings = ' '.join(supportedstrings)
-
-    ''' Handle options'''
-    import argparse
-    parser = argparse.ArgumentParser(description=("Parse GPS NMEA0183 ASCII "
-    "text data file(s), to one of: "
-    "1) stdout (default) "
-    "2) a file of the same as the input filename appended with 'parsed_STR.txt' "
-    "3) a user specified filename "
-    "4) a MATLAB compatible .mat file. (not yet supported)"))
-    
-    group = parser.add_mutually_exclusive_group()
-    group.add_argument('-f','--filename', dest='filename',action='store',
-                            help='specify the filename, default stdin', default=sys.stdin)
-    group.add_argument('-g','--directory', dest='directory',action='store',
-                            help=('alternatively, specify a directory and a suffix '
-                            'pattern (e.g. /path/::.gps). The directory will be '
-                            'searched recursively and files matching the suffix '
-                            'specified after :: will be parsed. The output will '
-                            ' go to separate output files if -o <directory> or '
-                            ' -o i is specified.' ), 
-                            default="") 
-    parser.add_argument('-s','--stringtype',dest='stringtype',action='store',
-                           help=('specify which string to parse by specifying '
-                           'the three-letter identifier (Currently supported '
-                           'strings: '+ supportedstrings + ')'))
-    parser.add_argument('-o', dest='output',action='store',
-                        default=None,
-                       help=('A directory or filename. If a directory, output' 
-                       'data to a file within the specified directory having '
-                       'a file name of directory/<inputfilename>_STR_parsed.txt)'
-                       ' where STR is the specified string to parse. If a file' 
-                       ' name, output to that explicit file. If -o is omitted,'
-                       ' data is written to stdout.'))
-    parser.add_argument('-m',dest='matflag',action='store_true',
-                        help='Write the output file in MATLAB .mat format. (NOT YET SUPPORTED)',
-                        default=False)
-    parser.add_argument('-v',dest='verbose',action='count',
-                         help='Verbose output. (-v, -vv, -vvv, etc.)')
-            
-    args = parser.parse_args()
-    
-    filename = args.filename
-    directory = args.directory
-    stringtype = args.stringtype
-    verbose = args.verbose
-    output = args.output
-    matflag = args.matflag
-
-            
-    if verbose >= 1:
-        print("Arguments:")
-        arguments = vars(args)
-        for key, value in arguments.iteritems():
-            print("\t%s:\t\t%s" % (key,str(value)))
-
-    if directory:       
-        filestoprocess = []     
-        directory, suffix = directory.split('::')
-        if verbose >= 3:
-            print("directory: " + directory)
-            print("suffix:    " + suffix)
-        for root,subFolders, files in os.walk(directory):
-            for fileval in files:
-                if fileval[-suffix.__len__():] == suffix:
-                    filestoprocess.append(os.path.join(root,fileval))
-    else:
-        filestoprocess = [filename]
-
-    if filestoprocess.__len__() == 0:
-        print("No files found to process.")
-        sys.exit()
-
-    # Conditions are:
-    # 1) No -o is specified, write to std out.
-    # 2) -o is specified with a directory, write default file name to directory.
-    # 3) -o is specified with a filename. Write to the filename. 
-    outputtofile = False
-    outfilename = None 
-    saveto1file = False
-    # If we specified some kind of output, set it up (otherwise stdout is default)
-    if output:
-        outputtofile = True
-        # We can specify a directory. If so, set it as the output dir. 
-        if os.path.isdir(output):
-            outputdir = output  # outfilename will get set dyamamically based on input file name.
-            if verbose >=1:
-                print("Output directory: " + outputdir)
-                print("Output filename: Not specified")
-
-        # Or we can set a file name directly. Then set everything.
-        # Two things could have happened here. Either the directory did not 
-        # exist, or a filename was specified with it. Here we check to see that 
-        # the directory exists, and if so, we assume that anything further is 
-        # the requested filename. 
-        elif os.path.isdir(os.path.dirname(output)):
-            saveto1file = True
-            outputdir = os.path.dirname(output)
-            outfilename = os.path.basename(output)
-            if verbose >= 1:
-                print("Outputfilename: " + os.path.join(outputdir,outfilename))
-                
-        # Or quicklly specify the output directory as the input directory with an 'i'
-        elif output == 'i':
-            if directory:
-                outputdir = directory
-            else:
-                outputdir = os.path.dirname(filename)
+    def __init__(self, stringtype, fields, output, pattern=None,
+                 group=None, groupstart=None):
+        '''
+        @param stringtype: The sentence identifier (i.e. 'GGA').
+        @param fields: A sequence of (index, name, kind, missing) tuples.
+        @param output: The attribute names written by the command-line
+        parser, in order. 'datetime' is written as a date-time vector.
+        @param pattern: A regular expression matching the start of the
+        sentence. Field indices are counted from here. Defaults to
+        '\$..' + stringtype.
+        @param group: A sequence of (offset, name, kind, missing) tuples
+        describing a group of fields that repeats to the end of the sentence.
+        @param groupstart: The index of the first repeated group.
+        '''
+        self.stringtype = stringtype
+        self.fields = tuple(fields)
+        self.output = tuple(output)
+        self.group = tuple(group or ())
+        self.groupstart = groupstart
+        if pattern is None:
+            pattern = '\$..' + stringtype
+        self.pattern = pattern
+        self._recordconverters = {}
+
+    def __getattr__(self, name):
+        # The regular expression and converter are compiled on first use,
+        # which keeps importing gpsparser fast.
+        if name in ('regex', 'source', 'convert'):
+            self._compile()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def _compile(self):
+        ''' Compiles the regular expression and converter.'''
+        self.regex = re.compile('(?P<match>' + self.pattern + '.*)\*(?P<chksum>..)')
+        self.source = self._generate()
+        'The Python source of the compiled converter.'
+        namespace = {'Decimal' : dec.Decimal, 'date' : datetime.date}
+        for idx, item in enumerate(self.fields + self.group):
+            namespace['missing%d' % idx] = item[3]
+        exec(compile(self.source, '<%s schema>' % self.stringtype, 'exec'),
+             namespace)
+        self.convert = namespace['convert']
+        'The converter, called as convert(gps, fields).'
+
+    def _generate(self, record=False, kinds=None):
+        '''
+        Returns the source code of the converter function, or when record
+        is True, of a converter returning the output fields as a tuple (see
+        recordconverter()). kinds replaces RECORD_KINDS.
+        '''
+        if record:
+            lines = ['def convert(self, f, v_date):']
         else:
-            eprint("The argument to -g is not 'i', a valid directory or a valid/filename")
-            sys.exit()
-            
-    if matflag:
+            lines = ['def convert(self, f):']
+        lines.append('    n = len(f)')
+        target = 'v_%s' if record else 'self.%s'
+        for idx, (index, name, kind, missing) in enumerate(self.fields):
+            lines.extend(self._statement(idx, target % name, kind, missing,
+                                         '', index, '    ', False, record,
+                                         kinds))
+        if self.group:
+            for offset, name, kind, missing in self.group:
+                lines.append('    %s = []' % (target % name))
+            lines.append('    for i in range(%d, n - 1, %d):' %
+                         (self.groupstart, len(self.group)))
+            for idx, (offset, name, kind, missing) in enumerate(self.group):
+                lines.extend(self._statement(idx + len(self.fields),
+                                             target % name, kind, missing,
+                                             'i + ', offset, '        ', True,
+                                             record, kinds))
+        if record:
+            lines.append('    return (%s,)' %
+                         ', '.join('v_' + name for name in self.output))
+        return '\n'.join(lines) + '\n'
+
+    def _statement(self, idx, target, kind, missing, base, index, indent,
+                   append, record=False, kinds=None):
+        ''' Returns the lines of code converting a single field.'''
+        ref = 'f[%s%d]'
+        if kinds is None:
+            kinds = RECORD_KINDS if record else FIELD_KINDS
+        expression = kinds[kind].format(value=ref % (base, index),
+                                        next=ref % (base, index + 1),
+                                        next2=ref % (base, index + 2))
+        if append:
+            assign = '%s.append(%%s)' % target
+        else:
+            assign = '%s = %%s' % target
+        if missing is REQUIRED:
+            return [indent + assign % expression]
+        return [indent + 'if n > %s%d and %s:' % (base, index, ref % (base, index)),
+                indent + '    ' + assign % expression,
+                indent + 'else:',
+                indent + '    ' + assign % ('missing%d' % idx)]
+
+    def recordconverter(self, numeric='decimal', numerictimes=False):
+        '''
+        Returns a converter, called as convert(parser, fields, date), that
+        returns the output fields of a sentence as a tuple rather than
+        setting attributes (see Parser).
+
+        @param numeric: 'decimal' to convert numeric fields to Decimal, or
+        'float' to convert them to float.
+        @param numerictimes: Convert times with parser.numerictime(), given
+        dates as days since 1970-01-01, rather than to datetime objects.
+        '''
         try:
-            import scipy as sci
-            import scipy.io as sio
-        except:
-            print("Output to MATLAB file format requires the scipy module.")
-            sys.exit()
-                
-    if not GPSString.GPS_IDs.has_key(stringtype):
-        print ('Unsupported string type: ' + str(stringtype))
-        sys.exit()
-            
-        
-    def assign_fieldnames(stringtype):
-        ''' A function to assing fieldnames when writing MATLAB structures.'''
-        
-        switcher = {
-                    "GGA":['pctime',
-                           'gpstime',
-                           'latitude',
-                           'longitude',
-                           'quality',
-                           'svs',
-                           'hdop',
-                           'antennaheight',
-                           'geoid'],
-                    "ZDA":['pctime',
-                           'gpstime'],
-                    "RMC":['pctime',
-                           'gpstime',
-                           'fixstatus',
-                           'latitude',
-                           'longitude',
-                           'knots',
-                           'cog',
-                           'magneticvariation'],
-                    "GST":['pctime',
-                           'gpstime',
-                           'residualrms',
-                           'semimajor',
-                           'semiminor',
-                           'orientation',
-                           'lat1sigma',
-                           'lon1sigma',
-                           'height1sigma'],
-                    "GSV":['pctime',
-                           'PRN',
-                           'elevation',
-                           'azimuth',
-                           'snr'],
-                    "VTG":['pctime',
-                           'cog',
-                           'knots',
-                           'kmph'],
-                    "HDT":['pctime',
-                           'heading'],
-                    "PASHR": ['pctime',
-                              'gpstime',
-                              'heading',
-                              'roll',
-                              'pitch',
-                              'heave',
-                              'rollaccuracy',
-                              'headingaccuracy',
-                              'headingalgorithm',
-                              'imustatus'],
-                    "GGK":['pctime',
-                           'gpstime',
-                           'latitude',
-                           'longitude',
-                           'quality',
-                           'svs',
-                           'dop',
-                           'eht']
-        }
-        
-        return switcher.get(stringtype,"")
-        
-
-    def printfields(fieldstoprint,fid=None):
-        ''' A function to print the fields under different circumstances.'''
-        if fid:
-            fid.write("\t".join(map(str,fieldstoprint)).expandtabs() + '\n')
+            return self._recordconverters[numeric, numerictimes]
+        except KeyError:
+            pass
+        if numeric == 'float':
+            number = float
         else:
-            print("\t".join(map(str,fieldstoprint)).expandtabs())
+            number = dec.Decimal
+        namespace = {'Decimal' : number, 'date' : datetime.date,
+                     'days' : timestamps.epochday}
+        for idx, item in enumerate(self.fields + self.group):
+            missing = item[3]
+            if isinstance(missing, dec.Decimal) and numeric == 'float':
+                missing = float(missing)
+            namespace['missing%d' % idx] = missing
+        source = self._generate(record=True,
+                                kinds=NUMERIC_RECORD_KINDS if numerictimes else None)
+        exec(compile(source, '<%s record>' % self.stringtype, 'exec'),
+             namespace)
+        self._recordconverters[numeric, numerictimes] = namespace['convert']
+        return namespace['convert']
+
+SENTENCES = OrderedDict()
+'The registry of supported sentence types, keyed by identifier.'
+
+def register_sentence(schema):
+    '''
+    Adds a SentenceSchema to the registry of supported sentences, making it
+    available to GPSString.identify() and GPSString.parse().
+    '''
+    SENTENCES[schema.stringtype] = schema
+    GPSString.GPS_IDs.setdefault(schema.stringtype, len(GPSString.GPS_IDs) + 1)
+
+for _schema in [
+    SentenceSchema('GGA',
+        [(1, 'datetime', 'time', REQUIRED),
+         (2, 'latitude', 'lat', NAN),
+         (4, 'longitude', 'lon', NAN),
+         (6, 'quality', 'decimal', REQUIRED),
+         (7, 'svs', 'decimal', REQUIRED),
+         (8, 'hdop', 'decimal', REQUIRED),
+         (9, 'antennaheight', 'decimal', NAN),
+         (11, 'geoid', 'decimal', NAN),
+         (13, 'dgpsage', 'decimal', NAN),
+         (14, 'stationid', 'decimal', NAN)],
+        output=['datetime', 'latitude', 'longitude', 'quality', 'svs',
+                'hdop', 'antennaheight', 'geoid']),
+    SentenceSchema('ZDA',
+        [(2, 'date', 'dd,mm,yyyy', REQUIRED),
+         (1, 'datetime', 'time', REQUIRED),
+         (5, 'tzoffsethours', 'decimal', NAN),
+         (6, 'tzoffsetminutes', 'decimal', NAN)],
+        output=['datetime']),
+    SentenceSchema('RMC',
+        [(9, 'date', 'ddmmyy', REQUIRED),
+         (1, 'datetime', 'time', REQUIRED),
+         (2, 'fixstatus', 'status', REQUIRED),
+         (3, 'latitude', 'lat', NAN),
+         (5, 'longitude', 'lon', NAN),
+         (7, 'knots', 'decimal', NAN),
+         (8, 'cog', 'decimal', NAN),
+         (10, 'magneticvariation', 'signed', NAN)],
+        output=['datetime', 'fixstatus', 'latitude', 'longitude', 'knots',
+                'cog', 'magneticvariation']),
+    SentenceSchema('GST',
+        [(1, 'datetime', 'time', REQUIRED),
+         (2, 'residualrms', 'decimal', NAN),
+         (3, 'semimajor', 'decimal', NAN),
+         (4, 'semiminor', 'decimal', NAN),
+         (5, 'orientation', 'decimal', NAN),
+         (6, 'lat1sigma', 'decimal', NAN),
+         (7, 'lon1sigma', 'decimal', NAN),
+         (8, 'height1sigma', 'decimal', NAN)],
+        output=['datetime', 'residualrms', 'semimajor', 'semiminor',
+                'orientation', 'lat1sigma', 'lon1sigma', 'height1sigma']),
+    SentenceSchema('GSV',
+        [(1, 'messages', 'decimal', REQUIRED),
+         (2, 'messagenum', 'decimal', REQUIRED),
+         (3, 'visibleSVs', 'decimal', REQUIRED)],
+        group=[(0, 'PRN', 'decimal', REQUIRED),
+               (1, 'elevation', 'decimal', REQUIRED),
+               (2, 'azimuth', 'decimal', NAN),
+               (3, 'snr', 'decimal', NAN)],
+        groupstart=4,
+        output=['PRN', 'elevation', 'azimuth', 'snr']),
+    SentenceSchema('VTG',
+        [(1, 'cog', 'decimal', REQUIRED),
+         (5, 'knots', 'decimal', REQUIRED),
+         (7, 'kmph', 'decimal', REQUIRED)],
+        output=['cog', 'knots', 'kmph']),
+    SentenceSchema('HDT',
+        [(1, 'heading', 'decimal', NAN)],
+        output=['heading']),
+    SentenceSchema('PASHR',
+        [(1, 'datetime', 'time', REQUIRED),
+         (2, 'heading', 'decimal', REQUIRED),
+         (4, 'roll', 'decimal', REQUIRED),
+         (5, 'pitch', 'decimal', REQUIRED),
+         (6, 'heave', 'decimal', REQUIRED),
+         (7, 'rollaccuracy', 'decimal', REQUIRED),
+         (8, 'pitchaccuracy', 'decimal', REQUIRED),
+         (9, 'headingaccuracy', 'decimal', REQUIRED),
+         (10, 'headingalgorithm', 'decimal', REQUIRED),
+         (11, 'imustatus', 'decimal', REQUIRED)],
+        pattern='\$PASHR',
+        output=['datetime', 'heading', 'roll', 'pitch', 'heave',
+                'rollaccuracy', 'headingaccuracy', 'headingalgorithm',
+                'imustatus']),
+    SentenceSchema('GGK',
+        [(2, 'date', 'mmddyy', REQUIRED),
+         (1, 'datetime', 'time', REQUIRED),
+         (3, 'latitude', 'lat', NAN),
+         (5, 'longitude', 'lon', NAN),
+         (7, 'quality', 'decimal', REQUIRED),
+         (8, 'svs', 'decimal', REQUIRED),
+         (9, 'dop', 'decimal', REQUIRED),
+         (10, 'eht', 'eht', NAN)],
+        pattern='GGK',
+        output=['datetime', 'latitude', 'longitude', 'quality', 'svs',
+                'dop', 'eht']),
+    SentenceSchema('GLL',
+        [(5, 'datetime', 'time', REQUIRED),
+         (1, 'latitude', 'lat', NAN),
+         (3, 'longitude', 'lon', NAN),
+         (6, 'fixstatus', 'status', REQUIRED),
+         (7, 'mode', 'string', '')],
+        output=['datetime', 'fixstatus', 'latitude', 'longitude']),
+    SentenceSchema('PAT',
+        [(1, 'datetime', 'time', REQUIRED),
+         (2, 'latitude', 'lat', NAN),
+         (4, 'longitude', 'lon', NAN),
+         (6, 'altitude', 'decimal', NAN),
+         (7, 'heading', 'decimal', NAN),
+         (8, 'pitch', 'decimal', NAN),
+         (9, 'roll', 'decimal', NAN),
+         (10, 'mrms', 'decimal', NAN),
+         (11, 'brms', 'decimal', NAN),
+         (12, 'resetflag', 'decimal', NAN)],
+        output=['datetime', 'latitude', 'longitude', 'altitude', 'heading',
+                'pitch', 'roll', 'mrms', 'brms', 'resetflag']),
+    SentenceSchema('HDG',
+        [(1, 'heading', 'decimal', REQUIRED),
+         (2, 'deviation', 'signed', NAN),
+         (4, 'magneticvariation', 'signed', NAN)],
+        output=['heading', 'deviation', 'magneticvariation']),
+    SentenceSchema('GNS',
+        [(1, 'datetime', 'time', REQUIRED),
+         (2, 'latitude', 'lat', NAN),
+         (4, 'longitude', 'lon', NAN),
+         (6, 'mode', 'string', REQUIRED),
+         (7, 'svs', 'decimal', REQUIRED),
+         (8, 'hdop', 'decimal', NAN),
+         (9, 'antennaheight', 'decimal', NAN),
+         (10, 'geoid', 'decimal', NAN),
+         (11, 'dgpsage', 'decimal', NAN),
+         (12, 'stationid', 'decimal', NAN)],
+        output=['datetime', 'latitude', 'longitude', 'mode', 'svs', 'hdop',
+                'antennaheight', 'geoid']),
+    ]:
+    register_sentence(_schema)
 
-    matlabepochplus1yr = datetime.datetime(1,1,1,0,0,0) 
-    oneyr = timedelta(days=365)
-    def datetime2mat(dts):
-        ''' Converts a python datetime object to MATLAB serial time.
-        
-        MATLAB serial time is decimal days since Jan 1, 1900, 00:00:00'''
-        
-        # Note, these machinations are required because the datetime object does not 
-        # support year 0. 
-        global matlabepochplus1yr
-        global oneyr
-      
-        dt = dts-matlabepochplus1yr
-        return (dt.total_seconds()+oneyr.total_seconds())/86400
-        
 
-    # Set up data structures for saving to a MATLAB .mat file.
-    if matflag:
-        mat = {}
-        data={}
-        mat[stringtype] = data
-        
-        # Initialize space for saving data in numpy arrays. 
-        # We need to know the fields we intend to save before we begin reading data.
-        # and ideally the number of data points. Here we initalize 
-        # assuming a maximum 10Hz rate for 1 day. Is there a way to quickly 
-        # pre-read the file? Or do we have to check on every assignment and increase
-        # the size if necessary? Or do we leave it as a constraint. 
-        matfieldnames = assign_fieldnames(stringtype)
-        for key in matfieldnames:
-            data[key] = sci.zeroes((864000,1),'double')
-            data[key].fill(sci.nan)
-
-    if verbose >=3:
-        print("Entering debug mode")
-
-
-    #######################            
-    # PROCESS THE FILE(s) #
-    #######################
-    for filename in filestoprocess:
-
-            
-        # Gives status to stdout only when output is not stdout.
-        if verbose >=1 and outputtofile:
-            print('Processing ' + filename)
-        if filename != sys.stdin:
-            filetoread = file(filename,'r')
+######################################################################################
+# Parser
+######################################################################################
+
+_recordtypes = {}
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+class Parser(object):
+    '''
+    A long-lived parser of logged lines, for parsing many lines without
+    creating a GPSString for each.
+
+    A Parser holds everything compiled once for a run: the ordered table
+    of sentence identifiers and their record converters, the compiled
+    logger time stamp expressions, the date given to strings that carry
+    none and the numeric mode. parse() returns each line's fields as a
+    compact record, a namedtuple of the logger time ('pctime', None if the
+    line has none) followed by the string type's output fields (see
+    SentenceSchema). Nothing from one line is kept for the next.
+
+    Times (the logger time and the GPS time) are datetime objects by
+    default. They may instead be numbers (times='epoch', 'datenum' or
+    'gpsweek'), computed directly from the raw date and time fields and
+    logger time stamp, so that no date or datetime objects are created
+    (except for logger time stamps in formats other than ISO 8601 and
+    epoch, and the date given to filters).
+
+    A Parser is not thread safe; use one per thread.
+    '''
+    NUMERIC = ('decimal', 'float')
+    TIMES = OrderedDict([('datetime', None),
+                         ('epoch', float),
+                         ('datenum', timestamps.epoch2datenum),
+                         ('gpsweek', timestamps.epoch2gpsweek)])
+    'The formats of times, and the conversions to them from epoch seconds.'
+    _checksum_exp = re.compile('(?P<match>\$.*)\*(?P<chksum>..)')
+
+    def __init__(self, stringtypes=None, date=None, numeric='decimal',
+                 filter=None, times='datetime'):
+        '''
+        @param stringtypes: The string types to parse (i.e. ['GGA']), or
+        None to parse all supported types.
+        @param date: The date given to strings without one when the line
+        has no logger time stamp. Defaults to today's (UTC) date.
+        @param numeric: 'decimal' to parse numeric fields as Decimal, as
+        GPSString does, or 'float' to parse them as floats, which is faster.
+        @param filter: A stages.Filter (or Decimator or Deduplicator)
+        applied to the raw fields, as with GPSString.filter.
+        @param times: The format of times: 'datetime' for datetime objects,
+        'epoch' for seconds since 1970-01-01, 'datenum' for MATLAB serial
+        time or 'gpsweek' for tuples of GPS week and seconds of the week.
+        '''
+        if numeric not in self.NUMERIC:
+            raise ValueError('Unsupported numeric mode: %s' % numeric)
+        if times not in self.TIMES:
+            raise ValueError('Unsupported time format: %s' % times)
+        if stringtypes is not None:
+            for stringtype in stringtypes:
+                if stringtype not in SENTENCES:
+                    raise ValueError('Unsupported string type: %s' % stringtype)
+        self.stringtypes = stringtypes
+        self.numeric = numeric
+        self.filter = filter
+        self.date = date or datetime.datetime.utcnow().date()
+        self.times = times
+        self._fromepoch = self.TIMES[times]
+        self._day = timestamps.epochday(self.date.year, self.date.month,
+                                        self.date.day)
+        self._number = float if numeric == 'float' else dec.Decimal
+        self._schemas = dict((stringtype, (schema,
+                                           schema.recordconverter(
+                                               numeric, times != 'datetime'),
+                                           self.recordtype(stringtype)))
+                             for stringtype, schema in SENTENCES.items()
+                             if stringtypes is None or stringtype in stringtypes)
+
+    @staticmethod
+    def recordtype(stringtype):
+        ''' Returns the namedtuple class of records of a string type.'''
+        try:
+            return _recordtypes[stringtype]
+        except KeyError:
+            recordtype = namedtuple(stringtype + 'Record',
+                                    ('pctime',) + SENTENCES[stringtype].output)
+            _recordtypes[stringtype] = recordtype
+            return recordtype
+
+    def identify(self, line):
+        ''' Returns the string type of a line, or None if unsupported.'''
+        for key in SENTENCES:
+            if key in line:
+                return key
+        return None
+
+    def checksum(self, line):
+        ''' Returns True if the line's NMEA string has a valid checksum.'''
+        m = self._checksum_exp.search(line)
+        if not m:
+            return False
+        checksum = reduce(xor, map(ord, m.group('match')[1:]))
+        return '%02X' % checksum == m.group('chksum')
+
+    def stripisotime(self, line, stringtype):
+        ''' Returns the ISO 8601 logger time stamp of a line, or None.'''
+        return timestamps.stripisotime(line)
+
+    def stripepochtime(self, line, stringtype):
+        ''' Returns the epoch logger time stamp of a line, or None.'''
+        return timestamps.stripepochtime(line, stringtype)
+
+    def strip_timestamp(self, line, stringtype):
+        ''' Returns any other logger time stamp of a line, or None.'''
+        return timestamps.strip_timestamp(line)
+
+    def loggertime(self, line, stringtype):
+        '''
+        Returns the logger time stamp of a line as a datetime object, or
+        None, trying ISO 8601, epoch and then other formats.
+        '''
+        dts = self.stripisotime(line, stringtype)
+        if dts is None:
+            dts = self.stripepochtime(line, stringtype)
+        if dts is None:
+            dts = self.strip_timestamp(line, stringtype)
+        return dts
+
+    def handlegpstime(self, timestr, date):
+        '''
+        Converts a NMEA time string (HHMMSS.SSS) to a datetime.datetime
+        object on the given date, or a datetime.time if date is None.
+        '''
+        seconds, point, fraction = timestr[4:].partition('.')
+        timeval = datetime.time(int(timestr[0:2]), int(timestr[2:4]),
+                                int(seconds),
+                                int((fraction + '00000')[:6]) if fraction else 0)
+        if date is None:
+            return timeval
+        return datetime.datetime.combine(date, timeval)
+
+    def numerictime(self, timestr, day):
+        '''
+        Converts a NMEA time string (HHMMSS.SSS) on a day (days since
+        1970-01-01) to a number in the Parser's time format.
+        '''
+        return self._fromepoch(day * 86400 + int(timestr[0:2]) * 3600 +
+                               int(timestr[2:4]) * 60 + float(timestr[4:]))
+
+    def handle_lat(self, lattmp, lathem):
+        ''' Converts a NMEA latitude (DDMM.MMMM) to decimal degrees.'''
+        if self.numeric == 'float':
+            latitude = float(lattmp[0:2]) + float(lattmp[2:]) / 60
         else:
-            filetoread = filename
-        
-        # When FID is None we print to stdout, by default.
-        # But if we're saving to a file and we've explcity chosen it,
-        # Then the file may be open, in which case don't loose the fid.
-        if not saveto1file:
-            fid = None
-            
-        # Set up the output file name if output to a file is requested. 
-        # The output may be of txt or .mat type.
-        # By now the output directory (outputdir), is already specified.
-        if outputtofile or matflag:
-            if outfilename is not None:
-                pass
-            if outfilename == None and not matflag and filename == sys.stdin:
-                outfilename = ('data' +
-                '_parsed_'+ stringtype +'.txt')
-            if outfilename == None and not matflag:
-                outfilename = (os.path.basename(filename) +
-                '_parsed_'+ stringtype +'.txt')
-            elif outfilename == None and matflag:
-                outfilename = (os.path.basename(filename) +
-                '_parsed_'+ stringtype +'.mat')
-
-            if verbose >=1:
-                print("Writing to %s" % os.path.join(outputdir,outfilename))        
-
-        # If we are saving to a txt file, open the file. 
-        # If it is the first process in the list, always open it. 
-        # If not, then only open a new file if not saving to a single file,
-        # which would happen if the file name was explicitly set.
-        if outputtofile and not matflag: 
-            if filename == filestoprocess[0]:
-                fid = file(os.path.join(outputdir,outfilename),'w')
-            elif not saveto1file:
-                fid = file(os.path.join(outputdir,outfilename),'w')
-
-        # By setting outfilename to None here we force creation of a new 
-        # output file for every input file. Otherwise a file for the first one 
-        # is created and this over-written with subseqeunt ones. We could write 
-        # all to a single file, but there are reasons we may not want to do this too.
-        if not saveto1file:
-            outfilename = None        
-        
-        for line in filetoread:
-    
-            gps = GPSString(line)
-            if verbose >=3:
-                gps.debug = verbose
+            latitude = dec.Decimal('%.10f' % (dec.Decimal(lattmp[0:2]) +
+                                              dec.Decimal(lattmp[2:]) / 60))
+        return -latitude if lathem == 'S' else latitude
+
+    def handle_lon(self, lontmp, lonhem):
+        ''' Converts a NMEA longitude (DDDMM.MMMM) to decimal degrees.'''
+        if self.numeric == 'float':
+            longitude = float(lontmp[0:3]) + float(lontmp[3:]) / 60
+        else:
+            longitude = dec.Decimal('%.10f' % (dec.Decimal(lontmp[0:3]) +
+                                               dec.Decimal(lontmp[3:]) / 60))
+        return -longitude if lonhem == 'W' else longitude
 
-                
-            try:
-                gps.identify()  # populates gps.id
-                
-            except NotImplementedError:
-                if verbose >= 1:
-                    sys.stderr.write('Unrecognized NMEA string: %s\n' % gps.msg)
-                continue
-            except:
-                eprint("Unexpected error:", sys.exc_info()[0])
-                raise
-    
-            if gps.debug:
-                print('String Type: ' + gps.id)
-    
-            'Only handle string specified'
-            if gps.id != stringtype:
-                continue
-    
-            '''Since GPS NMEA strings have no date, we have to create one. If the
-            data is timestaped with an ISO format time, then use that. If not, 
-            use the system time.'''
-            
-            # This will die silently if there is not a pc timestamp or if it of unsupported type. 
-            PCtime = gps.stripisotime()
-            if PCtime == None:
-                PCtime = gps.stripepochtime()
-            if PCtime == None:
-                PCtime = gps.strip_timestamp()
-                
-            # Many GPS strings have only a time stamp with no date. Here we try to 
-            # use the date provided by a PC time stamp during the logging porcess.
-            # If there is no PC time stamp, one can only guess at the date and 
-            # assume it is today. 
-            
-            # FIX: Provide a way to force the date if it is known on the command 
-            # line. 
-            try:
-                gps.date = PCtime.date()
-            except:
-                if gps.debug:
-                    print("NO Time Stamping Found. Using today's date.")
-                gps.date = datetime.datetime.utcnow().date()
-            
-            ''' Parse and write data.'''
-            if gps.id == 'GGA':
-    
-                try: 
-                    gps.parse()
-                    if gps.debug:
-                        print("Fields: " + ','.join(gps.fields.keys()))
-                        
-                except gps.FailedChecksum:
-                    sys.stderr.write( "Failed Checksum: "
-                                      " :: " + gps.msg + '\n') 
-                    continue
-                except gps.FailedParsing:
-                    sys.stderr.write("Failed Parsing Line: %s" % line)
-                    continue
-                except dec.InvalidOperation:
-                    sys.stderr.write("Failed Parsing Line: %s" % line)
-                    continue
-                except:
-                    eprint("Unexpected error:", sys.exc_info()[0])
-                    raise
-                    
-                fieldstoprint = [gps.datetimevec(gps.datetime), 
-                                 gps.latitude, 
-                                 gps.longitude, 
-                                 gps.quality,
-                                 gps.svs, 
-                                 gps.hdop, 
-                                 gps.antennaheight,
-                                 gps.geoid]
-                if PCtime:
-                    fieldstoprint.insert(0,gps.datetimevec(PCtime))
-    
-                printfields(fieldstoprint,fid)
-                
-    
-            if gps.id == 'ZDA':
-    
-                try: 
-                    gps.parse()
-                except gps.FailedChecksum:
-                    sys.stderr.write( "Failed Checksum: " + gps.checksum() + 
-                                      " :: " + gps.msg + '\n') 
-                    continue
-                except gps.FailedParsing:
-                    sys.stderr.write("Failed Parsing Line: %s" % line)
-                    continue
-                except:
-                    eprint("Unexpected error:", sys.exc_info()[0])
-                    raise
-                    
-                fieldstoprint = [gps.datetimevec(gps.datetime)]
-    
-                if PCtime:
-                    fieldstoprint.insert(0,gps.datetimevec(PCtime))
-    
-                printfields(fieldstoprint,fid)
-    
-            if gps.id == 'RMC':
-    
-                try:
-                    gps.parse()
-                except gps.FailedChecksum:
-                    sys.stderr.write( "Failed Checksum: " + gps.checksum() + 
-                                      " :: " + gps.msg + '\n') 
-                    continue
-                except gps.FailedParsing:
-                    sys.stderr.write("Failed Parsing Line: %s" % line)
-                    continue
-                except:
-                    eprint("Unexpected error:", sys.exc_info()[0])
-                    raise
-                      
-                fieldstoprint = [gps.datetimevec(gps.datetime),
-                                 gps.fixstatus,
-                                 gps.latitude,
-                                 gps.longitude,
-                                 gps.knots,
-                                 gps.cog,
-                                 gps.magneticvariation]
-    
-                if PCtime:
-                    fieldstoprint.insert(0,gps.datetimevec(PCtime))
-    
-                printfields(fieldstoprint,fid)
-    
-            if gps.id == 'GST':
-    
-                try:
-                    gps.parse()
-                except gps.FailedChecksum:
-                    sys.stderr.write( "Failed Checksum: " + gps.checksum() + 
-                                      " :: " + gps.msg + '\n') 
-                    continue
-                except gps.FailedParsing:
-                    sys.stderr.write("Failed Parsing Line: %s" % line)
-                    continue
-                except:
-                    eprint("Unexpected error:", sys.exc_info()[0])
-                    raise
-                      
-                fieldstoprint = [gps.datetimevec(gps.datetime),
-                                 gps.residualrms,
-                                 gps.semimajor,
-                                 gps.semiminor,
-                                 gps.orientation,
-                                 gps.lat1sigma,
-                                 gps.lon1sigma,
-                                 gps.height1sigma]
-                if PCtime:
-                    fieldstoprint.insert(0,gps.datetimevec(PCtime))
-    
-                printfields(fieldstoprint,fid)
-                                  
-            if gps.id == 'GSV':
-    
-                try: 
-                    gps.parse()
-                except gps.FailedChecksum:
-                    sys.stderr.write( "Failed Checksum: " + gps.checksum() + 
-                                      " :: " + gps.msg + '\n') 
-                    continue
-                except gps.FailedParsing:
-                    sys.stderr.write("Failed Parsing Line: %s" % line)
-                    continue
-                except:
-                    eprint("Unexpected error:", sys.exc_info()[0])
-                    raise
-                      
-                    
-                fieldstoprint = [gps.datetimevec(PCtime),  
-                                 gps.PRN,
-                                 gps.elevation,
-                                 gps.azimuth,
-                                 gps.snr]
-                                 
-                printfields(fieldstoprint,fid)
-    
-    
-            if gps.id == 'VTG':
-                'VTG'
-                try:
-                    gps.parse()
-                except gps.FailedChecksum:
-                    sys.stderr.write( "Failed Checksum:" + gps.checksum() + 
-                                      "::" + gps.msg + '\n') 
-                    continue
-                except gps.FailedParsing:
-                    sys.stderr.write("Failed Parsing Line: %s" % line)
-                    continue
-                except:
-                    eprint("Unexpected error:", sys.exc_info()[0])
-                    raise
-      
-                fieldstoprint = [gps.datetimevec(PCtime),
-                                gps.cog,
-                                gps.knots,
-                                gps.kmph]
-                                
-                printfields(fieldstoprint,fid)
-            
-            if gps.id == 'HDT':
-                try:
-                    gps.parse()
-                except gps.FailedChecksum:
-                    sys.stderr.write( "Failed Checksum:" + gps.checksum() + 
-                                      "::" + gps.msg + '\n') 
-                    continue
-                except gps.FailedParsing:
-                    sys.stderr.write("Failed Parsing Line: %s" % line)
-                    continue
-                except:
-                    eprint("Unexpected error:", sys.exc_info()[0])
-                    raise
-                    
-                fieldstoprint = [gps.datetimevec(PCtime),
-                                 gps.heading]
-                printfields(fieldstoprint,fid)
-                
-                                 
-            if gps.id == 'PASHR':
-                try:
-                    gps.parse()
-                except gps.FailedChecksum:
-                    sys.stderr.write( "Failed Checksum:" + gps.checksum() + 
-                                      "::" + gps.msg + '\n') 
-                    continue
-                except gps.FailedParsing:
-                    sys.stderr.write("Failed Parsing Line: %s" % line)
-                    continue
-                except:
-                    eprint("Unexpected error:", sys.exc_info()[0])
-                    raise
-                
-                fieldstoprint = [gps.datetimevec(gps.datetime),
-                                 gps.heading,
-                                 gps.roll,
-                                 gps.pitch,
-                                 gps.heave,
-                                 gps.rollaccuracy,
-                                 gps.headingaccuracy,
-                                 gps.headingalgorithm,
-                                 gps.imustatus]
-                if PCtime:
-                    fieldstoprint.insert(0,gps.datetimevec(PCtime))
-                      
-                printfields(fieldstoprint,fid)
-              
-            if gps.id == 'GGK':
-                'GGK'
-                try:
-                    gps.parse()
-                except gps.FailedChecksum:
-                    sys.stderr.write( "Failed Checksum:" + gps.checksum() + 
-                                      "::" + gps.msg + '\n') 
-                except gps.FailedParsing:
-                    sys.stderr.write("Failed Parsing Line: %s" % line)
-                    continue
-                except:
-                    eprint("Unexpected error:", sys.exc_info()[0])
-                    raise
-      
-                fieldstoprint = [gps.datetimevec(gps.datetime), 
-                                 gps.latitude, 
-                                 gps.longitude, 
-                                 gps.quality,
-                                 gps.svs, 
-                                 gps.dop, 
-                                 gps.eht]
-                printfields(fieldstoprint,fid)
-        
-        ###############################################################
-        ##### END READING FILE ########################################
-        ###############################################################
-                
-        if outputtofile and not saveto1file:
-            fid.close()
+    def tryparse(self, line):
+        '''
+        Parses a line, returning a status code rather than raising an
+        exception when it cannot be parsed.
+
+        @return: A tuple of (status, stringtype, record), where status is
+        one of the GPSString status codes, stringtype is None for
+        unrecognized lines and record is None unless status is
+        GPSString.PARSED. Lines of string types not being parsed are
+        returned as GPSString.FILTERED.
+        '''
+        stringtype = self.identify(line)
+        if stringtype is None:
+            return GPSString.UNRECOGNIZED, None, None
+        try:
+            schema, convert, recordtype = self._schemas[stringtype]
+        except KeyError:
+            return GPSString.FILTERED, stringtype, None
+        if not self.checksum(line):
+            return GPSString.FAILED_CHECKSUM, stringtype, None
+        m = schema.regex.search(line)
+        if not m:
+            return GPSString.FAILED_PARSING, stringtype, None
+        fields = m.group('match').split(',')
+        # A damaged logger time stamp fails the line, like any other field.
+        try:
+            if self._fromepoch is None:
+                pctime = self.loggertime(line, stringtype)
+                date = pctime.date() if pctime is not None else self.date
+                filterdate = date
+            else:
+                pctime = timestamps.loggerepoch(line, stringtype)
+                if pctime is None:
+                    date = self._day
+                else:
+                    date = int(pctime // 86400)
+                    pctime = self._fromepoch(pctime)
+                filterdate = None
+                if self.filter is not None:
+                    filterdate = datetime.date.fromordinal(date + _EPOCH_ORDINAL)
+        except (ValueError, OverflowError):
+            return GPSString.FAILED_PARSING, stringtype, None
+        if self.filter is not None and \
+                not self.filter.accept(stringtype, fields, filterdate):
+            return GPSString.FILTERED, stringtype, None
+        try:
+            values = convert(self, fields, date)
+        except (dec.InvalidOperation, ValueError, IndexError):
+            return GPSString.FAILED_PARSING, stringtype, None
+        return GPSString.PARSED, stringtype, recordtype(pctime, *values)
+
+    def parse(self, line):
+        '''
+        Parses a line.
+
+        @return: The record, or None if the line is not of a string type
+        being parsed or cannot be parsed.
+        '''
+        return self.tryparse(line)[2]
+
+
+######################################################################################
+# Raw fields, read without parsing (i.e. by the filters of stages.py)
+######################################################################################
+
+def _rawlat(f, i):
+    value = float(f[i][0:2]) + float(f[i][2:]) / 60
+    return -value if f[i + 1] == 'S' else value
+
+def _rawlon(f, i):
+    value = float(f[i][0:3]) + float(f[i][3:]) / 60
+    return -value if f[i + 1] == 'W' else value
+
+def _rawtime(f, i):
+    return int(f[i][0:2]) * 3600 + int(f[i][2:4]) * 60 + float(f[i][4:])
+
+# How each kind of field is read for filtering. These are cheap, float
+# valued versions of FIELD_KINDS. Dates are returned as ordinal days and
+# times as seconds of the day.
+RAW_KINDS = {
+    'decimal' : lambda f, i: float(f[i]),
+    'string'  : lambda f, i: f[i],
+    'time'    : _rawtime,
+    'lat'     : _rawlat,
+    'lon'     : _rawlon,
+    'status'  : lambda f, i: 1 if f[i] == 'A' else 0,
+    'signed'  : lambda f, i: -float(f[i]) if f[i + 1] == 'W' else float(f[i]),
+    'eht'     : lambda f, i: float(f[i][3:]),
+    'ddmmyy'  : lambda f, i: datetime.date(int(f[i][4:6]) + 2000, int(f[i][2:4]),
+                                           int(f[i][0:2])).toordinal(),
+    'mmddyy'  : lambda f, i: datetime.date(int(f[i][4:6]) + 2000, int(f[i][0:2]),
+                                           int(f[i][2:4])).toordinal(),
+    'dd,mm,yyyy' : lambda f, i: datetime.date(int(f[i + 2]), int(f[i + 1]),
+                                              int(f[i])).toordinal(),
+    }
+
+_timefields = {}
+
+def rawtime(stringtype, fields):
+    '''
+    Reads the GPS time of a sentence from its raw fields.
+
+    @param stringtype: The sentence identifier (i.e. 'GGA').
+    @param fields: The comma delimited fields of the sentence, as matched by
+    its schema's regular expression.
+    @return: A tuple of (day, seconds), where day is the ordinal of the
+    sentence's date (None if it carries no date) and seconds the seconds of
+    the day, or None if the sentence carries no time. Malformed fields
+    raise ValueError or IndexError.
+    '''
+    try:
+        timeindex, dateread = _timefields[stringtype]
+    except KeyError:
+        timeindex = dateread = None
+        for index, name, kind, missing in SENTENCES[stringtype].fields:
+            if kind == 'time':
+                timeindex = index
+            elif name == 'date':
+                dateread = (RAW_KINDS[kind], index)
+        _timefields[stringtype] = (timeindex, dateread)
+    if timeindex is None:
+        return None
+    day = None
+    if dateread:
+        day = dateread[0](fields, dateread[1])
+    return day, _rawtime(fields, timeindex)
+
+
+
+######################################################################################
+######################## Module Code Ends Here. ######################################
+######################################################################################
+
+if __name__ == '__main__':
+    import cli
+    cli.main()
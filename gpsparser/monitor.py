@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+'''
+Monitoring of the data rate of GPS and attitude streams.
+
+A RateMonitor follows the interval between successive sentences of each
+stream (each talker and string type, i.e. INGGA or PASHR), both in GPS time
+and in the logging computer's time, and reports:
+
+    - gaps, where an interval exceeds GAP_FACTOR times the nominal interval,
+    - rate changes, where RATE_CHANGE_COUNT successive intervals differ from
+      the nominal interval by more than RATE_TOLERANCE,
+    - the jitter (standard deviation) of the intervals, and
+    - the drift of the logger clock relative to GPS time, as a slope fitted
+      to the offset between them, in parts per million.
+
+The nominal interval of each stream is learned from the data and updated
+as an exponentially weighted mean, so memory is constant per stream
+however long the log. Lines are read from their raw fields, without being
+fully parsed.
+
+@author: Val Schmidt
+@organization: Center for Coastal and Ocean Mapping, University of New Hampshire
+@license: GPL
+'''
+from __future__ import division
+import math
+import datetime
+from collections import OrderedDict
+import timestamps
+from gpsparser import GPSString, SENTENCES, rawtime
+
+_EPOCH_DAY = datetime.date(1970, 1, 1).toordinal()
+
+
+class IntervalTracker(object):
+    '''
+    Tracks the intervals between successive times of a single clock.
+    '''
+    GAP_FACTOR = 3.0
+    'Intervals longer than this many nominal intervals are gaps.'
+    RATE_TOLERANCE = 0.25
+    'The relative difference from the nominal interval that may be a rate change.'
+    RATE_CHANGE_COUNT = 10
+    'The number of successive differing intervals that make a rate change.'
+    SMOOTHING = 0.05
+    'The weight of each new interval in the nominal interval.'
+
+    def __init__(self):
+        self.last = None
+        'The last time seen, in seconds.'
+        self.nominal = None
+        'The nominal interval, in seconds.'
+        self.intervals = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.gaps = 0
+        self.longestgap = 0.0
+        self.ratechanges = 0
+        self._differing = 0
+        self._candidate = 0.0
+
+    @property
+    def jitter(self):
+        ''' The standard deviation of the intervals, in seconds.'''
+        if self.intervals < 2:
+            return 0.0
+        return math.sqrt(self._m2 / (self.intervals - 1))
+
+    def add(self, seconds):
+        '''
+        Adds a time.
+
+        @return: None, or an event tuple of ('gap', interval, nominal) or
+        ('rate', new nominal interval, old nominal interval).
+        '''
+        last, self.last = self.last, seconds
+        if last is None:
+            return None
+        interval = seconds - last
+        if interval < -43200:
+            # Times of day rolling over midnight.
+            interval += 86400
+        if interval <= 0:
+            # Repeated or out of order, as when several sentences share an epoch.
+            return None
+        self.intervals += 1
+        delta = interval - self.mean
+        self.mean += delta / self.intervals
+        self._m2 += delta * (interval - self.mean)
+
+        if self.nominal is None:
+            self.nominal = interval
+            return None
+        nominal = self.nominal
+        event = None
+        if interval > self.GAP_FACTOR * nominal:
+            self.gaps += 1
+            self.longestgap = max(self.longestgap, interval)
+            event = ('gap', interval, nominal)
+        # A run of differing intervals (gaps included) is a new rate.
+        if abs(interval - nominal) > self.RATE_TOLERANCE * nominal:
+            if self._differing == 0:
+                self._candidate = interval
+            else:
+                self._candidate += (interval - self._candidate) / (self._differing + 1)
+            self._differing += 1
+            if self._differing >= self.RATE_CHANGE_COUNT:
+                self.ratechanges += 1
+                self.nominal = self._candidate
+                self._differing = 0
+                return ('rate', self.nominal, nominal)
+            return event
+        self._differing = 0
+        self.nominal += self.SMOOTHING * (interval - nominal)
+        return None
+
+    def todict(self):
+        ''' Returns the statistics as a dictionary suitable for JSON.'''
+        return OrderedDict([('intervals', self.intervals),
+                            ('nominal', self.nominal),
+                            ('mean', self.mean),
+                            ('jitter', self.jitter),
+                            ('gaps', self.gaps),
+                            ('longestgap', self.longestgap),
+                            ('ratechanges', self.ratechanges)])
+
+
+class StreamMonitor(object):
+    '''
+    Monitors a single stream, in GPS time and logger time, and the drift
+    between the two clocks.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        'The number of sentences seen.'
+        self.gps = IntervalTracker()
+        self.logger = IntervalTracker()
+        # Sums for a least squares fit of the clock offset to GPS time.
+        self._origin = None
+        self._n = 0
+        self._sx = self._sy = self._sxx = self._sxy = 0.0
+
+    def add(self, gpstime, loggertime):
+        '''
+        Adds a sentence's GPS and logger times, either of which may be None.
+
+        @return: A list of (clock, event) tuples (see IntervalTracker.add()).
+        '''
+        self.count += 1
+        events = []
+        if gpstime is not None:
+            event = self.gps.add(gpstime)
+            if event:
+                events.append(('gps', event))
+        if loggertime is not None:
+            event = self.logger.add(loggertime)
+            if event:
+                events.append(('logger', event))
+        if gpstime is not None and loggertime is not None:
+            if self._origin is None:
+                self._origin = (gpstime, loggertime - gpstime)
+            x = gpstime - self._origin[0]
+            y = loggertime - gpstime - self._origin[1]
+            if abs(y) < 43200:
+                self._n += 1
+                self._sx += x
+                self._sy += y
+                self._sxx += x * x
+                self._sxy += x * y
+        return events
+
+    @property
+    def offset(self):
+        ''' The first offset of the logger clock from GPS time, in seconds.'''
+        return self._origin[1] if self._origin else None
+
+    @property
+    def drift(self):
+        ''' The drift of the logger clock from GPS time, in parts per million.'''
+        n = self._n
+        denominator = n * self._sxx - self._sx * self._sx
+        if n < 2 or denominator <= 0:
+            return None
+        return (n * self._sxy - self._sx * self._sy) / denominator * 1e6
+
+    def todict(self):
+        ''' Returns the statistics as a dictionary suitable for JSON.'''
+        return OrderedDict([('count', self.count),
+                            ('gps', self.gps.todict()),
+                            ('logger', self.logger.todict()),
+                            ('offset', self.offset),
+                            ('drift', self.drift)])
+
+
+class RateMonitor(object):
+    '''
+    Monitors the rate of every stream in a log. Lines are added one at a
+    time with add(), which returns any events they cause, and report()
+    summarizes every stream.
+    '''
+
+    def __init__(self):
+        self.streams = OrderedDict()
+        'A StreamMonitor for each stream, keyed by talker and string type.'
+        self._days = {}
+
+    @staticmethod
+    def streamname(msg, stringtype):
+        ''' Returns the talker and string type of a sentence (i.e. 'INGGA').'''
+        start = msg.find('$')
+        end = msg.find(stringtype, start)
+        if start < 0 or end < 0:
+            return stringtype
+        return msg[start + 1:end].rstrip(',') + stringtype
+
+    def add(self, line):
+        '''
+        Adds a logged line.
+
+        @return: A list of events, each a dictionary of the stream, the
+        clock ('gps' or 'logger'), the event ('gap' or 'rate'), the time at
+        which it was seen (GPS time when it is known), and the interval and
+        nominal interval in seconds.
+        '''
+        gps = GPSString(line)
+        try:
+            gps.identify()
+        except NotImplementedError:
+            return []
+        if not gps.checksum(True):
+            return []
+        stringtype = gps.id
+        m = SENTENCES[stringtype].regex.search(line)
+        if not m:
+            return []
+        try:
+            loggerdts = timestamps.loggertime(line, stringtype)
+        except (ValueError, OverflowError):
+            # A damaged logger time stamp (i.e. month 13) is taken as none.
+            loggerdts = None
+        loggertime = None
+        if loggerdts is not None:
+            loggertime = timestamps.datetime2epoch(loggerdts)
+        name = self.streamname(line, stringtype)
+        try:
+            gpstime = rawtime(stringtype, m.group('match').split(','))
+        except (ValueError, IndexError):
+            gpstime = None
+        if gpstime is not None:
+            day, seconds = gpstime
+            if day is None and loggerdts is not None:
+                # Dated by the logger, allowing for midnight between them.
+                day = loggerdts.toordinal()
+                loggerseconds = (loggerdts.hour * 3600 + loggerdts.minute * 60 +
+                                 loggerdts.second)
+                if seconds - loggerseconds > 43200:
+                    day -= 1
+                elif loggerseconds - seconds > 43200:
+                    day += 1
+            if day is None:
+                # Lacking a logger date (i.e. a damaged time stamp), that
+                # of the stream's last sentence.
+                day = self._days.get(name)
+            if day is None:
+                gpstime = seconds
+            else:
+                self._days[name] = day
+                gpstime = (day - _EPOCH_DAY) * 86400 + seconds
+
+        stream = self.streams.get(name)
+        if stream is None:
+            stream = self.streams[name] = StreamMonitor()
+        events = []
+        for clock, (event, interval, nominal) in stream.add(gpstime, loggertime):
+            at = gpstime if gpstime is not None else loggertime
+            events.append(OrderedDict([('stream', name),
+                                       ('clock', clock),
+                                       ('event', event),
+                                       ('time', self._format(at)),
+                                       ('interval', interval),
+                                       ('nominal', nominal)]))
+        return events
+
+    @staticmethod
+    def _format(seconds):
+        ''' Formats seconds since 1970 (or of the day) as an ISO 8601 time.'''
+        if seconds < 86400:
+            return str(datetime.timedelta(seconds=seconds))
+        return (datetime.datetime(1970, 1, 1) +
+                datetime.timedelta(seconds=seconds)).isoformat()
+
+    def report(self):
+        ''' Returns the statistics of every stream, keyed by stream.'''
+        return OrderedDict((name, stream.todict())
+                           for name, stream in self.streams.items())
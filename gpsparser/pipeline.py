@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+'''
+Pipelined processing of logs, so that reading (and decompressing) a log,
+parsing it and writing the output overlap rather than take turns.
+
+A Pipeline reads lines from a log on its own thread, in batches, and
+passes each batch through one or more stages, each also on its own thread
+(i.e. parsing lines into records). The items of the last stage's batches
+are returned by iterating over the Pipeline, so the caller (i.e. writing
+the records) is the last stage. Stages are joined by bounded queues, so a
+slow stage holds back the stages before it rather than letting batches
+accumulate in memory, and batches stay in order.
+
+As Python threads share the interpreter, this mostly hides time spent
+waiting: on a pipe, a slow network file system or stdout, or in
+decompression, which releases the interpreter. Parsing itself is not
+spread over processors.
+
+@author: Val Schmidt
+@organization: Center for Coastal and Ocean Mapping, University of New Hampshire
+@license: GPL
+'''
+import threading
+import Queue
+
+_END = object()
+
+
+class Pipeline(object):
+    '''
+    Iterates over the results of passing the lines of a log through a
+    sequence of stages, each on its own thread.
+    '''
+    BATCHSIZE = 1000
+    'The number of lines read before they are passed on together.'
+    QUEUESIZE = 16
+    'The maximum number of batches waiting between two stages.'
+    TIMEOUT = 0.1
+    'The interval at which blocked threads check that the pipeline is running.'
+
+    def __init__(self, lines, stages, batchsize=None, queuesize=None):
+        '''
+        @param lines: The lines to process (i.e. a LogReader).
+        @param stages: A sequence of functions, each taking a list (a batch
+        of lines, or the list returned by the stage before) and returning a
+        list.
+        @param batchsize: The number of lines in each batch. 1 passes each
+        line on as soon as it is read (i.e. when following a live log).
+        @param queuesize: The maximum number of batches waiting between two
+        stages.
+        '''
+        self.lines = lines
+        self.stages = list(stages)
+        self.batchsize = batchsize or self.BATCHSIZE
+        self.queuesize = queuesize or self.QUEUESIZE
+        self._stopped = threading.Event()
+
+    def __iter__(self):
+        queues = [Queue.Queue(self.queuesize)
+                  for idx in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._read, args=(queues[0],))]
+        for stage, inqueue, outqueue in zip(self.stages, queues, queues[1:]):
+            threads.append(threading.Thread(target=self._run,
+                                            args=(stage, inqueue, outqueue)))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            while True:
+                batch = self._get(queues[-1])
+                if batch is _END:
+                    return
+                if isinstance(batch, BaseException):
+                    raise batch
+                for item in batch:
+                    yield item
+        finally:
+            # Also stops the threads when the caller stops early.
+            self._stopped.set()
+
+    def _put(self, queue, item):
+        ''' Puts an item on a queue, unless the pipeline stops first.'''
+        while not self._stopped.is_set():
+            try:
+                queue.put(item, timeout=self.TIMEOUT)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _get(self, queue):
+        ''' Gets an item from a queue, or _END if the pipeline stops first.'''
+        while not self._stopped.is_set():
+            try:
+                return queue.get(timeout=self.TIMEOUT)
+            except Queue.Empty:
+                pass
+        return _END
+
+    def _read(self, outqueue):
+        ''' Reads the lines in batches onto the first queue.'''
+        try:
+            batch = []
+            for line in self.lines:
+                batch.append(line)
+                if len(batch) >= self.batchsize:
+                    if not self._put(outqueue, batch):
+                        return
+                    batch = []
+            if batch and not self._put(outqueue, batch):
+                return
+            self._put(outqueue, _END)
+        except BaseException as e:
+            self._put(outqueue, e)
+
+    def _run(self, stage, inqueue, outqueue):
+        ''' Passes each batch through a stage onto the next queue.'''
+        while True:
+            batch = self._get(inqueue)
+            if batch is _END or isinstance(batch, BaseException):
+                # The end, or an error, is passed on to the caller.
+                self._put(outqueue, batch)
+                return
+            try:
+                result = stage(batch)
+            except BaseException as e:
+                self._put(outqueue, e)
+                return
+            if not self._put(outqueue, result):
+                return
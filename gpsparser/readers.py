@@ -0,0 +1,561 @@
+#!/usr/bin/env python
+'''
+Reading of GPS logs, which may be compressed, and merging of many logs
+into one time ordered stream.
+
+@author: Val Schmidt
+@organization: Center for Coastal and Ocean Mapping, University of New Hampshire
+@license: GPL
+'''
+import os
+import re
+import sys
+import time
+import zlib
+import heapq
+import datetime
+import timestamps
+from collections import OrderedDict
+from gpsparser import SENTENCES, rawtime
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_DAY = _EPOCH.toordinal()
+
+# Magic bytes identifying compressed logs.
+COMPRESSION_MAGIC = [('\x1f\x8b', 'gzip'),
+                     ('BZh', 'bzip2'),
+                     ('\xfd7zXZ\x00', 'xz')]
+COMPRESSED_SUFFIXES = ('.gz', '.bz2', '.xz')
+
+def compression(header):
+    '''
+    Returns the compression format ('gzip', 'bzip2' or 'xz') identified by
+    the first bytes of a file, or None if the file is not compressed.
+    '''
+    for magic, name in COMPRESSION_MAGIC:
+        if header.startswith(magic):
+            return name
+    return None
+
+def _decompressor(name):
+    ''' Returns a new incremental decompressor for a compression format.'''
+    if name == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if name == 'bzip2':
+        import bz2
+        return bz2.BZ2Decompressor()
+    try:
+        import lzma
+    except ImportError:
+        try:
+            from backports import lzma
+        except ImportError:
+            raise IOError('Reading xz compressed logs requires the lzma '
+                          'module (backports.lzma).')
+    return lzma.LZMADecompressor()
+
+def _loggertime(line, stringtype):
+    ''' Returns the logger time stamp of a line, or None if it has none or it is damaged.'''
+    try:
+        return timestamps.loggertime(line, stringtype)
+    except (ValueError, OverflowError):
+        return None
+
+def linetime(line, key='logger'):
+    '''
+    Returns the time of a line in seconds since 1970-01-01, or None if it
+    has none.
+
+    @param line: A logged line.
+    @param key: 'logger' for the logging computer's time stamp, or 'gps'
+    for the time of the GPS string. GPS times are dated with the string's
+    own date where it has one, then with the logger's date, and are
+    otherwise taken as times of day. A damaged logger time stamp (i.e.
+    month 13) is taken as none.
+    '''
+    for stringtype in SENTENCES:
+        if stringtype in line:
+            break
+    else:
+        return None
+    if key == 'logger':
+        dts = _loggertime(line, stringtype)
+        if dts is None:
+            return None
+        return (dts - _EPOCH).total_seconds()
+
+    m = SENTENCES[stringtype].regex.search(line)
+    if not m:
+        return None
+    try:
+        gpstime = rawtime(stringtype, m.group('match').split(','))
+    except (ValueError, IndexError):
+        return None
+    if gpstime is None:
+        return None
+    day, seconds = gpstime
+    if day is None:
+        dts = _loggertime(line, stringtype)
+        day = dts.toordinal() if dts else _EPOCH_DAY
+    return (day - _EPOCH_DAY) * 86400 + seconds
+
+class LogReader(object):
+    '''
+    Iterates over the lines of a log, decompressing it on the fly.
+
+    Compressed logs (gzip, bzip2 or xz) are identified by their leading
+    bytes rather than their file names, so piped input works too. They are
+    read and decompressed a block at a time by a separate thread, which
+    hands the blocks to the parser through a bounded queue, so that
+    decompression overlaps with parsing. Concatenated streams (e.g. from
+    C{cat a.gz b.gz}) are decompressed in turn. Uncompressed logs are read
+    directly.
+
+    An uncompressed log that is still being written may be followed (like
+    C{tail -f}), in which case lines are returned as soon as they are
+    complete and the reader waits for more at the end of a file. Pipes
+    (i.e. from a network logger) are read a block of whatever has arrived
+    at a time, so their lines are returned as soon as they are complete
+    whether followed or not, until the end of the pipe.
+    '''
+    BLOCKSIZE = 1 << 20
+    'The size of the blocks read from the log.'
+    QUEUESIZE = 8
+    'The maximum number of decompressed blocks waiting to be parsed.'
+    POLLINTERVAL = 0.2
+    'The time waited for a followed file to grow, in seconds.'
+
+    def __init__(self, source, threaded=True, follow=False):
+        '''
+        @param source: A file name, or a file object opened for reading.
+        @param threaded: Decompress on a separate thread.
+        @param follow: Follow an uncompressed log as it is written.
+        '''
+        if isinstance(source, basestring):
+            self.fid = open(source, 'rb')
+        else:
+            self.fid = source
+        self.name = getattr(self.fid, 'name', None)
+        self.follow = follow
+        self._fileno = self._pipefileno()
+        # Enough to identify compression, without waiting on a live log.
+        size = max(len(magic) for magic, name in COMPRESSION_MAGIC)
+        first = ''
+        while len(first) < size:
+            data = self._read(size - len(first))
+            if not data:
+                break
+            first += data
+        self.compression = compression(first)
+        self._first = first
+        self._closed = False
+        if self.compression is None:
+            self._lines = self._plainlines(first)
+        else:
+            _decompressor(self.compression)  # Fail early if unsupported.
+            if threaded:
+                # Only needed for compressed logs, so imported here.
+                import threading
+                import Queue
+                self._queue = Queue.Queue(self.QUEUESIZE)
+                self._thread = threading.Thread(target=self._decompressthread,
+                                                args=(first,))
+                self._thread.daemon = True
+                self._thread.start()
+                self._lines = self._splitlines(self._queuedblocks())
+            else:
+                self._lines = self._splitlines(self._decompressedblocks(first))
+
+    def __iter__(self):
+        return self._lines
+
+    def blocks(self):
+        '''
+        Yields the contents of the log (decompressed) a block at a time,
+        without splitting it into lines, in place of iterating over it.
+        '''
+        if self.compression is None:
+            data = self._first
+            while data:
+                yield data
+                data = self._read(self.BLOCKSIZE)
+        elif hasattr(self, '_queue'):
+            for block in self._queuedblocks():
+                yield block
+        else:
+            for block in self._decompressedblocks(self._first):
+                yield block
+
+    def _pipefileno(self):
+        ''' Returns the file descriptor of a log that is a pipe, or None.'''
+        try:
+            fileno = self.fid.fileno()
+        except (AttributeError, IOError, ValueError):
+            return None
+        try:
+            os.lseek(fileno, 0, os.SEEK_CUR)
+        except OSError:
+            return fileno
+        return None
+
+    def _read(self, size):
+        '''
+        Reads up to size bytes of the log. Pipes are read directly, so as to
+        return what has arrived rather than wait for size bytes (or, where
+        the file object is unbuffered, read a byte at a time).
+        '''
+        if self._fileno is None:
+            return self.fid.read(size)
+        return os.read(self._fileno, size)
+
+    def _pipeblocks(self, first):
+        ''' Yields the blocks of a pipe, as they arrive.'''
+        data = first
+        while data and not self._closed:
+            yield data
+            data = self._read(self.BLOCKSIZE)
+
+    def close(self):
+        ''' Closes the log.'''
+        self._closed = True
+        if self.fid is not sys.stdin:
+            self.fid.close()
+
+    def _plainlines(self, first):
+        ''' Yields the lines of an uncompressed log.'''
+        if self._fileno is not None:
+            for line in self._splitlines(self._pipeblocks(first)):
+                yield line
+            return
+        seekable = True
+        try:
+            self.fid.seek(0)
+        except (IOError, AttributeError):
+            # Not seekable (i.e. a socket). Finish the first block by hand.
+            seekable = False
+            lines = first.split('\n')
+            last = lines.pop()
+            for line in lines:
+                yield line + '\n'
+            last += self.fid.readline()
+            if last:
+                yield last
+        if not self.follow:
+            for line in self.fid:
+                yield line
+            return
+        # Read a line at a time, as iterating over a file reads ahead.
+        pending = ''
+        while not self._closed:
+            line = self.fid.readline()
+            if not line:
+                if not seekable:
+                    break
+                time.sleep(self.POLLINTERVAL)
+                continue
+            pending += line
+            if pending.endswith('\n'):
+                yield pending
+                pending = ''
+        if pending:
+            yield pending
+
+    def _decompressedblocks(self, first):
+        ''' Yields decompressed blocks of the log.'''
+        decompressor = _decompressor(self.compression)
+        data = first
+        while data:
+            while data:
+                try:
+                    block = decompressor.decompress(data)
+                except EOFError:
+                    # A new stream follows the end of the last one.
+                    decompressor = _decompressor(self.compression)
+                    continue
+                if block:
+                    yield block
+                data = decompressor.unused_data
+                if data:
+                    decompressor = _decompressor(self.compression)
+            if self._closed:
+                return
+            data = self._read(self.BLOCKSIZE)
+
+    def _decompressthread(self, first):
+        ''' Decompresses the log onto the queue.'''
+        try:
+            for block in self._decompressedblocks(first):
+                if not self._put(block):
+                    return
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        '''
+        Puts an item on the queue, waiting while it is full, unless the log
+        is closed (when nothing may be taking items from it).
+
+        @return: False if the log was closed first.
+        '''
+        import Queue
+        while not self._closed:
+            try:
+                self._queue.put(item, timeout=self.POLLINTERVAL)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _queuedblocks(self):
+        ''' Yields decompressed blocks from the queue.'''
+        while True:
+            block = self._queue.get()
+            if block is None:
+                return
+            if isinstance(block, Exception):
+                raise block
+            yield block
+
+    @staticmethod
+    def _splitlines(blocks):
+        ''' Yields the lines of a sequence of blocks.'''
+        pending = ''
+        for block in blocks:
+            lines = (pending + block).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if pending:
+            yield pending
+
+
+class LogMerger(object):
+    '''
+    Merges many logs into a single, time ordered stream of lines.
+
+    Each log is read by its own LogReader and only the next line of each is
+    held at a time, on a heap ordered by time, so memory is bounded by the
+    number of logs rather than their size. Each log must itself be in time
+    order, as logs are.
+
+    Lines are ordered by the logging computer's time stamp (key='logger')
+    or by the GPS time of the string (key='gps'). GPS times are dated with
+    the string's own date where it has one, then with the logger's date,
+    and are otherwise taken as times of day. Lines without a time (i.e.
+    unrecognized lines, or HDT strings when keyed on GPS time) keep the
+    time of the line before them, so stay where they were in their log.
+    '''
+    KEYS = ('logger', 'gps')
+    name = 'merged'
+    'The base name of output files written from merged logs.'
+
+    def __init__(self, sources, key='logger', threaded=True):
+        '''
+        @param sources: A sequence of file names or file objects.
+        @param key: 'logger' or 'gps'.
+        @param threaded: Decompress compressed logs on separate threads.
+        '''
+        if key not in self.KEYS:
+            raise ValueError('Unsupported merge key: %s' % key)
+        self.key = key
+        self.sources = list(sources)
+        self._readers = [LogReader(source, threaded) for source in self.sources]
+
+    def __str__(self):
+        return '%d merged logs' % len(self.sources)
+
+    def __iter__(self):
+        heap = []
+        for idx, reader in enumerate(self._readers):
+            self._push(heap, idx, iter(reader), None)
+        while heap:
+            linetime, idx, line, lines = heapq.heappop(heap)
+            yield line
+            self._push(heap, idx, lines, linetime)
+
+    def close(self):
+        ''' Closes the logs.'''
+        for reader in self._readers:
+            reader.close()
+
+    def _push(self, heap, idx, lines, lasttime):
+        ''' Pushes the next line of a log onto the heap.'''
+        for line in lines:
+            linetime = self.linetime(line)
+            if linetime is None:
+                linetime = lasttime
+            if linetime is None:
+                # Untimed lines at the start of a log go first.
+                linetime = float('-inf')
+            heapq.heappush(heap, (linetime, idx, line, lines))
+            return
+
+    def linetime(self, line):
+        '''
+        Returns the time of a line in seconds since 1970-01-01, or None if
+        it has none (see linetime()).
+        '''
+        return linetime(line, self.key)
+
+
+class Inventory(object):
+    '''
+    Counts the sentences in logs by talker and string type (i.e. INGGA,
+    GPGGA), without verifying checksums or parsing fields, as a quick
+    survey of a log or to size arrays before parsing it.
+
+    Logs are scanned a block at a time for the headers of NMEA sentences
+    (C{$} and the address field, i.e. C{$INGGA,}), rather than a line at a
+    time. Headers are found with a regular expression, and once known are
+    simply counted in each block (str.count()), which is checked against
+    the count of C{$} characters in the block; only blocks with new
+    headers (or stray C{$} characters) are searched again. Logs are so
+    scanned at close to the rate they can be read. When
+    requested, the logger time stamps of the first and last sentence of
+    each kind are also found, from only those lines.
+
+    Counts are of sentences seen, so are an upper bound on the records a
+    full parse of the same log will return (i.e. for preallocating them).
+    '''
+    HEADER_EXP = re.compile(r'\$([A-Z][A-Z0-9]{1,5}),(?:([A-Z]{3}),)?')
+    'Matches the address field of a sentence, and the sentence type that follows proprietary addresses (i.e. $PTNL,GGK).'
+
+    def __init__(self, loggertimes=False):
+        '''
+        @param loggertimes: Find the logger time stamps of the first and
+        last sentence of each kind.
+        '''
+        self.loggertimes = loggertimes
+        self.bytes = 0
+        self.lines = 0
+        self.counts = OrderedDict()
+        'The number of sentences by header (i.e. INGGA or PTNL,GGK).'
+        self._headers = []
+        self._firstlines = {}
+        self._lastlines = {}
+
+    @staticmethod
+    def split(header):
+        '''
+        Returns the talker and string type of a sentence header (i.e.
+        ('IN', 'GGA') for INGGA or ('PTNL', 'GGK') for PTNL,GGK). The talker
+        of proprietary sentences identified by their address alone (i.e.
+        PASHR) is ''.
+        '''
+        address, comma, stringtype = header.partition(',')
+        if comma:
+            return address, stringtype
+        if address in SENTENCES or len(address) != 5:
+            return '', address
+        return address[:2], address[2:]
+
+    def scan(self, source):
+        '''
+        Adds the sentences of a log to the inventory.
+
+        @param source: A file name, a file object or a LogReader.
+        '''
+        reader = source if isinstance(source, LogReader) else LogReader(source)
+        pending = ''
+        try:
+            for block in reader.blocks():
+                self.bytes += len(block)
+                # Only complete lines are scanned, so no header is split.
+                end = block.rfind('\n') + 1
+                if not end:
+                    # No line ends in the block.
+                    pending += block
+                    continue
+                block, pending = pending + block[:end], block[end:]
+                self._scanblock(block)
+            if pending:
+                self._scanblock(pending)
+        finally:
+            if reader is not source:
+                reader.close()
+
+    def _scanblock(self, block):
+        '''Counts the sentences in a block of complete lines.'''
+        self.lines += block.count('\n')
+        dollars = block.count('$')
+        if not dollars:
+            return
+        blockcounts = [(header, block.count(pattern))
+                       for header, pattern in self._headers]
+        if sum(count for header, count in blockcounts) != dollars:
+            blockcounts = {}
+            for address, stringtype in self.HEADER_EXP.findall(block):
+                # Only proprietary addresses are followed by a sentence type.
+                if stringtype and address[0] == 'P' and address not in SENTENCES:
+                    header = address + ',' + stringtype
+                else:
+                    header = address
+                blockcounts[header] = blockcounts.get(header, 0) + 1
+            blockcounts = blockcounts.items()
+            for header, count in blockcounts:
+                if header not in self.counts:
+                    self._headers.append((header, '$' + header + ','))
+        counts = self.counts
+        for header, count in blockcounts:
+            if not count:
+                continue
+            counts[header] = counts.get(header, 0) + count
+            if self.loggertimes:
+                if header not in self._firstlines:
+                    self._firstlines[header] = self._line(block,
+                                                          block.find('$' + header))
+                self._lastlines[header] = self._line(block,
+                                                     block.rfind('$' + header))
+
+    @staticmethod
+    def _line(block, position):
+        '''Returns the line of a block at a position.'''
+        start = block.rfind('\n', 0, position) + 1
+        end = block.find('\n', position)
+        return block[start:end if end >= 0 else len(block)]
+
+    def count(self, stringtype):
+        '''
+        Returns the number of sentences of a string type (i.e. 'GGA'), from
+        every talker.
+        '''
+        return sum(count for header, count in self.counts.items()
+                   if self.split(header)[1] == stringtype)
+
+    def first(self, header):
+        '''
+        Returns the logger time of the first sentence with a header, or
+        None (as for a damaged time stamp).
+        '''
+        return self._loggertime(self._firstlines.get(header), header)
+
+    def last(self, header):
+        '''
+        Returns the logger time of the last sentence with a header, or None
+        (as for a damaged time stamp).
+        '''
+        return self._loggertime(self._lastlines.get(header), header)
+
+    def _loggertime(self, line, header):
+        if line is None:
+            return None
+        return _loggertime(line, self.split(header)[1])
+
+    def todict(self):
+        ''' Returns the inventory as a dictionary suitable for JSON.'''
+        sentences = OrderedDict()
+        for header in sorted(self.counts):
+            talker, stringtype = self.split(header)
+            values = OrderedDict([('talker', talker),
+                                  ('stringtype', stringtype),
+                                  ('supported', stringtype in SENTENCES),
+                                  ('count', self.counts[header])])
+            if self.loggertimes:
+                for name, dts in (('first', self.first(header)),
+                                  ('last', self.last(header))):
+                    values[name] = dts.isoformat() if dts else None
+            sentences[header] = values
+        return OrderedDict([('bytes', self.bytes),
+                            ('lines', self.lines),
+                            ('sentences', sentences)])
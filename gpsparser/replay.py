@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+'''
+Replay of recorded GPS logs, to test live ingestion (see C{replay.py -h}).
+
+Each log is replayed as a stream of lines paced by the logger's time
+stamps or the GPS time of each string, in real time, faster by a given
+factor, or as fast as possible, to stdout or to a TCP or UDP endpoint.
+Several logs may be replayed at once, as concurrent streams, each on its
+own thread and (for TCP) its own connection. Lines may be corrupted at
+random, to exercise a parser's handling of bad strings.
+
+When a stream falls behind its schedule (i.e. because the receiver is not
+keeping up, or when replaying as fast as possible), lines are sent
+without waiting. The lag behind schedule and the rate achieved by each
+stream are reported on stderr, as JSON, so that with the parser's own
+statistics (C{--stats}) the highest sentence rate the ingestion sustains
+may be found.
+
+@author: Val Schmidt
+@organization: Center for Coastal and Ocean Mapping, University of New Hampshire
+@license: GPL
+'''
+from __future__ import print_function, division
+import sys
+import time
+import random
+import socket
+import threading
+from collections import OrderedDict
+from readers import LogReader, linetime
+
+
+def opensink(destination, lock=None):
+    '''
+    Opens a destination for replayed lines.
+
+    @param destination: '-' for stdout, or tcp://HOST:PORT or
+    udp://HOST:PORT.
+    @param lock: A lock serializing lines written to stdout by several
+    streams.
+    @return: A function sending a line, and a function closing the
+    destination.
+    '''
+    if destination == '-':
+        lock = lock or threading.Lock()
+        def send(line):
+            with lock:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+        return send, lambda: None
+    protocol, sep, address = destination.partition('://')
+    host, sep2, port = address.rpartition(':')
+    if not sep or not sep2 or protocol not in ('tcp', 'udp') or not port.isdigit():
+        raise ValueError('Unsupported destination: %s' % destination)
+    address = (host or 'localhost', int(port))
+    if protocol == 'tcp':
+        sock = socket.create_connection(address)
+        return sock.sendall, sock.close
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    return lambda line: sock.sendto(line, address), sock.close
+
+
+class Replay(object):
+    '''
+    Replays a single log, pacing its lines by their times.
+    '''
+    CORRUPTIONS = ('character', 'truncate')
+    'The ways in which lines are corrupted: a changed character, or a line cut short.'
+
+    def __init__(self, source, send, key='logger', speed=1.0, corrupt=0.0,
+                 seed=None):
+        '''
+        @param source: A file name or file object of the log.
+        @param send: A function sending a line (see opensink()).
+        @param key: Pace by the 'logger' time stamps or by 'gps' time.
+        @param speed: The factor by which the replay is faster than real
+        time (1 for real time). 0 replays as fast as possible.
+        @param corrupt: The probability of corrupting each line.
+        @param seed: A seed for the random corruption, for repeatable runs.
+        '''
+        self.source = source
+        self.send = send
+        self.key = key
+        self.speed = speed
+        self.corrupt = corrupt
+        self.random = random.Random(seed)
+        self.lines = 0
+        self.bytes = 0
+        self.corrupted = 0
+        self.elapsed = 0.0
+        self.maxlag = 0.0
+        'The furthest a line was sent behind its schedule, in seconds.'
+        self._lagsum = 0.0
+        self._stopped = False
+
+    def stop(self):
+        ''' Stops the replay after the current line.'''
+        self._stopped = True
+
+    def corruptline(self, line):
+        ''' Returns a line with a random character changed, or cut short.'''
+        body = line.rstrip('\r\n')
+        if not body:
+            return line
+        position = self.random.randrange(len(body))
+        if self.random.choice(self.CORRUPTIONS) == 'truncate':
+            return body[:position] + '\n'
+        replacement = chr(self.random.randrange(32, 127))
+        return body[:position] + replacement + body[position + 1:] + '\n'
+
+    def run(self):
+        ''' Replays the log, returning when it ends or is stopped.'''
+        reader = LogReader(self.source)
+        start = time.time()
+        origin = None
+        try:
+            for line in reader:
+                if self._stopped:
+                    break
+                if self.speed:
+                    # Lines without a time, or with a damaged time stamp,
+                    # are sent without waiting (see linetime()).
+                    seconds = linetime(line, self.key)
+                    now = time.time()
+                    if seconds is not None:
+                        if origin is None or seconds < origin[1]:
+                            # The first timed line, or time running backwards
+                            # (i.e. a new log), which restarts the schedule.
+                            origin = (now, seconds)
+                        scheduled = origin[0] + (seconds - origin[1]) / self.speed
+                        if scheduled > now:
+                            time.sleep(scheduled - now)
+                        else:
+                            lag = now - scheduled
+                            self._lagsum += lag
+                            self.maxlag = max(self.maxlag, lag)
+                if self.corrupt and self.random.random() < self.corrupt:
+                    line = self.corruptline(line)
+                    self.corrupted += 1
+                self.send(line)
+                self.lines += 1
+                self.bytes += len(line)
+        finally:
+            reader.close()
+            self.elapsed = time.time() - start
+
+    def report(self):
+        ''' Returns the statistics of the replay as a dictionary for JSON.'''
+        return OrderedDict([
+            ('source', getattr(self.source, 'name', self.source)),
+            ('lines', self.lines),
+            ('bytes', self.bytes),
+            ('corrupted', self.corrupted),
+            ('elapsed', self.elapsed),
+            ('rate', self.lines / self.elapsed if self.elapsed else None),
+            ('meanlag', self._lagsum / self.lines if self.lines else 0.0),
+            ('maxlag', self.maxlag)])
+
+
+def main():
+    ''' Replays logs as directed by the command-line arguments.'''
+    import json
+    import argparse
+    parser = argparse.ArgumentParser(description=('Replay GPS logs to '
+    'stdout or a TCP or UDP endpoint, paced by their time stamps, to test '
+    'live ingestion. Each log is replayed as a concurrent stream, and the '
+    'rate and lag of each is reported on stderr as JSON.'))
+    parser.add_argument('logs', nargs='+', metavar='LOG',
+                        help='The logs to replay (possibly compressed).')
+    parser.add_argument('-d', '--destination', dest='destination',
+                        default='-',
+                        help=('- for stdout (default), tcp://HOST:PORT or '
+                        'udp://HOST:PORT. Each stream opens its own TCP '
+                        'connection.'))
+    parser.add_argument('--key', dest='key', choices=('logger', 'gps'),
+                        default='logger',
+                        help=('Pace by the logger time stamps (default) or '
+                        'by the GPS time of each string.'))
+    parser.add_argument('--speed', dest='speed', type=float, default=1.0,
+                        help=('The factor by which to replay faster than real '
+                        'time (default 1). 0 replays as fast as possible.'))
+    parser.add_argument('--corrupt', dest='corrupt', type=float, default=0.0,
+                        metavar='P',
+                        help=('The probability of corrupting each line, by '
+                        'changing a character or cutting it short.'))
+    parser.add_argument('--seed', dest='seed', type=int, default=None,
+                        help='A seed for repeatable corruption.')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=1,
+                        metavar='N',
+                        help=('Replay each log as N concurrent streams '
+                        '(default 1), to multiply the load.'))
+    args = parser.parse_args()
+
+    lock = threading.Lock()
+    replays = []
+    closers = []
+    try:
+        for log in args.logs:
+            for idx in range(args.repeat):
+                send, close = opensink(args.destination, lock)
+                closers.append(close)
+                seed = None if args.seed is None else args.seed + len(replays)
+                replays.append(Replay(log, send, args.key, args.speed,
+                                      args.corrupt, seed))
+    except (ValueError, socket.error) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    threads = [threading.Thread(target=replay.run) for replay in replays]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        # Joined with a timeout, so that Ctrl-C is not blocked.
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.2)
+    except KeyboardInterrupt:
+        for replay in replays:
+            replay.stop()
+    finally:
+        for close in closers:
+            close()
+    for replay in replays:
+        print(json.dumps(replay.report(), separators=(',', ':')),
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
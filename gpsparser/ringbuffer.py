@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+'''
+Publishing of parsed records to other processes on the same computer
+through a ring buffer in shared memory, so that a display, acquisition
+system or monitor can each take the latest fixes without parsing the
+NMEA stream themselves.
+
+A RingWriter publishes the records of one string type (i.e. GGA) to a
+memory mapped file, in /dev/shm where there is one, so that it is held
+in memory. Each record is stored as fixed width float64 values (times as
+seconds, see timestamps.seconds(), and missing values as NaN) in a slot
+of the ring, with its sequence number (1, 2, ...) before and after its
+values. Any number of RingReaders may map the same file and read the
+records by sequence number, unpacking them directly from the shared
+memory.
+
+The writer never waits for readers: once the ring is full, each new
+record overwrites the oldest. A reader that falls more than a ring behind
+skips ahead, counting the records it lost, and a record overwritten while
+it is being read is detected by its sequence numbers no longer matching,
+so no locks are needed. A writer that is restarted creates a new ring
+buffer, so readers must then be reopened.
+
+Layout of the file (little-endian)::
+
+    magic 'GPSRING', version (1 byte), slots, fields (uint32),
+    published (uint64), string type (8 bytes), field names (32 bytes each),
+    then each slot: sequence (uint64), values (float64 each), sequence.
+
+@author: Val Schmidt
+@organization: Center for Coastal and Ocean Mapping, University of New Hampshire
+@license: GPL
+'''
+import os
+import mmap
+import struct
+import tempfile
+import timestamps
+from gpsparser import SENTENCES
+
+MAGIC = 'GPSRING\x01'
+_HEADER = struct.Struct('<8sII')
+_PUBLISHED = struct.Struct('<Q')
+_PUBLISHED_OFFSET = _HEADER.size
+_STRINGTYPE_OFFSET = _PUBLISHED_OFFSET + _PUBLISHED.size
+_NAMES_OFFSET = _STRINGTYPE_OFFSET + 8
+_NAMESIZE = 32
+
+def ringpath(name):
+    '''
+    Returns the path of the file holding a named ring buffer, in /dev/shm
+    where there is one, or else the temporary directory.
+    '''
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'gpsparser-%s' % name)
+
+def ringfields(stringtype):
+    '''
+    Returns the names of the values published for a string type: pctime
+    and the numeric output fields (with datetime as gpstime).
+    '''
+    schema = SENTENCES[stringtype]
+    if schema.group:
+        raise ValueError('%s strings have a variable number of fields and '
+                         'cannot be published.' % stringtype)
+    kinds = dict((item[1], item[2]) for item in schema.fields)
+    return ['pctime'] + [('gpstime' if name == 'datetime' else name)
+                         for name in schema.output
+                         if kinds.get(name) != 'string']
+
+
+class RingWriter(object):
+    '''
+    Publishes parsed records of a single string type to a ring buffer in
+    shared memory. It has the interface of the other writers (see
+    writers.RecordWriter), so may take their place.
+    '''
+    SLOTS = 4096
+    'The number of records held, about 3.4 minutes of 20 Hz strings.'
+
+    def __init__(self, stringtype, name=None, slots=None, extrafields=()):
+        '''
+        @param stringtype: The string type of the records (i.e. 'GGA').
+        @param name: The name of the ring buffer, by default the string type.
+        @param slots: The number of records held.
+        @param extrafields: The names of further numeric fields added to the
+        records (i.e. kinematics.FIELDNAMES), published after the others.
+        '''
+        self.stringtype = stringtype
+        self.name = name or stringtype
+        self.path = ringpath(self.name)
+        self.fields = ringfields(stringtype) + list(extrafields)
+        self.slots = slots or self.SLOTS
+        self._slot = struct.Struct('<Q%ddQ' % len(self.fields))
+        self._values = struct.Struct('<%dd' % len(self.fields))
+        self._start = _NAMES_OFFSET + _NAMESIZE * len(self.fields)
+        self._start += -self._start % 8
+        size = self._start + self.slots * self._slot.size
+
+        # A new file, renamed into place, so readers never map a partial one.
+        temporary = '%s.%d' % (self.path, os.getpid())
+        with open(temporary, 'wb') as fid:
+            fid.write(_HEADER.pack(MAGIC, self.slots, len(self.fields)))
+            fid.write(_PUBLISHED.pack(0))
+            fid.write(struct.pack('8s', stringtype))
+            for name in self.fields:
+                fid.write(struct.pack('%ds' % _NAMESIZE, name))
+            fid.truncate(size)
+        os.rename(temporary, self.path)
+        self._fid = open(self.path, 'r+b')
+        self._map = mmap.mmap(self._fid.fileno(), size)
+        self.published = 0
+        'The sequence number of the last record published.'
+
+    def publish(self, record):
+        '''
+        Publishes a parsed record, a dictionary of its fields.
+
+        @return: The record's sequence number.
+        '''
+        values = []
+        for name in self.fields:
+            value = record.get('datetime' if name == 'gpstime' else name)
+            if name in ('pctime', 'gpstime'):
+                value = timestamps.seconds(value)
+            values.append(float('nan') if value is None else float(value))
+        sequence = self.published + 1
+        offset = self._start + (sequence - 1) % self.slots * self._slot.size
+        # The sequence is written before and after the values, so that a
+        # reader can tell the slot was not overwritten while it was read.
+        _PUBLISHED.pack_into(self._map, offset, sequence)
+        self._values.pack_into(self._map, offset + 8, *values)
+        _PUBLISHED.pack_into(self._map, offset + self._slot.size - 8, sequence)
+        _PUBLISHED.pack_into(self._map, _PUBLISHED_OFFSET, sequence)
+        self.published = sequence
+        return sequence
+
+    def write(self, record, fid=None):
+        ''' Publishes a parsed record.'''
+        self.publish(record)
+
+    def flush(self, fid=None):
+        ''' Records are published as they are written, so does nothing.'''
+        pass
+
+    def close(self, unlink=False):
+        '''
+        Closes the ring buffer, leaving it for readers unless unlink is set.
+        '''
+        self._map.close()
+        self._fid.close()
+        if unlink:
+            os.remove(self.path)
+
+
+class RingReader(object):
+    '''
+    Reads records from a ring buffer published by a RingWriter, possibly
+    in another process. Records are returned as tuples of floats, with
+    names given by the attribute fields.
+    '''
+
+    def __init__(self, name):
+        '''
+        @param name: The name of the ring buffer (i.e. 'GGA'), or its path.
+        '''
+        self.path = name if os.sep in name else ringpath(name)
+        self._fid = open(self.path, 'rb')
+        self._map = mmap.mmap(self._fid.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.slots, fieldcount = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a gpsparser ring buffer.' % self.path)
+        self.stringtype = struct.unpack_from('8s', self._map,
+                                             _STRINGTYPE_OFFSET)[0].rstrip('\x00')
+        self.fields = [struct.unpack_from('%ds' % _NAMESIZE, self._map,
+                                          _NAMES_OFFSET + _NAMESIZE * idx)[0].rstrip('\x00')
+                       for idx in range(fieldcount)]
+        self._slot = struct.Struct('<Q%ddQ' % fieldcount)
+        self._values = struct.Struct('<%dd' % fieldcount)
+        self._start = _NAMES_OFFSET + _NAMESIZE * fieldcount
+        self._start += -self._start % 8
+        self.next = self.published + 1
+        'The sequence number of the next record to be read.'
+        self.lost = 0
+        'The number of records overwritten before they were read.'
+
+    @property
+    def published(self):
+        ''' The sequence number of the last record published.'''
+        return _PUBLISHED.unpack_from(self._map, _PUBLISHED_OFFSET)[0]
+
+    def get(self, sequence):
+        '''
+        Returns the values of the record with a sequence number, or None if
+        it has not been published or has been overwritten.
+        '''
+        if sequence < 1:
+            return None
+        offset = self._start + (sequence - 1) % self.slots * self._slot.size
+        # In the reverse of the order written: the sequence after the values
+        # shows they were complete, and the one before that they were not
+        # since overwritten.
+        if _PUBLISHED.unpack_from(self._map, offset + self._slot.size - 8)[0] != sequence:
+            return None
+        values = self._values.unpack_from(self._map, offset + 8)
+        if _PUBLISHED.unpack_from(self._map, offset)[0] != sequence:
+            return None
+        return values
+
+    def latest(self):
+        '''
+        Returns the sequence number and values of the last record
+        published, or None if there is none yet.
+        '''
+        for retry in range(3):
+            sequence = self.published
+            if sequence == 0:
+                return None
+            values = self.get(sequence)
+            if values is not None:
+                return sequence, values
+        return None
+
+    def read(self):
+        '''
+        Returns the (sequence, values) of the records published since the
+        last read (or since the reader was opened), skipping any that were
+        overwritten first.
+        '''
+        published = self.published
+        records = []
+        if published - self.next + 1 > self.slots:
+            skipped = published - self.slots + 1
+            self.lost += skipped - self.next
+            self.next = skipped
+        for sequence in xrange(self.next, published + 1):
+            values = self.get(sequence)
+            if values is None:
+                self.lost += 1
+            else:
+                records.append((sequence, values))
+        self.next = published + 1
+        return records
+
+    def close(self):
+        ''' Closes the ring buffer.'''
+        self._map.close()
+        self._fid.close()
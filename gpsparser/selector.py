@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+'''
+Selection of the best position solution at each epoch from several
+receivers logged together (i.e. $GPGGA from an RTK receiver and $INGGA
+from an INS).
+
+A BestSolution takes the parsed fixes of every receiver, keyed by their
+source (by default the talker, see sourcename()), and groups them by GPS
+time into epochs. Once every receiver still reporting has given its fix
+for an epoch, or the epoch is older than a short latency, the best fix
+is returned with its source. Fixes are ranked by fix quality (RTK fixed
+over RTK float over differential over autonomous, see QUALITY_RANK), then
+by the horizontal error given by the receiver's latest GST string, where
+known, then by HDOP.
+
+A receiver that stops reporting for longer than a timeout is no longer
+waited for, so selection fails over to the others without stalling, and
+takes it back when the receiver returns. Only a few epochs are ever held,
+so memory and work per fix are constant.
+
+@author: Val Schmidt
+@organization: Center for Coastal and Ocean Mapping, University of New Hampshire
+@license: GPL
+'''
+import math
+from collections import OrderedDict
+import timestamps
+
+QUALITY_RANK = {4 : 6, 5 : 5, 2 : 4, 9 : 4, 1 : 3, 3 : 3, 6 : 1, 7 : 1, 8 : 1,
+                0 : 0}
+'The rank of each GGA fix quality: RTK fixed, RTK float, differential (or WAAS), autonomous, estimated (dead reckoning), invalid.'
+
+def sourcename(line, stringtype):
+    '''
+    Returns the talker of a sentence (i.e. 'IN' for $INGGA), or '' for
+    proprietary sentences identified by their address alone.
+    '''
+    start = line.find('$')
+    end = line.find(stringtype, start)
+    if start < 0 or end < 0:
+        return ''
+    return line[start + 1:end].rstrip(',')
+
+
+class BestSolution(object):
+    '''
+    Selects the best fix of each epoch from several sources.
+    '''
+    RESOLUTION = 0.01
+    'Fixes within this many seconds of GPS time are of the same epoch.'
+    LATENCY = 0.5
+    'The longest an epoch waits for every source, in seconds of GPS time.'
+    TIMEOUT = 2.0
+    'Sources silent for longer than this, in seconds, are not waited for.'
+    GSTAGE = 1.5
+    'GST errors older than this, in seconds, are not used.'
+    MAXEPOCHS = 100
+    'The most epochs held at once.'
+
+    def __init__(self, latency=None, timeout=None, timefield='datetime',
+                 times='datetime'):
+        '''
+        @param latency: See LATENCY.
+        @param timeout: See TIMEOUT.
+        @param timefield: The field of the fixes holding GPS time.
+        @param times: The format of the fixes' times (see Parser).
+        '''
+        self.latency = self.LATENCY if latency is None else latency
+        self.timeout = self.TIMEOUT if timeout is None else timeout
+        self.timefield = timefield
+        self.times = times
+        self.chosen = OrderedDict()
+        'The number of epochs each source was chosen for.'
+        self.failovers = 0
+        'The number of times the chosen source changed.'
+        self.late = 0
+        'The number of fixes dropped as their epoch was already returned.'
+        self._epochs = {}
+        self._lastseen = {}
+        self._errors = {}
+        self._first = None
+        self._newest = None
+        self._returned = None
+        self._lastsource = None
+
+    def _seconds(self, value):
+        ''' Returns a parsed GPS time (see Parser) in seconds, or None.'''
+        return timestamps.seconds(value, self.times)
+
+    def adderror(self, source, record):
+        '''
+        Adds a GST record, whose horizontal error is used to rank the
+        source's next fixes.
+        '''
+        seconds = self._seconds(record.get('datetime'))
+        try:
+            error = math.hypot(float(record['lat1sigma']),
+                               float(record['lon1sigma']))
+        except (KeyError, TypeError, ValueError):
+            return
+        if seconds is not None and error == error:
+            self._errors[source] = (seconds, error)
+
+    def add(self, source, record):
+        '''
+        Adds a fix from a source.
+
+        @return: A list of the best fixes of the epochs now complete, each a
+        copy of the chosen record with its 'source'.
+        '''
+        seconds = self._seconds(record.get(self.timefield))
+        if seconds is None:
+            return []
+        epoch = int(round(seconds / self.RESOLUTION))
+        # Late fixes still show that their source is reporting.
+        self._lastseen[source] = seconds
+        if self._returned is not None and epoch <= self._returned:
+            self.late += 1
+            return []
+        self._epochs.setdefault(epoch, {})[source] = (self._score(source, seconds,
+                                                                  record), record)
+        if self._newest is None or seconds > self._newest:
+            self._newest = seconds
+        if self._first is None:
+            self._first = seconds
+        return self._complete()
+
+    def flush(self):
+        '''
+        Returns the best fixes of every epoch held, in time order, at the
+        end of a stream. A new stream may then be added.
+        '''
+        results = [self._choose(epoch) for epoch in sorted(self._epochs)]
+        self._lastseen.clear()
+        self._errors.clear()
+        self._first = self._newest = self._returned = None
+        return results
+
+    def _score(self, source, seconds, record):
+        ''' Returns a sort key ranking a fix, greatest best.'''
+        try:
+            quality = QUALITY_RANK.get(int(record.get('quality', 1)), 0)
+        except (TypeError, ValueError):
+            quality = 0
+        error = float('inf')
+        if source in self._errors:
+            errortime, sourceerror = self._errors[source]
+            if abs(seconds - errortime) <= self.GSTAGE:
+                error = sourceerror
+        hdop = float(record.get('hdop', float('nan')))
+        if hdop != hdop:
+            hdop = float('inf')
+        return (quality, -error, -hdop)
+
+    def _complete(self):
+        ''' Returns the best fixes of the epochs that are complete.'''
+        active = set(source for source, seen in self._lastseen.items()
+                     if self._newest - seen <= self.timeout)
+        # Until a latency has passed since the first fix, not every source
+        # may have been seen, so no epoch can be known to be complete.
+        known = self._newest - self._first > self.latency
+        results = []
+        for epoch in sorted(self._epochs):
+            complete = known and active.issubset(self._epochs[epoch])
+            if not (complete or
+                    self._newest - epoch * self.RESOLUTION > self.latency or
+                    len(self._epochs) > self.MAXEPOCHS):
+                break
+            results.append(self._choose(epoch))
+        return results
+
+    def _choose(self, epoch):
+        ''' Removes an epoch, returning its best fix.'''
+        fixes = self._epochs.pop(epoch)
+        self._returned = epoch
+        # Ties keep the source last chosen, rather than switching back and forth.
+        source = max(fixes, key=lambda source: (fixes[source][0],
+                                                source == self._lastsource))
+        self.chosen[source] = self.chosen.get(source, 0) + 1
+        if self._lastsource is not None and source != self._lastsource:
+            self.failovers += 1
+        self._lastsource = source
+        best = OrderedDict(fixes[source][1])
+        best['source'] = source
+        return best
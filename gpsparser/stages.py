@@ -0,0 +1,853 @@
+#!/usr/bin/env python
+'''
+Stages applied to the sentences and records of a parse, around the core
+parsing of gpsparser.
+
+Filters, a Decimator and a Deduplicator test the raw fields of each
+sentence before it is parsed (see GPSString.filter and Parser), a
+BucketAverager and a Summary reduce the parsed records, and RunStats and
+ErrorAggregator account for the run.
+
+@author: Val Schmidt
+@organization: Center for Coastal and Ocean Mapping, University of New Hampshire
+@license: GPL
+'''
+from __future__ import print_function
+import re
+import math
+import operator
+import datetime
+from datetime import timedelta
+import decimal as dec
+from timeit import default_timer as _timer
+from collections import OrderedDict, deque
+import timestamps
+from gpsparser import (GPSString, Parser, SENTENCES, RAW_KINDS, _rawtime,
+                       eprint)
+
+class Filter(object):
+    '''
+    A set of predicates evaluated against the raw fields of a sentence,
+    right after it is split and before any field is converted. Sentences
+    that are rejected never pay for full parsing (or, from the command-line
+    parser, for output formatting).
+
+    A filter is applied by setting the filter attribute of a GPSString
+    before calling parse() or tryparse(). A condition on a field that a
+    sentence type does not have is ignored for that type, but one on a
+    field of no sentence type (i.e. a misspelled name) raises ValueError. A
+    sentence whose field is empty or malformed fails the condition.
+
+    The time window is compared against the sentence's GPS time, qualified
+    by the date in the sentence itself or, failing that, by GPSString.date.
+    Sentences with a time but no date fail the time window.
+    '''
+    OPERATORS = OrderedDict([('<=', operator.le),
+                             ('>=', operator.ge),
+                             ('==', operator.eq),
+                             ('!=', operator.ne),
+                             ('<', operator.lt),
+                             ('>', operator.gt),
+                             ('=', operator.eq)])
+    _where_exp = re.compile('^\s*(?P<name>\w+)\s*(?P<op>' +
+                            '|'.join(OPERATORS.keys()) +
+                            ')\s*(?P<value>\S+)\s*$')
+
+    def __init__(self, where=None, bbox=None, start=None, end=None):
+        '''
+        @param where: A sequence of conditions, either strings of the form
+        'quality>=4' or (name, operator, value) tuples.
+        @param bbox: A (minlat, minlon, maxlat, maxlon) bounding box in
+        decimal degrees.
+        @param start: A datetime.datetime. Earlier sentences are rejected.
+        @param end: A datetime.datetime. Later sentences are rejected.
+        @raise ValueError: If a condition is malformed, or refers to a field
+        of no sentence type.
+        '''
+        self.conditions = []
+        for condition in where or ():
+            if isinstance(condition, basestring):
+                condition = self.parsecondition(condition)
+            self.conditions.append(condition)
+        known = set(name for schema in SENTENCES.values()
+                    for index, name, kind, missing in schema.fields)
+        unknown = self.fieldnames() - known
+        if unknown:
+            raise ValueError('Unknown field(s) in condition: %s' %
+                             ', '.join(sorted(unknown)))
+        if bbox is not None:
+            minlat, minlon, maxlat, maxlon = map(float, bbox)
+            self.conditions.extend([('latitude', '>=', minlat),
+                                    ('latitude', '<=', maxlat),
+                                    ('longitude', '>=', minlon),
+                                    ('longitude', '<=', maxlon)])
+        self.start = self._timekey(start)
+        self.end = self._timekey(end)
+        self._compiled = {}
+
+    @classmethod
+    def parsecondition(cls, condition):
+        '''
+        Parses a condition of the form 'name OP value' (i.e. 'quality>=4')
+        into a (name, operator, value) tuple. The value is converted to a
+        float when possible.
+        '''
+        m = cls._where_exp.match(condition)
+        if not m:
+            raise ValueError('Invalid condition: %s' % condition)
+        value = m.group('value')
+        try:
+            value = float(value)
+        except ValueError:
+            pass
+        return (m.group('name'), m.group('op'), value)
+
+    @staticmethod
+    def _timekey(dts):
+        if dts is None:
+            return None
+        return (dts.toordinal() * 86400 + dts.hour * 3600 + dts.minute * 60 +
+                dts.second + dts.microsecond / 1000000.)
+
+    def fieldnames(self):
+        ''' Returns the names of the fields the conditions refer to.'''
+        return set(name for name, op, value in self.conditions)
+
+    def accept(self, stringtype, fields, date=None):
+        '''
+        Returns True if the raw fields of a sentence satisfy the filter.
+
+        @param stringtype: The string type (i.e. 'GGA').
+        @param fields: The comma delimited fields of the sentence.
+        @param date: A datetime.date qualifying the sentence's time, used
+        when the sentence does not carry its own date.
+        '''
+        try:
+            accept = self._compiled[stringtype]
+        except KeyError:
+            accept = self._compiled[stringtype] = self._compile(SENTENCES[stringtype])
+        return accept(fields, date)
+
+    def _compile(self, schema):
+        ''' Returns a function testing the raw fields of a schema's sentences.'''
+        fields = dict((name, (index, kind)) for index, name, kind, missing
+                      in schema.fields)
+        tests = [(RAW_KINDS[fields[name][1]], fields[name][0],
+                  self.OPERATORS[op], value)
+                 for name, op, value in self.conditions if name in fields]
+        window = (self.start is not None or self.end is not None) and \
+                 'datetime' in fields
+        if window:
+            timeindex = fields['datetime'][0]
+            dateread = None
+            if 'date' in fields:
+                dateread = (RAW_KINDS[fields['date'][1]], fields['date'][0])
+        start, end = self.start, self.end
+
+        def accept(f, date):
+            try:
+                for read, index, op, value in tests:
+                    if not op(read(f, index), value):
+                        return False
+                if window:
+                    if dateread:
+                        day = dateread[0](f, dateread[1])
+                    elif isinstance(date, datetime.date):
+                        day = date.toordinal()
+                    else:
+                        return False
+                    key = day * 86400 + _rawtime(f, timeindex)
+                    if start is not None and key < start:
+                        return False
+                    if end is not None and key > end:
+                        return False
+            except (ValueError, IndexError):
+                return False
+            return True
+        return accept
+
+
+class Decimator(object):
+    '''
+    Reduces the rate of a stream of sentences before they are parsed.
+
+    Each sentence type may be decimated in one of two modes:
+
+        - C{('every', N)} keeps every Nth sentence.
+        - C{('first', S)} keeps the first sentence in each bucket of S
+          seconds of GPS time.
+
+    Sentences are counted and bucketed separately for each address (the
+    talker and string type, i.e. $INGGA), so that in merged logs each
+    receiver's stream is decimated on its own.
+
+    Types that are not listed pass through unchanged. A Decimator is used
+    like a Filter, by setting GPSString.filter. A Filter given to the
+    Decimator is applied first, so that the filtered stream is decimated.
+    To average sentences over buckets of time, see BucketAverager.
+    '''
+    MODES = ('every', 'first')
+    'The modes applied by a Decimator.'
+    SPEC_MODES = MODES + ('mean',)
+    'The modes of parsespec(), of which mean is applied by a BucketAverager.'
+
+    def __init__(self, modes, filter=None):
+        '''
+        @param modes: A dictionary of (mode, value) tuples keyed by string
+        type.
+        @param filter: An optional Filter applied before decimation.
+        @raise ValueError: For a mode other than MODES ('mean' buckets are
+        averaged after parsing, by a BucketAverager).
+        '''
+        for mode, value in modes.values():
+            if mode not in self.MODES:
+                raise ValueError('Unsupported decimation mode: %s' % mode)
+        self.modes = dict(modes)
+        self.filter = filter
+        self._counts = {}
+        self._buckets = {}
+
+    @classmethod
+    def parsespec(cls, spec):
+        '''
+        Parses a command-line decimation specification of the form
+        [TYPE:]MODE:VALUE (i.e. 'every:20' or 'GGA:first:1') into a tuple of
+        (stringtype, mode, value). stringtype is None when not given.
+        The mode may be any of SPEC_MODES: 'mean' specifications are not
+        applied by a Decimator, but by a BucketAverager.
+        '''
+        parts = spec.split(':')
+        if len(parts) == 2:
+            parts.insert(0, None)
+        if len(parts) != 3 or parts[1] not in cls.SPEC_MODES:
+            raise ValueError('Invalid decimation: %s' % spec)
+        stringtype, mode, value = parts
+        value = int(value) if mode == 'every' else float(value)
+        if value <= 0:
+            raise ValueError('Invalid decimation: %s' % spec)
+        return stringtype, mode, value
+
+    def accept(self, stringtype, fields, date=None):
+        '''
+        Returns True if the sentence is kept. See Filter.accept().
+        '''
+        if self.filter is not None and \
+                not self.filter.accept(stringtype, fields, date):
+            return False
+        try:
+            mode, value = self.modes[stringtype]
+        except KeyError:
+            return True
+        # The first field is the address, with the talker.
+        address = fields[0]
+        if mode == 'every':
+            count = self._counts.get(address, 0)
+            self._counts[address] = count + 1
+            return count % value == 0
+        try:
+            timeindex = [index for index, name, kind, missing in
+                         SENTENCES[stringtype].fields if kind == 'time'][0]
+            bucket = _rawtime(fields, timeindex) // value
+        except (IndexError, ValueError):
+            # Let the parser report the bad sentence.
+            return True
+        if isinstance(date, datetime.date):
+            bucket = (date.toordinal(), bucket)
+        if self._buckets.get(address) == bucket:
+            return False
+        self._buckets[address] = bucket
+        return True
+
+
+class Deduplicator(object):
+    '''
+    Drops sentences that have already been seen, as happens when merging
+    redundant or overlapping logs.
+
+    Sentences are keyed either on the whole sentence (key='sentence'; since
+    the checksum has been verified, equal bodies have equal checksums) or on
+    the address (the talker and string type, i.e. $INGGA) and GPS date and
+    time (key='time'), so that the fixes of several receivers for the same
+    epoch are all kept (see selector.BestSolution). Sentences without a
+    GPS time are never dropped when keyed on time. Only a hash of each key is
+    kept, for the most recent window sentences, so memory is bounded. Since
+    logs are nearly time ordered, duplicates arrive close together and a
+    modest window suffices.
+
+    A Deduplicator is used like a Filter, by setting GPSString.filter. A
+    Filter given to the Deduplicator is applied first.
+    '''
+    KEYS = ('sentence', 'time')
+
+    def __init__(self, key='sentence', window=100000, filter=None):
+        '''
+        @param key: 'sentence' or 'time'.
+        @param window: The number of recent sentences remembered.
+        @param filter: An optional Filter applied before deduplication.
+        '''
+        if key not in self.KEYS:
+            raise ValueError('Unsupported deduplication key: %s' % key)
+        self.key = key
+        self.window = window
+        self.filter = filter
+        self.dropped = 0
+        'The number of duplicate sentences dropped.'
+        self._seen = set()
+        self._order = deque()
+        self._timeindex = {}
+
+    def accept(self, stringtype, fields, date=None):
+        '''
+        Returns True if the sentence has not been seen before. See
+        Filter.accept().
+        '''
+        if self.filter is not None and \
+                not self.filter.accept(stringtype, fields, date):
+            return False
+        if self.key == 'sentence':
+            key = hash(tuple(fields))
+        else:
+            try:
+                timeindex = self._timeindex[stringtype]
+            except KeyError:
+                timeindex = self._timeindex[stringtype] = ([
+                    index for index, name, kind, missing in
+                    SENTENCES[stringtype].fields if kind == 'time'] or [None])[0]
+            if timeindex is None or len(fields) <= timeindex:
+                return True
+            # The first field is the address, with the talker.
+            key = hash((fields[0], date, fields[timeindex]))
+        if key in self._seen:
+            self.dropped += 1
+            return False
+        self._seen.add(key)
+        self._order.append(key)
+        if len(self._order) > self.window:
+            self._seen.discard(self._order.popleft())
+        return True
+
+
+class BucketAverager(object):
+    '''
+    Averages parsed records over buckets of time.
+
+    Records (dictionaries of field name and value, all with the same keys)
+    are added one at a time and buffered by column. When a record falls in
+    a new bucket, the buffered records are averaged and returned as a single
+    record. Numeric fields are averaged (ignoring NaN), date-times are
+    averaged as date-times, the categorical fields of CATEGORICAL_FIELDS
+    (i.e. fix quality) take their most frequent value and any other field
+    takes its last value.
+    '''
+    CATEGORICAL_FIELDS = ('quality', 'svs', 'fixstatus', 'mode', 'stationid',
+                          'headingalgorithm', 'imustatus', 'resetflag')
+    'Numeric fields that are counts or codes, which are not averaged.'
+
+    def __init__(self, seconds, timefield='datetime', times='datetime'):
+        '''
+        @param seconds: The length of each bucket, in seconds.
+        @param timefield: The name of the date-time field that is bucketed.
+        @param times: The format of the records' times (see Parser).
+        '''
+        self.seconds = seconds
+        self.timefield = timefield
+        self.times = times
+        self._names = None
+        self._columns = None
+        self._bucket = None
+
+    def _key(self, dts):
+        if isinstance(dts, float):
+            seconds = dts * 86400 if self.times == 'datenum' else dts
+        elif isinstance(dts, tuple):
+            seconds = dts[0] * 604800 + dts[1]
+        elif isinstance(dts, datetime.datetime):
+            seconds = (dts.toordinal() * 86400 + dts.hour * 3600 +
+                       dts.minute * 60 + dts.second + dts.microsecond / 1e6)
+        else:
+            seconds = (dts.hour * 3600 + dts.minute * 60 + dts.second +
+                       dts.microsecond / 1e6)
+        return seconds // self.seconds
+
+    def add(self, record):
+        '''
+        Adds a record.
+
+        @return: The averaged record of the previous bucket when record
+        starts a new one, otherwise None.
+        '''
+        if self.timefield not in record:
+            # Records without a time cannot be bucketed, and pass through.
+            return record
+        if self._names is None:
+            self._names = list(record.keys())
+            self._columns = [[] for name in self._names]
+        bucket = self._key(record[self.timefield])
+        averaged = None
+        if bucket != self._bucket:
+            averaged = self.flush()
+            self._bucket = bucket
+        for column, name in zip(self._columns, self._names):
+            column.append(record[name])
+        return averaged
+
+    def flush(self):
+        '''
+        Returns the averaged record of the current bucket (or None if it is
+        empty) and empties the buffers.
+        '''
+        if not self._columns or not self._columns[0]:
+            return None
+        averaged = OrderedDict()
+        for name, column in zip(self._names, self._columns):
+            if name in self.CATEGORICAL_FIELDS:
+                averaged[name] = self._mode(column)
+            else:
+                averaged[name] = self._mean(column)
+            del column[:]
+        return averaged
+
+    @staticmethod
+    def _mean(column):
+        first = column[0]
+        if isinstance(first, datetime.datetime):
+            offsets = [(value - first).total_seconds() for value in column]
+            return first + timedelta(seconds=sum(offsets) / len(offsets))
+        if isinstance(first, tuple):
+            # GPS weeks and seconds of the week.
+            offsets = [(week - first[0]) * 604800 + seconds
+                       for week, seconds in column]
+            mean = math.fsum(offsets) / len(offsets)
+            weeks = int(mean // 604800)
+            return first[0] + weeks, mean - weeks * 604800
+        if isinstance(first, (int, long, float, dec.Decimal)) and \
+                not isinstance(first, bool):
+            values = [float(value) for value in column]
+            values = [value for value in values if value == value]
+            if not values:
+                return float('nan')
+            return math.fsum(values) / len(values)
+        return column[-1]
+
+    @staticmethod
+    def _mode(column):
+        ''' Returns the most frequent value, the latest of any tie, ignoring NaN.'''
+        counts = {}
+        mode = column[-1]
+        best = 0
+        for value in column:
+            if value != value:
+                continue
+            count = counts[value] = counts.get(value, 0) + 1
+            if count >= best:
+                mode, best = value, count
+        return mode
+
+
+class Summary(object):
+    '''
+    Summary statistics of parsed records, accumulated in a single pass
+    without keeping the records.
+
+    For each numeric field the count, minimum, maximum, mean and standard
+    deviation (by Welford's online algorithm) are kept, ignoring NaN. The
+    discrete fields of HISTOGRAM_FIELDS (i.e. fix quality and the number of
+    satellites) are also counted by value, and the first and last value of
+    each date-time field give the time span, whatever the format of the
+    times (see Parser). The latitude and longitude ranges give the bounding
+    box.
+
+    Summaries of parts of a run, such as files parsed by parallel workers,
+    are combined with merge(), including summaries read back from their
+    JSON form with fromdict().
+    '''
+    HISTOGRAM_FIELDS = ('quality', 'svs', 'fixstatus', 'mode')
+    'Fields counted by value.'
+
+    TIME_FIELDS = ('pctime', 'gpstime')
+    'Fields holding times, which may be numeric (see Parser).'
+
+    def __init__(self, times='datetime'):
+        '''
+        @param times: The format of the records' times (see Parser).
+        '''
+        self.timeformat = times
+        self.records = 0
+        'The number of records added.'
+        self.fields = OrderedDict()
+        'Per numeric field [count, mean, M2, minimum, maximum].'
+        self.histograms = OrderedDict()
+        'Per discrete field, the number of records with each value.'
+        self.times = OrderedDict()
+        'Per date-time field, [first, last].'
+
+    def add(self, record):
+        '''
+        Adds a record, a dictionary of field name and value (i.e. the
+        records written by the command-line parser, or GPSString.fields).
+        '''
+        self.records += 1
+        for name, value in record.items():
+            if name == 'datetime':
+                name = 'gpstime'
+            if name in self.TIME_FIELDS and isinstance(value, (float, tuple)):
+                value = timestamps.seconds(value, self.timeformat)
+                if value != value:
+                    continue
+                value = timestamps.epoch2datetime(value)
+            if isinstance(value, datetime.datetime):
+                span = self.times.get(name)
+                if span is None:
+                    self.times[name] = [value, value]
+                elif value < span[0]:
+                    span[0] = value
+                elif value > span[1]:
+                    span[1] = value
+                continue
+            if name in self.HISTOGRAM_FIELDS:
+                histogram = self.histograms.setdefault(name, {})
+                key = str(value)
+                histogram[key] = histogram.get(key, 0) + 1
+            if not isinstance(value, (int, long, float, dec.Decimal)) or \
+                    isinstance(value, bool):
+                continue
+            value = float(value)
+            if value != value:
+                continue
+            stats = self.fields.get(name)
+            if stats is None:
+                self.fields[name] = [1, value, 0.0, value, value]
+                continue
+            stats[0] += 1
+            delta = value - stats[1]
+            stats[1] += delta / stats[0]
+            stats[2] += delta * (value - stats[1])
+            if value < stats[3]:
+                stats[3] = value
+            elif value > stats[4]:
+                stats[4] = value
+
+    def merge(self, other):
+        ''' Adds the statistics of another Summary to this one.'''
+        self.records += other.records
+        for name, (nb, meanb, m2b, minb, maxb) in other.fields.items():
+            stats = self.fields.get(name)
+            if stats is None:
+                self.fields[name] = [nb, meanb, m2b, minb, maxb]
+                continue
+            na, meana, m2a = stats[0:3]
+            n = na + nb
+            delta = meanb - meana
+            stats[0] = n
+            stats[1] = meana + delta * nb / n
+            stats[2] = m2a + m2b + delta * delta * na * nb / n
+            stats[3] = min(stats[3], minb)
+            stats[4] = max(stats[4], maxb)
+        for name, histogram in other.histograms.items():
+            mine = self.histograms.setdefault(name, {})
+            for key, count in histogram.items():
+                mine[key] = mine.get(key, 0) + count
+        for name, (first, last) in other.times.items():
+            span = self.times.get(name)
+            if span is None:
+                self.times[name] = [first, last]
+            else:
+                span[0] = min(span[0], first)
+                span[1] = max(span[1], last)
+        return self
+
+    def todict(self):
+        ''' Returns the statistics as a dictionary suitable for JSON.'''
+        result = OrderedDict([('records', self.records)])
+        for name, (first, last) in self.times.items():
+            result[name] = OrderedDict([
+                ('start', first.isoformat()),
+                ('end', last.isoformat()),
+                ('span', (last - first).total_seconds())])
+        if 'latitude' in self.fields and 'longitude' in self.fields:
+            latitude = self.fields['latitude']
+            longitude = self.fields['longitude']
+            result['bbox'] = [latitude[3], longitude[3], latitude[4], longitude[4]]
+        fields = OrderedDict()
+        for name, (n, mean, m2, minimum, maximum) in self.fields.items():
+            fields[name] = OrderedDict([('count', n), ('min', minimum),
+                                        ('max', maximum), ('mean', mean),
+                                        ('std', math.sqrt(m2 / n))])
+        result['fields'] = fields
+        result['histograms'] = OrderedDict(
+            (name, OrderedDict(sorted(histogram.items(), key=self._histogramkey)))
+            for name, histogram in self.histograms.items())
+        return result
+
+    @staticmethod
+    def _histogramkey(item):
+        try:
+            return (0, float(item[0]), item[0])
+        except ValueError:
+            return (1, 0.0, item[0])
+
+    @classmethod
+    def fromdict(cls, values):
+        ''' Creates a Summary from the output of todict().'''
+        summary = cls()
+        summary.records = values['records']
+        for name, value in values.items():
+            if isinstance(value, dict) and 'span' in value:
+                summary.times[name] = [cls._parseisotime(value['start']),
+                                       cls._parseisotime(value['end'])]
+        for name, stats in values['fields'].items():
+            n = stats['count']
+            summary.fields[name] = [n, stats['mean'], stats['std'] ** 2 * n,
+                                    stats['min'], stats['max']]
+        for name, histogram in values['histograms'].items():
+            summary.histograms[name] = dict(histogram)
+        return summary
+
+    @staticmethod
+    def _parseisotime(text):
+        for fmt in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+            try:
+                return datetime.datetime.strptime(text, fmt)
+            except ValueError:
+                pass
+        raise ValueError('Unsupported time: %s' % text)
+
+    def tojson(self):
+        ''' Returns the statistics as compact JSON.'''
+        import json
+        return json.dumps(self.todict(), separators=(',', ':'))
+
+
+class RunStats(object):
+    '''
+    Counters and per-stage wall-clock timers for a parsing run.
+
+    A RunStats object keeps track of the number of lines and bytes read, the
+    number of sentences seen of each type, checksum and parse failures and
+    the number of records written. Time spent in each stage of the parse is
+    accumulated when a GPSString is passed to instrument(), which replaces
+    the object's methods with timed wrappers. Nothing is wrapped (and
+    nothing is timed) unless instrument() is called, so a run without
+    statistics pays no overhead.
+
+    Stage times are inclusive: 'parse' includes the time spent in
+    'checksum' and 'handlegpstime', which it calls internally.
+    '''
+    STAGES = ('identify',
+              'stripisotime',
+              'stripepochtime',
+              'strip_timestamp',
+              'checksum',
+              'handlegpstime')
+
+    def __init__(self):
+        self.lines = 0
+        'The number of lines read.'
+        self.bytes = 0
+        'The number of bytes read.'
+        self.unrecognized = 0
+        'The number of lines containing no supported NMEA string.'
+        self.sentences = {}
+        'The number of sentences seen of each type.'
+        self.checksumfailures = 0
+        self.parsefailures = 0
+        self.filtered = 0
+        'The number of sentences rejected by a Filter.'
+        self.duplicates = 0
+        'The number of duplicate sentences dropped.'
+        self.records = 0
+        'The number of records written.'
+        self.stagetimes = {}
+        'Accumulated wall time (seconds) of each stage.'
+        self.starttime = _timer()
+        self.elapsed = 0.0
+
+    def countline(self, line):
+        ''' Counts a line (and its bytes) read from the input.'''
+        self.lines += 1
+        self.bytes += len(line)
+
+    def countsentence(self, stringtype):
+        ''' Counts an identified sentence of type stringtype.'''
+        self.sentences[stringtype] = self.sentences.get(stringtype, 0) + 1
+
+    def timed(self, stage, func):
+        '''
+        Returns a wrapper around func that accumulates its wall time in
+        self.stagetimes[stage].
+        '''
+        stagetimes = self.stagetimes
+        def wrapper(*args, **kwargs):
+            t0 = _timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stagetimes[stage] = stagetimes.get(stage, 0.0) + _timer() - t0
+        return wrapper
+
+    def instrument(self, gps):
+        '''
+        Replaces the methods of a GPSString (or Parser) instance with timed
+        wrappers. Exceptions raised by parse() (and status codes returned by 
+        tryparse()) are counted as checksum or parse failures.
+
+        @param gps: A GPSString or Parser object.
+        '''
+        for stage in self.STAGES:
+            setattr(gps, stage, self.timed(stage, getattr(gps, stage)))
+        if isinstance(gps, Parser):
+            return self._instrumentparser(gps)
+        parse = self.timed('parse', gps.parse)
+        def countedparse(*args, **kwargs):
+            try:
+                return parse(*args, **kwargs)
+            except GPSString.FailedChecksum:
+                self.checksumfailures += 1
+                raise
+            except (GPSString.FailedParsing, dec.InvalidOperation):
+                self.parsefailures += 1
+                raise
+        gps.parse = countedparse
+        tryparse = self.timed('parse', gps.tryparse)
+        def countedtryparse():
+            status = tryparse()
+            if status == GPSString.FAILED_CHECKSUM:
+                self.checksumfailures += 1
+            elif status == GPSString.FAILED_PARSING:
+                self.parsefailures += 1
+            elif status == GPSString.FILTERED:
+                self.filtered += 1
+            return status
+        gps.tryparse = countedtryparse
+        return gps
+
+    def _instrumentparser(self, parser):
+        ''' Times and counts the results of Parser.tryparse().'''
+        tryparse = self.timed('parse', parser.tryparse)
+        def countedtryparse(line):
+            result = tryparse(line)
+            status, stringtype = result[0:2]
+            if status == GPSString.UNRECOGNIZED:
+                self.unrecognized += 1
+                return result
+            self.countsentence(stringtype)
+            if status == GPSString.FAILED_CHECKSUM:
+                self.checksumfailures += 1
+            elif status == GPSString.FAILED_PARSING:
+                self.parsefailures += 1
+            elif status == GPSString.FILTERED and stringtype in parser._schemas:
+                self.filtered += 1
+            return result
+        parser.tryparse = countedtryparse
+        return parser
+
+    def stop(self):
+        ''' Records the total elapsed time of the run.'''
+        self.elapsed = _timer() - self.starttime
+
+    def todict(self):
+        ''' Returns the statistics as a dictionary (suitable for JSON).'''
+        return {'lines': self.lines,
+                'bytes': self.bytes,
+                'unrecognized': self.unrecognized,
+                'sentences': dict(self.sentences),
+                'checksumfailures': self.checksumfailures,
+                'parsefailures': self.parsefailures,
+                'filtered': self.filtered,
+                'duplicates': self.duplicates,
+                'records': self.records,
+                'stagetimes': dict(self.stagetimes),
+                'elapsed': self.elapsed}
+
+    def summary(self):
+        ''' Returns a human readable summary of the statistics.'''
+        out = ["Lines read:         %d (%d bytes)" % (self.lines, self.bytes),
+               "Unrecognized lines: %d" % self.unrecognized,
+               "Sentences:"]
+        for key in sorted(self.sentences.keys()):
+            out.append("    %-16s%d" % (key, self.sentences[key]))
+        out.append("Checksum failures:  %d" % self.checksumfailures)
+        out.append("Parse failures:     %d" % self.parsefailures)
+        out.append("Filtered:           %d" % self.filtered)
+        out.append("Duplicates dropped: %d" % self.duplicates)
+        out.append("Records written:    %d" % self.records)
+        out.append("Elapsed time:       %.3f s" % self.elapsed)
+        if self.elapsed > 0:
+            out.append("Throughput:         %.0f lines/s" %
+                       (self.lines / self.elapsed))
+        out.append("Stage times (inclusive):")
+        for key in sorted(self.stagetimes.keys(),
+                          key=self.stagetimes.get, reverse=True):
+            out.append("    %-16s%.3f s" % (key, self.stagetimes[key]))
+        return '\n'.join(out)
+
+    def write(self, filename=None):
+        '''
+        Writes a summary to stderr or, when filename is given, the
+        statistics in JSON format to filename.
+        '''
+        self.stop()
+        if filename is None or filename == '-':
+            eprint(self.summary())
+        else:
+            with open(filename, 'w') as fid:
+                import json
+                json.dump(self.todict(), fid, indent=2, sort_keys=True)
+
+
+class ErrorAggregator(object):
+    '''
+    Collects parsing failures so they can be reported once, at the end of a
+    run, rather than one line at a time.
+
+    Failures are counted by category (see GPSString.STATUS_NAMES) and
+    string type. A bounded sample of the offending lines is kept for each
+    category.
+    '''
+
+    def __init__(self, maxsamples=5):
+        '''
+        @param maxsamples: The maximum number of offending lines kept for 
+        each category.
+        '''
+        self.maxsamples = maxsamples
+        self.counts = {}
+        'Failure counts keyed by (category, stringtype).'
+        self.samples = {}
+        'Sample offending lines keyed by category.'
+
+    def add(self, status, stringtype, line):
+        '''
+        Records a failure.
+
+        @param status: A status code returned by GPSString.tryparse().
+        @param stringtype: The string type (GPSString.id), or None.
+        @param line: The offending line.
+        '''
+        category = GPSString.STATUS_NAMES.get(status, status)
+        key = (category, stringtype)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        samples = self.samples.setdefault(category, [])
+        if len(samples) < self.maxsamples:
+            samples.append(line.rstrip())
+
+    def total(self):
+        ''' Returns the total number of failures recorded.'''
+        return sum(self.counts.values())
+
+    def summary(self):
+        ''' Returns a human readable summary of the failures.'''
+        out = ["%d lines were not parsed:" % self.total()]
+        for (category, stringtype) in sorted(self.counts.keys()):
+            out.append("    %-16s%-8s%d" % (category, stringtype or '',
+                                            self.counts[(category, stringtype)]))
+        for category in sorted(self.samples.keys()):
+            out.append("Sample lines (%s):" % category)
+            for line in self.samples[category]:
+                out.append("    " + line)
+        return '\n'.join(out)
+
+    def write(self):
+        ''' Writes the summary to stderr if any failures were recorded.'''
+        if self.counts:
+            eprint(self.summary())
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+'''
+Handling of the time stamps added to GPS strings by logging computers, and
+conversion of times for output.
+
+Loggers stamp each line with their own clock in a number of formats (see
+the examples in gpsparser). ISO 8601 and epoch time stamps are parsed
+directly. Other formats fall back to dateutil, which is imported only when
+it is first needed, as it is slow to import.
+
+@author: Val Schmidt
+@organization: Center for Coastal and Ocean Mapping, University of New Hampshire
+@license: GPL
+'''
+import re
+import datetime
+
+ISO_EXP = re.compile('(?P<year>\d\d\d\d)-(?P<month>\d\d)-(?P<day>\d\d)T(?P<hour>\d\\d):(?P<minute>\d\d):(?P<seconds>\d\d\.\d+)')
+'Matches an ISO 8601 time stamp.'
+DATE_EXP = re.compile('\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d?\.?\d+')
+'Matches a time stamp of the form YYYY-MM-DD HH:MM:SS.SSS.'
+
+_epoch_exps = {}
+
+def parsetime(text):
+    '''
+    Parses a date-time string in any format dateutil understands.
+
+    @param text: The date-time string (i.e. '2008-08-13T18:31:00').
+    @return: A datetime object.
+    '''
+    import dateutil.parser
+    return dateutil.parser.parse(text)
+
+def stripisotime(msg):
+    '''
+    Strips an ISO 8601 time stamp from a logged line and returns a datetime
+    object, or None if there is none.
+    '''
+    m = ISO_EXP.search(msg)
+    if m:
+        year =  int( m.group('year'))
+        month = int( m.group('month'))
+        day =   int( m.group('day'))
+        hour =  int(m.group('hour'))
+        minute = int(m.group('minute'))
+        seconds = int(float(m.group('seconds')))
+        microseconds = int( ( float(m.group('seconds')) - seconds ) * 1000000)
+        return datetime.datetime(year, month, day, hour, minute, seconds, microseconds)
+
+def _epochexp(stringtype):
+    ''' Returns the expression matching an epoch time stamp before a string.'''
+    epoch_exp = _epoch_exps.get(stringtype)
+    if epoch_exp is None:
+        epoch_exp = re.compile('(?P<epochtime>\d+\.\d+).*\$??' + str(stringtype))
+        _epoch_exps[stringtype] = epoch_exp
+    return epoch_exp
+
+def stripepochtime(msg, stringtype):
+    '''
+    Strips an epoch time stamp preceding a string of type stringtype from a
+    logged line and returns a datetime object, or None if there is none.
+    '''
+    m = _epochexp(stringtype).search(msg)
+    if m:
+        epochtime = float(m.group('epochtime'))
+        return datetime.datetime.utcfromtimestamp(epochtime)
+
+def strip_timestamp(msg):
+    '''
+    Strips a time stamp from a logged line if possible using dateutil, and
+    returns a datetime object, or None if there is none.
+    '''
+    m = DATE_EXP.search(msg)
+    if m:
+        return parsetime(m.group())
+
+def loggertime(msg, stringtype):
+    '''
+    Returns the logging computer's time stamp of a line as a datetime
+    object, trying ISO 8601, epoch and then other formats, or None if the
+    line has no recognizable time stamp.
+
+    @param msg: The logged line.
+    @param stringtype: The type of the GPS string in the line (i.e. 'GGA').
+    '''
+    dts = stripisotime(msg)
+    if dts is None:
+        dts = stripepochtime(msg, stringtype)
+    if dts is None:
+        dts = strip_timestamp(msg)
+    return dts
+
+_MONTHDAYS = (0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+def _leapyear(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+def loggerepoch(msg, stringtype):
+    '''
+    Returns the logging computer's time stamp of a line in seconds since
+    1970-01-01, as loggertime() does, but reading ISO 8601 and epoch time
+    stamps without creating a datetime object.
+    '''
+    m = ISO_EXP.search(msg)
+    if m:
+        year, month, day = (int(m.group('year')), int(m.group('month')),
+                            int(m.group('day')))
+        hour, minute = int(m.group('hour')), int(m.group('minute'))
+        seconds = float(m.group('seconds'))
+        # Rejected as datetime objects would be, rather than rolled over.
+        if not (1 <= month <= 12 and 1 <= day <= _MONTHDAYS[month]) or \
+                (month == 2 and day == 29 and not _leapyear(year)) or \
+                hour > 23 or minute > 59 or seconds >= 60:
+            raise ValueError('Invalid time stamp: %s' % m.group())
+        return (epochday(year, month, day) * 86400 + hour * 3600 +
+                minute * 60 + seconds)
+    m = _epochexp(stringtype).search(msg)
+    if m:
+        return float(m.group('epochtime'))
+    dts = strip_timestamp(msg)
+    if dts is not None:
+        return datetime2epoch(dts)
+    return None
+
+def epochday(year, month, day):
+    '''
+    Returns the number of days from 1970-01-01 to a date, by integer
+    arithmetic (without creating a date object).
+    '''
+    # Counting years from March, so that leap days fall at their end.
+    if month <= 2:
+        year -= 1
+    era = year // 400
+    yearofera = year - era * 400
+    dayofyear = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    dayofera = yearofera * 365 + yearofera // 4 - yearofera // 100 + dayofyear
+    return era * 146097 + dayofera - 719468
+
+def datetimevec(dts):
+    '''
+    Converts a datetime stamp in the form of a datetime object to a
+    tab-delimited vector of numeric values, YYYY MH DD HR MN SS, which
+    can be converted to MATLABs internal representation of time with
+    datevec().
+
+    @param dts: A datetime object.
+    '''
+    return "\t".join(map(str,( dts.year, dts.month, dts.day, dts.hour, dts.minute, float(dts.second) + float(dts.microsecond) / 1000000 )))
+
+_matlabepochplus1yr = datetime.datetime(1,1,1,0,0,0)
+_yearzero = datetime.timedelta(days=366)
+
+def datetime2mat(dts):
+    ''' Converts a python datetime object to MATLAB serial time.
+
+    MATLAB serial time is decimal days since Jan 1, 1900, 00:00:00'''
+
+    # MATLAB counts from year 0, which datetime does not support, so its
+    # day numbers are the proleptic Gregorian ordinal plus the 366 days of
+    # year 0.
+    dt = dts - _matlabepochplus1yr
+    return (dt.total_seconds() + _yearzero.total_seconds()) / 86400 + 1
+
+_epoch = datetime.datetime(1970, 1, 1)
+
+def datetime2epoch(dts):
+    '''
+    Converts a python datetime object to seconds since 1970-01-01 00:00:00.
+    '''
+    return (dts - _epoch).total_seconds()
+
+def seconds(value, times=None):
+    '''
+    Converts a parsed time (see gpsparser.Parser) to a number: seconds since
+    1970-01-01 00:00:00 for a datetime object, a GPS week and seconds of the
+    week or a MATLAB serial time (when times is 'datenum'), seconds of the
+    day for a time object, or None. Other numbers (epoch times) are returned
+    unchanged.
+
+    @param value: The parsed time.
+    @param times: The format of parsed times, one of Parser.TIMES.
+    '''
+    if isinstance(value, float):
+        if times == 'datenum':
+            return (value - EPOCH_DATENUM) * 86400
+        return value
+    if isinstance(value, tuple):
+        return gpsweek2epoch(*value)
+    if isinstance(value, datetime.datetime):
+        return (value - _epoch).total_seconds()
+    if isinstance(value, datetime.time):
+        return (value.hour * 3600 + value.minute * 60 + value.second +
+                value.microsecond / 1e6)
+    return None
+
+def epoch2datetime(seconds):
+    '''
+    Converts seconds since 1970-01-01 00:00:00 to a datetime object.
+    '''
+    return _epoch + datetime.timedelta(seconds=seconds)
+
+EPOCH_DATENUM = 719529
+'The MATLAB serial day number of 1970-01-01.'
+
+def epoch2datenum(seconds):
+    '''
+    Converts seconds since 1970-01-01 to MATLAB serial time (decimal days
+    from year 0, see datetime2mat()).
+    '''
+    return seconds / 86400.0 + EPOCH_DATENUM
+
+GPS_EPOCH = 315964800
+'The start of GPS time, 1980-01-06, in seconds since 1970-01-01.'
+LEAP_SECONDS = [(362793600, 1), (394329600, 2), (425865600, 3),
+                (489024000, 4), (567993600, 5), (631152000, 6),
+                (662688000, 7), (709948800, 8), (741484800, 9),
+                (773020800, 10), (820454400, 11), (867715200, 12),
+                (915148800, 13), (1136073600, 14), (1230768000, 15),
+                (1341100800, 16), (1435708800, 17), (1483228800, 18)]
+'The UTC times (seconds since 1970-01-01) from which GPS time is ahead of UTC by each number of leap seconds.'
+
+def epoch2gpsweek(seconds):
+    '''
+    Converts a UTC time in seconds since 1970-01-01 to GPS time, allowing
+    for leap seconds (see LEAP_SECONDS).
+
+    @return: A tuple of the GPS week and the seconds of the week.
+    '''
+    leap = 0
+    for start, offset in reversed(LEAP_SECONDS):
+        if seconds >= start:
+            leap = offset
+            break
+    gpsseconds = seconds - GPS_EPOCH + leap
+    week = int(gpsseconds // 604800)
+    # To the microsecond, hiding the rounding of seconds since 1970.
+    return week, round(gpsseconds - week * 604800, 6)
+
+def gpsweek2epoch(week, seconds):
+    '''
+    Converts a GPS week and seconds of the week to a UTC time in seconds
+    since 1970-01-01, the inverse of epoch2gpsweek().
+    '''
+    utc = GPS_EPOCH + week * 604800 + seconds
+    for start, offset in reversed(LEAP_SECONDS):
+        if utc - offset >= start:
+            return utc - offset
+    return utc
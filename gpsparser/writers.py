@@ -0,0 +1,505 @@
+#!/usr/bin/env python
+'''
+Writing of parsed records.
+
+Records are written as lines of tab-delimited text, with date-time stamps
+written as tab-delimited vectors (C{YYYY MM DD HH MM SS}) so that the
+output may be loaded directly into Octave or MATLAB. Numeric times (see
+Parser) are written in full, and GPS weeks and seconds as two columns.
+
+@author: Val Schmidt
+@organization: Center for Coastal and Ocean Mapping, University of New Hampshire
+@license: GPL
+'''
+from __future__ import print_function
+import os
+import time
+import datetime
+from collections import OrderedDict
+import timestamps
+from gpsparser import SENTENCES
+from stages import Summary
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where partitions are written unlocked.
+    fcntl = None
+
+def assign_fieldnames(stringtype):
+    ''' A function to assing fieldnames when writing MATLAB structures.'''
+
+    if stringtype not in SENTENCES:
+        return ""
+    return ['pctime'] + [('gpstime' if name == 'datetime' else name)
+                         for name in SENTENCES[stringtype].output]
+
+def printfields(fieldstoprint,fid=None):
+    ''' A function to print the fields under different circumstances.'''
+    if fid:
+        fid.write("\t".join(map(str,fieldstoprint)).expandtabs() + '\n')
+    else:
+        print("\t".join(map(str,fieldstoprint)).expandtabs())
+
+_TIMEFIELDS = ('pctime', 'datetime')
+
+def _numerictime(value):
+    ''' Formats a numeric time (see Parser) without losing precision.'''
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, tuple):
+        return '%d\t%r' % value
+    return value
+
+class RecordWriter(object):
+    '''
+    Writes parsed records of a single string type as lines of text.
+
+    When a projection is given (see projection.Projection), records are
+    buffered and their positions projected together, a chunk at a time,
+    with the projected coordinates appended to each line.
+    '''
+    PROJECTION_CHUNK = 10000
+    'The number of records projected together.'
+
+    def __init__(self, stringtype, projector=None):
+        '''
+        @param stringtype: The string type of the records (i.e. 'GGA').
+        @param projector: A projection.Projection, or None.
+        '''
+        self.stringtype = stringtype
+        self.project = projector
+        'The projection, which may be replaced with a wrapped version.'
+        self.printfields = printfields
+        'The function writing each line, which may likewise be replaced.'
+        self._pendingrows = []
+        self._pendingpositions = []
+        if projector:
+            import projection
+            self._position = projection.position
+
+    def write(self, record, fid=None):
+        ''' Writes a parsed record, buffering it for projection if requested.'''
+        fieldstoprint = [(timestamps.datetimevec(value)
+                          if isinstance(value, datetime.datetime) else
+                          _numerictime(value) if name in _TIMEFIELDS else value)
+                         for name, value in record.items()]
+        if self.project:
+            self._pendingrows.append((fieldstoprint, fid))
+            self._pendingpositions.append(self._position(self.stringtype, record))
+            if len(self._pendingrows) >= self.PROJECTION_CHUNK:
+                self.flush(fid)
+        else:
+            self.printfields(fieldstoprint,fid)
+
+    def flush(self, fid=None):
+        ''' Projects the buffered positions and prints the buffered records.'''
+        if not self._pendingrows:
+            return
+        columns = [column.tolist()
+                   for column in self.project(*zip(*self._pendingpositions))]
+        for idx, (row, rowfid) in enumerate(self._pendingrows):
+            self.printfields(row + [column[idx] for column in columns], rowfid)
+        del self._pendingrows[:]
+        del self._pendingpositions[:]
+
+class _Partition(object):
+    '''
+    An output file of a PartitionedWriter. Lines are buffered and appended
+    whole, under an exclusive lock, so that several processes may write to
+    the same file without their lines being interleaved.
+    '''
+
+    def __init__(self, path, buffersize):
+        self.path = path
+        self.buffersize = buffersize
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0666)
+        self._lines = []
+        self._size = 0
+
+    def write(self, text):
+        ''' Buffers text, writing the buffer when it is full.'''
+        self._lines.append(text)
+        self._size += len(text)
+        if self._size >= self.buffersize:
+            self.flush()
+
+    def flush(self):
+        ''' Appends the buffered text to the file.'''
+        if not self._lines:
+            return
+        data = ''.join(self._lines)
+        del self._lines[:]
+        self._size = 0
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            while data:
+                data = data[os.write(self._fd, data):]
+        finally:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        ''' Writes the buffered text and closes the file.'''
+        self.flush()
+        os.close(self._fd)
+
+class PartitionedWriter(RecordWriter):
+    '''
+    Writes parsed records of a single string type as lines of text, to a
+    file for each hour or day of GPS time (or the PC time stamp for strings
+    without a time), i.e. C{GGA/2008-226-18.txt} for the 18th hour of the
+    226th day of 2008, however the input logs were cut. Records with no
+    date are written to C{undated.txt}.
+
+    Each record is routed to its partition's file as it is written. A
+    cache of up to maxopen open files is kept, and the least recently used
+    file is closed when another must be opened, so that merged or out of
+    order inputs, which move back and forth between a few partitions, do
+    not open and close files for every record. Lines are buffered for each
+    file, and appended to it whole under a lock (see _Partition), so that
+    several processes may write to the same partitions at once, and
+    existing partitions are appended to rather than overwritten.
+    '''
+    PERIODS = OrderedDict([('hour', (3600, '%Y-%j-%H')),
+                           ('day', (86400, '%Y-%j'))])
+    'The length in seconds and the file name format of each partition period.'
+    MAXOPEN = 64
+    'The most partition files held open at once.'
+    BUFFERSIZE = 65536
+    'The number of bytes buffered for each partition file.'
+
+    def __init__(self, directory, stringtype, period='hour', maxopen=None,
+                 projector=None, times='datetime'):
+        '''
+        @param directory: The directory in which a directory named by the
+        string type holds the partitions.
+        @param stringtype: The string type of the records (i.e. 'GGA').
+        @param period: The period of each partition, 'hour' or 'day'.
+        @param maxopen: The most partition files held open at once.
+        @param projector: A projection.Projection, or None.
+        @param times: The format of the records' times (see Parser).
+        '''
+        if period not in self.PERIODS:
+            raise ValueError('Unsupported partition period: %s' % period)
+        RecordWriter.__init__(self, stringtype, projector)
+        self.directory = os.path.join(directory, stringtype)
+        self.period = period
+        self.maxopen = maxopen or self.MAXOPEN
+        self.times = times
+        self.opened = 0
+        'The number of times partition files were opened.'
+        self._length, self._format = self.PERIODS[period]
+        self._files = OrderedDict()
+        self._bucket = None
+        self._name = None
+        self._last = (None, None)
+
+    def _seconds(self, value):
+        ''' Returns a parsed time (see Parser) in seconds since 1970, or None.'''
+        if isinstance(value, datetime.datetime):
+            return timestamps.datetime2epoch(value)
+        if isinstance(value, float):
+            if self.times == 'datenum':
+                return (value - timestamps.EPOCH_DATENUM) * 86400
+            return value
+        if isinstance(value, tuple):
+            return timestamps.gpsweek2epoch(*value)
+        return None
+
+    def partition(self, record):
+        '''
+        Returns the name of the partition of a parsed record (i.e.
+        '2008-226-18'), or 'undated'.
+        '''
+        seconds = self._seconds(record.get('datetime'))
+        if seconds is None:
+            seconds = self._seconds(record.get('pctime'))
+        if seconds is None or seconds != seconds:
+            return 'undated'
+        bucket = seconds // self._length
+        if bucket != self._bucket:
+            self._bucket = bucket
+            self._name = time.strftime(self._format,
+                                       time.gmtime(bucket * self._length))
+        return self._name
+
+    def _file(self, name):
+        ''' Returns the open file of a partition, opening it if need be.'''
+        if self._last[0] == name:
+            return self._last[1]
+        partition = self._files.pop(name, None)
+        if partition is None:
+            if len(self._files) >= self.maxopen:
+                # Rows waiting to be projected may be for the file closed.
+                RecordWriter.flush(self)
+                self._files.popitem(last=False)[1].close()
+            if not os.path.isdir(self.directory):
+                try:
+                    os.makedirs(self.directory)
+                except OSError:
+                    # Made by another process in the meantime.
+                    if not os.path.isdir(self.directory):
+                        raise
+            partition = _Partition(os.path.join(self.directory, name + '.txt'),
+                                   self.BUFFERSIZE)
+            self.opened += 1
+        # The most recently used file is kept last.
+        self._files[name] = partition
+        self._last = (name, partition)
+        return partition
+
+    def write(self, record, fid=None):
+        ''' Writes a parsed record to its partition's file.'''
+        RecordWriter.write(self, record, self._file(self.partition(record)))
+
+    def flush(self, fid=None):
+        '''
+        Prints any records buffered for projection and writes the buffered
+        lines of every open file, leaving them open for the next input.
+        '''
+        RecordWriter.flush(self)
+        for partition in self._files.values():
+            partition.flush()
+
+    def close(self):
+        ''' Writes the buffered lines and closes every file.'''
+        RecordWriter.flush(self)
+        for partition in self._files.values():
+            partition.close()
+        self._files.clear()
+        self._last = (None, None)
+
+class SummaryWriter(object):
+    '''
+    Writes summary statistics (see stages.Summary) in place of records.
+
+    Records are accumulated as they are written, and the summary of each
+    input is written as a single line of compact JSON when it is flushed at
+    the end of the input. The summaries of all inputs are merged into a
+    total, written by writetotal().
+    '''
+
+    def __init__(self, stringtype, times='datetime'):
+        '''
+        @param stringtype: The string type of the records (i.e. 'GGA').
+        @param times: The format of the records' times (see Parser).
+        '''
+        self.stringtype = stringtype
+        self.times = times
+        self.source = None
+        'The name of the input being summarized.'
+        self.summary = Summary(times)
+        self.total = Summary(times)
+        self.printfields = printfields
+        'The function writing each line, which may be replaced.'
+
+    def write(self, record, fid=None):
+        ''' Adds a parsed record to the summary.'''
+        self.summary.add(record)
+
+    def flush(self, fid=None):
+        ''' Writes the summary of the input, and starts a new one.'''
+        self._writesummary(self.source, self.summary, fid)
+        self.total.merge(self.summary)
+        self.summary = Summary(self.times)
+
+    def writetotal(self, fid=None):
+        ''' Writes the summary of all inputs.'''
+        self._writesummary('total', self.total, fid)
+
+    def _writesummary(self, source, summary, fid):
+        import json
+        values = OrderedDict([('source', source),
+                              ('stringtype', self.stringtype)])
+        values.update(summary.todict())
+        self.printfields([json.dumps(values, separators=(',', ':'))], fid)
+
+class SQLiteWriter(object):
+    '''
+    Writes parsed records to a SQLite database, in a table named by the
+    string type (i.e. GGA), so that they can be queried by time or quality
+    without reading whole files.
+
+    Times are stored as REAL seconds since 1970 (or seconds of the day when
+    a string has no date), in the columns pctime and gpstime, and the table
+    is indexed on gpstime (or pctime for strings without a time). Numeric
+    fields are stored as REAL, or INTEGER for counts and flags, with NaN as
+    NULL. Repeated fields (i.e. the satellites of GSV strings) are stored
+    as comma delimited TEXT.
+
+    Rows are inserted with executemany() in transactions of BATCHSIZE rows.
+    Existing tables are appended to, and each input written is recorded in
+    the table 'sources' with its size and modification time, so that
+    loaded() can skip inputs already written when a directory is parsed
+    again. Each row holds the path of the input file it came from in the
+    column logfile, and the rows of an input that has grown or changed
+    since it was written are deleted, in the transaction inserting its first
+    batch, before it is written again, so that no record is stored twice.
+    '''
+    BATCHSIZE = 10000
+    'The number of rows inserted in each transaction.'
+    INTEGER_FIELDS = ('quality', 'svs', 'stationid', 'messages', 'messagenum',
+                      'visibleSVs', 'PRN', 'headingalgorithm', 'imustatus',
+                      'resetflag', 'zone')
+    'Numeric fields stored as INTEGER.'
+
+    def __init__(self, database, stringtype, batchsize=None, extrafields=()):
+        '''
+        @param database: The file name of the database, which is created if
+        it does not exist.
+        @param stringtype: The string type of the records (i.e. 'GGA').
+        @param batchsize: The number of rows inserted in each transaction.
+        @param extrafields: The names of further numeric fields added to the
+        records (i.e. kinematics.FIELDNAMES), stored as REAL. They are added
+        to an existing table that lacks them.
+        '''
+        import sqlite3
+        self.connection = sqlite3.connect(database)
+        self.stringtype = stringtype
+        self.batchsize = batchsize or self.BATCHSIZE
+        self.source = None
+        'The name of the input being written.'
+        self.rows = 0
+        'The number of rows written from the current input.'
+        self._rows = []
+        self._logfile = None
+        self._started = False
+
+        schema = SENTENCES[stringtype]
+        kinds = dict((item[1], item[2]) for item in schema.fields)
+        groupnames = set(item[1] for item in schema.group)
+        self._names = ['pctime'] + list(schema.output) + list(extrafields)
+        columns = []
+        self._converters = []
+        for name in self._names:
+            if name in ('pctime', 'datetime'):
+                sqltype, converter = 'REAL', timestamps.seconds
+            elif name in groupnames:
+                sqltype, converter = 'TEXT', self._list
+            elif kinds.get(name) == 'string':
+                sqltype, converter = 'TEXT', self._text
+            elif kinds.get(name) == 'status' or name in self.INTEGER_FIELDS:
+                sqltype, converter = 'INTEGER', self._integer
+            else:
+                sqltype, converter = 'REAL', self._real
+            columns.append((self._column(name), sqltype))
+            self._converters.append(converter)
+        columns.append(('logfile', 'TEXT'))
+        timecolumn = 'gpstime' if 'datetime' in schema.output else 'pctime'
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS "%s" (%s)' % (stringtype,
+                ', '.join('%s %s' % column for column in columns)))
+            existing = set(row[1] for row in self.connection.execute(
+                'PRAGMA table_info("%s")' % stringtype))
+            for column in columns:
+                if column[0] not in existing:
+                    self.connection.execute('ALTER TABLE "%s" ADD COLUMN %s %s' %
+                                            ((stringtype,) + column))
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS "%s_%s" ON "%s" (%s)' %
+                (stringtype, timecolumn, stringtype, timecolumn))
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS "%s_logfile" ON "%s" (logfile)' %
+                (stringtype, stringtype))
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS sources (tablename TEXT, '
+                'source TEXT, size INTEGER, mtime REAL, rows INTEGER, '
+                'PRIMARY KEY (tablename, source))')
+        self._insert = 'INSERT INTO "%s" (%s) VALUES (%s)' % (
+            stringtype, ', '.join(column[0] for column in columns),
+            ', '.join('?' * len(columns)))
+
+    @staticmethod
+    def _column(name):
+        return 'gpstime' if name == 'datetime' else name
+
+    @staticmethod
+    def _real(value):
+        if value is None:
+            return None
+        value = float(value)
+        return value if value == value else None
+
+    @staticmethod
+    def _integer(value):
+        if value is None:
+            return None
+        value = float(value)
+        return int(value) if value == value else None
+
+    @staticmethod
+    def _text(value):
+        return None if value is None else str(value)
+
+    @staticmethod
+    def _list(value):
+        return None if value is None else ','.join(map(str, value))
+
+    def loaded(self, filename):
+        '''
+        Returns True if an input file has already been written to the
+        table, and has not changed since.
+        '''
+        try:
+            stat = os.stat(filename)
+        except (OSError, TypeError):
+            return False
+        row = self.connection.execute(
+            'SELECT size, mtime FROM sources WHERE tablename = ? AND source = ?',
+            (self.stringtype, os.path.abspath(filename))).fetchone()
+        return row is not None and row[0] == stat.st_size and \
+               row[1] == stat.st_mtime
+
+    def _sourcefile(self):
+        ''' Returns the path of the input being written, if it is a file.'''
+        if isinstance(self.source, basestring) and os.path.isfile(self.source):
+            return os.path.abspath(self.source)
+        return None
+
+    def write(self, record, fid=None):
+        ''' Adds a parsed record, inserting a batch when it is full.'''
+        if not self._started:
+            self._logfile = self._sourcefile()
+            self._started = True
+        self._rows.append(tuple(converter(record.get(name))
+                                for name, converter
+                                in zip(self._names, self._converters)) +
+                          (self._logfile,))
+        if len(self._rows) >= self.batchsize:
+            self._insertrows()
+
+    def _insertrows(self):
+        with self.connection:
+            if self.rows == 0 and self._logfile is not None:
+                # Any rows from an earlier version of the input are replaced.
+                self.connection.execute(
+                    'DELETE FROM "%s" WHERE logfile = ?' % self.stringtype,
+                    (self._logfile,))
+            self.connection.executemany(self._insert, self._rows)
+        self.rows += len(self._rows)
+        del self._rows[:]
+
+    def flush(self, fid=None):
+        '''
+        Inserts the remaining rows of the input and records it in the table
+        'sources'.
+        '''
+        if not self._started:
+            self._logfile = self._sourcefile()
+        self._insertrows()
+        if self._logfile is not None:
+            stat = os.stat(self._logfile)
+            with self.connection:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)',
+                    (self.stringtype, self._logfile,
+                     stat.st_size, stat.st_mtime, self.rows))
+        self.rows = 0
+        self._logfile = None
+        self._started = False
+
+    def close(self):
+        ''' Closes the database.'''
+        self.connection.close()
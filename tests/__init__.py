@@ -0,0 +1,26 @@
+'''
+Tests of the gpsparser package (run with C{python -m pytest} from the top
+of the source tree).
+
+@author: Val Schmidt
+@organization: Center for Coastal and Ocean Mapping, University of New Hampshire
+@license: GPL
+'''
+import operator
+
+def sentence(body, prefix=''):
+    '''
+    Returns a NMEA sentence with a valid checksum.
+
+    @param body: The sentence between the '$' and the '*' (i.e.
+    'GPGGA,...').
+    @param prefix: Text before the sentence, such as a logger time stamp.
+    '''
+    checksum = reduce(operator.xor, map(ord, body), 0)
+    return '%s$%s*%02X' % (prefix, body, checksum)
+
+def gga(time='183000.00', latitude='7120.10000', longitude='15651.72629',
+        quality='4', talker='GP', prefix=''):
+    ''' Returns a GGA sentence with the given fields.'''
+    return sentence('%sGGA,%s,%s,N,%s,W,%s,11,0.8,-1.06,M,-20.0,M,,' %
+                    (talker, time, latitude, longitude, quality), prefix)
@@ -0,0 +1,45 @@
+'''
+Tests of the command-line parser.
+'''
+import os
+import subprocess
+import sys
+from tests import gga, sentence
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'gpsparser', 'gpsparser.py')
+
+
+def _run(lines, *args):
+    ''' Parses lines from stdin, returning stdout and stderr.'''
+    process = subprocess.Popen([sys.executable, SCRIPT] + list(args),
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    out, err = process.communicate(''.join(line + '\n' for line in lines))
+    assert process.returncode == 0, err
+    return out, err
+
+
+def test_error_summary_counts_unrecognized_lines_by_default():
+    lines = [gga(), 'not a sentence', gga()[:-2] + '00', sentence('GPXYZ,1')]
+    out, err = _run(lines, '-s', 'GGA')
+    assert len(out.splitlines()) == 1
+    assert err.startswith('3 lines were not parsed:')
+    assert 'unrecognized' in err and 'failed checksum' in err
+    assert 'Unrecognized NMEA string' not in err
+
+
+def test_stats_report_counts_the_run(tmpdir):
+    import json
+    report = str(tmpdir.join('stats.json'))
+    lines = [gga(), gga(quality='1'), gga()[:-2] + '00', 'not a sentence']
+    out, err = _run(lines, '-s', 'GGA', '--where', 'quality>=4',
+                    '--stats', report)
+    assert len(out.splitlines()) == 1
+    with open(report) as fid:
+        stats = json.load(fid)
+    assert stats['lines'] == 4
+    assert stats['sentences'] == {'GGA': 3}
+    assert (stats['checksumfailures'], stats['filtered'],
+            stats['unrecognized'], stats['records']) == (1, 1, 1, 1)
+    assert stats['stagetimes']['parse'] > 0
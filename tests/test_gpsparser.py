@@ -0,0 +1,136 @@
+'''
+Tests of the core parsing module.
+'''
+import datetime
+import os
+import pytest
+from gpsparser.gpsparser import GPSString, Parser, SENTENCES
+from tests import sentence, gga
+
+
+def test_gpsstring_tryparse_parses_valid_string():
+    string = GPSString(gga())
+    assert string.tryparse() == GPSString.PARSED
+    assert float(string.latitude) == 71.335
+
+def test_gpsstring_tryparse_bad_minutes_fails_parsing():
+    # Used to print the line and exit the process.
+    assert GPSString(gga(time='18xx00.00')).tryparse() == GPSString.FAILED_PARSING
+
+def test_gpsstring_tryparse_bad_seconds_fails_parsing():
+    assert GPSString(gga(time='1830ab.00')).tryparse() == GPSString.FAILED_PARSING
+
+def test_gpsstring_tryparse_bad_checksum():
+    line = gga()[:-2] + '00'
+    assert GPSString(line).tryparse() == GPSString.FAILED_CHECKSUM
+
+def test_gpsstring_tryparse_unrecognized():
+    assert GPSString(sentence('GPXYZ,1,2,3')).tryparse() == GPSString.UNRECOGNIZED
+
+
+@pytest.mark.parametrize('times', ['datetime', 'epoch'])
+def test_parser_tryparse_damaged_logger_time_fails_parsing(times):
+    parser = Parser(['GGA'], numeric='float', times=times)
+    line = gga(prefix='RTK1_GPS DATA 2008-13-13T18:31:00.000000 ')
+    status, stringtype, record = parser.tryparse(line)
+    assert (status, stringtype, record) == (GPSString.FAILED_PARSING, 'GGA', None)
+
+def test_parser_tryparse_statuses():
+    parser = Parser(['GGA'])
+    assert parser.tryparse(gga(prefix='RTK1_GPS DATA 2008-08-13T18:31:00.000000 '))[0] \
+        == GPSString.PARSED
+    assert parser.tryparse(gga()[:-2] + '00')[0] == GPSString.FAILED_CHECKSUM
+    assert parser.tryparse(gga(latitude='71x0.1'))[0] == GPSString.FAILED_PARSING
+    assert parser.tryparse(sentence('GPHDT,1.0,T'))[0] == GPSString.FILTERED
+    assert parser.tryparse('no sentence here')[0] == GPSString.UNRECOGNIZED
+
+
+@pytest.mark.parametrize('numeric', ['decimal', 'float'])
+def test_parser_hdt_without_heading_parses_nan(numeric):
+    status, stringtype, record = Parser(['HDT'], numeric=numeric).tryparse(
+        sentence('GPHDT,,T'))
+    assert status == GPSString.PARSED
+    assert record.heading != record.heading
+
+def test_gpsstring_hdt_without_heading_parses():
+    string = GPSString(sentence('GPHDT,,T'))
+    assert string.tryparse() == GPSString.PARSED
+    assert string.heading.is_nan()
+
+
+PREFIX = 'RTK1_GPS DATA 2008-08-13T18:31:45.000000 '
+DATE = datetime.date(2008, 8, 13)
+TESTSTRINGS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'teststrings.txt')
+
+NEW_SENTENCES = [
+    ('GPGLL,7120.93722,N,15651.79100,W,183145.00,A,A',
+     {'latitude': 71.3489536667, 'longitude': -156.8631833333,
+      'fixstatus': 1}),
+    ('GPPAT,183145.00,7120.93722,N,15651.79100,W,00020.69,140.2092,-000.24,'
+     '001.52,0.0016,0.0143,0',
+     {'altitude': 20.69, 'heading': 140.2092, 'pitch': -0.24, 'roll': 1.52,
+      'mrms': 0.0016, 'brms': 0.0143, 'resetflag': 0}),
+    ('HCHDG,98.3,0.0,E,12.6,W',
+     {'heading': 98.3, 'deviation': 0.0, 'magneticvariation': -12.6}),
+    ('GNGNS,183145.00,7120.93722,N,15651.79100,W,AAN,12,0.8,20.7,-20.0,1.5,0021',
+     {'latitude': 71.3489536667, 'mode': 'AAN', 'svs': 12, 'hdop': 0.8,
+      'antennaheight': 20.7, 'geoid': -20.0}),
+    ]
+
+def _parse(line, **options):
+    status, stringtype, record = Parser(**options).tryparse(line)
+    assert status == GPSString.PARSED
+    return record._asdict()
+
+@pytest.mark.parametrize('body, expected', NEW_SENTENCES)
+def test_parser_new_sentences(body, expected):
+    record = _parse(sentence(body, PREFIX), numeric='float')
+    for name, value in expected.items():
+        if isinstance(value, float):
+            assert abs(record[name] - value) < 1e-9, name
+        else:
+            assert record[name] == value, name
+    if 'datetime' in record:
+        assert record['datetime'] == datetime.datetime(2008, 8, 13, 18, 31, 45)
+
+@pytest.mark.parametrize('body, expected', NEW_SENTENCES)
+def test_parser_matches_gpsstring(body, expected):
+    line = sentence(body, PREFIX)
+    record = _parse(line, date=DATE)
+    string = GPSString(line)
+    string.date = DATE
+    assert string.tryparse() == GPSString.PARSED
+    stringtype = string.id
+    for name in SENTENCES[stringtype].output:
+        assert record[name] == getattr(string, name), name
+
+@pytest.mark.parametrize('body, missing', [
+    ('GPGLL,,,,,183145.00,V,N', ['latitude', 'longitude']),
+    ('GPPAT,183145.00,7120.93722,N,15651.79100,W,00020.69,,,,,,',
+     ['heading', 'pitch', 'roll', 'mrms', 'brms', 'resetflag']),
+    ('HCHDG,98.3,,,,', ['deviation', 'magneticvariation']),
+    ('GNGNS,183145.00,,,,,NNN,00,,,,,', ['latitude', 'longitude', 'hdop',
+                                         'antennaheight', 'geoid']),
+    ])
+def test_parser_new_sentences_missing_optional_fields(body, missing):
+    record = _parse(sentence(body, PREFIX), numeric='float')
+    for name in missing:
+        assert record[name] != record[name], name
+
+@pytest.mark.parametrize('body', [
+    'GPGLL,7120.93722,N,15651.79100,W,,A,A',
+    'GPPAT,,7120.93722,N,15651.79100,W,00020.69,140.2,-0.24,1.52,0.0016,0.0143,0',
+    'HCHDG,,0.0,E,12.6,W',
+    'GNGNS,183145.00,7120.93722,N,15651.79100,W,AAN,,0.8,20.7,-20.0,,',
+    ])
+def test_parser_new_sentences_missing_required_field_fails(body):
+    status = Parser(numeric='float').tryparse(sentence(body, PREFIX))[0]
+    assert status == GPSString.FAILED_PARSING
+
+def test_parser_teststrings_gll():
+    with open(TESTSTRINGS) as fid:
+        line = [line for line in fid if '$GPGLL' in line][0]
+    record = _parse(line, numeric='float', stringtypes=['GLL'])
+    assert record['fixstatus'] == 1
+    assert abs(record['latitude'] - 71.3489536667) < 1e-9
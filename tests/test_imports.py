@@ -0,0 +1,41 @@
+'''
+Tests that importing the package stays fast, with heavy dependencies
+loaded only when their features are used.
+'''
+import os
+import sys
+import subprocess
+
+IMPORT_BUDGET = 0.05
+'The most seconds importing the parser, writers and command line may take (about 0.015 s is measured).'
+HEAVY_MODULES = ('dateutil', 'numpy', 'scipy', 'json', 'argparse', 'sqlite3',
+                 'bz2', 'lzma', 'mmap', 'socket')
+'Modules that must not be loaded by importing the package.'
+
+_SCRIPT = '''
+import sys, time
+start = time.time()
+import gpsparser.gpsparser, gpsparser.cli, gpsparser.writers, gpsparser.readers
+elapsed = time.time() - start
+print(repr(elapsed))
+print(' '.join(sorted(sys.modules)))
+'''
+
+def _importpackage():
+    ''' Imports the package in a fresh interpreter, returning (seconds, modules).'''
+    # Compiled modules are cached, so that only importing them is timed.
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    output = subprocess.check_output([sys.executable, '-c', _SCRIPT], env=env)
+    elapsed, modules = output.decode('ascii').splitlines()
+    return float(elapsed), set(modules.split())
+
+def test_import_time_within_budget():
+    # The best of several runs, so that a busy machine does not fail the test.
+    elapsed = min(_importpackage()[0] for run in range(3))
+    assert elapsed < IMPORT_BUDGET, 'Import took %.3f s' % elapsed
+
+def test_heavy_dependencies_not_imported():
+    modules = _importpackage()[1]
+    loaded = [name for name in HEAVY_MODULES if name in modules]
+    assert not loaded
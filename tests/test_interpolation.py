@@ -0,0 +1,33 @@
+'''
+Tests of the interpolation of tracks.
+'''
+import pytest
+np = pytest.importorskip('numpy')
+from gpsparser.gpsparser import Parser
+from gpsparser.interpolation import Track
+from tests import gga
+
+PREFIX = 'RTK1_GPS DATA 2008-08-13T18:30:00.000000 '
+
+
+def _records(times):
+    parser = Parser(['GGA'], numeric='float', times=times)
+    return [parser.parse(gga(time=time, latitude=latitude, prefix=PREFIX))._asdict()
+            for time, latitude in [('183000.00', '7120.00000'),
+                                   ('183002.00', '7120.12000')]]
+
+
+@pytest.mark.parametrize('times', ['epoch', 'datenum', 'gpsweek'])
+def test_track_fromrecords_numeric_times_match_datetime(times):
+    expected = Track.fromrecords('GGA', _records('datetime'))
+    track = Track.fromrecords('GGA', _records(times), times=times)
+    assert track.times.size == 2
+    assert np.allclose(track.times, expected.times, rtol=0, atol=1e-3)
+    # Datenums hold times to some microseconds.
+    result = track.interpolate(expected.times[:1] + 1.0)
+    assert abs(result['latitude'][0] - (71 + 20.06 / 60)) < 1e-7
+    assert not result['gap'][0]
+
+def test_track_fromrecords_unsupported_times():
+    with pytest.raises(ValueError):
+        Track.fromrecords('GGA', _records('epoch'), times='julian')
@@ -0,0 +1,57 @@
+'''
+Tests of the kinematics computed from consecutive fixes.
+'''
+import pytest
+np = pytest.importorskip('numpy')
+from gpsparser.kinematics import Kinematics, FIELDNAMES
+
+NAN = float('nan')
+
+
+def _fixes(count=50):
+    ''' Fixes a second apart, heading north east, with a few missing.'''
+    rows = []
+    for i in range(count):
+        latitude = 43.0 + i * 1e-5
+        if i in (7, 23):
+            latitude = NAN
+        rows.append({'datetime': 1218652200.0 + i + (5 if i > 30 else 0),
+                     'latitude': latitude, 'longitude': -70.0 + i * 1e-5,
+                     'antennaheight': 10.0 + i * 0.1, 'geoid': -20.0})
+    return rows
+
+def _stream(chunksize, maxgap=None):
+    kinematics = Kinematics('GGA', maxgap, times='epoch')
+    return [tuple(record[name] for name in FIELDNAMES)
+            for record in kinematics.stream(_fixes(), chunksize)]
+
+
+@pytest.mark.parametrize('chunksize', [1, 2, 7, 49])
+def test_kinematics_do_not_depend_on_chunks(chunksize):
+    expected = np.array(_stream(None, maxgap=3))
+    result = np.array(_stream(chunksize, maxgap=3))
+    assert result.shape == expected.shape == (50, 4)
+    assert np.array_equal(np.isnan(result), np.isnan(expected))
+    assert np.allclose(result[~np.isnan(result)], expected[~np.isnan(expected)],
+                       rtol=1e-12, atol=1e-9)
+
+def test_kinematics_rates_nan_across_gaps_and_missing_fixes():
+    result = np.array(_stream(None, maxgap=3))
+    speed, course, verticalrate, distance = result.T
+    assert np.isnan(speed[0]) and distance[0] == 0
+    # Missing positions, and the fix across the 6 second gap.
+    assert np.isnan(speed[[7, 23, 31]]).all()
+    assert np.isnan(distance[[7, 23]]).all()
+    assert not np.isnan(speed[[8, 24, 32]]).any()
+    assert np.allclose(verticalrate[1:7], 0.1)
+    assert np.all(np.diff(distance[~np.isnan(distance)]) > 0)
+    assert np.all((course[1:7] > 0) & (course[1:7] < 90))
+
+def test_kinematics_across_antimeridian():
+    kinematics = Kinematics()
+    speed, course, verticalrate, distance = kinematics.compute(
+        [0.0, 1.0], [0.0, 0.0], [179.99999, -179.99999])
+    # 2e-5 degrees of longitude at the equator is about 2.2 m.
+    assert abs(speed[1] - 2.226) < 0.01
+    assert abs(course[1] - 90.0) < 1e-6
+    assert np.isnan(verticalrate[1])
@@ -0,0 +1,64 @@
+'''
+Tests of the monitoring of data rates.
+'''
+import datetime
+from gpsparser.monitor import RateMonitor
+from tests import gga
+
+START = datetime.datetime(2008, 8, 13, 18, 30)
+
+
+def _line(seconds, loggerseconds=None, stamp=None):
+    ''' A GGA line at GPS time START + seconds, logged a minute later.'''
+    if loggerseconds is None:
+        loggerseconds = seconds + 60
+    gpstime = START + datetime.timedelta(seconds=seconds)
+    stamp = stamp or (START + datetime.timedelta(seconds=loggerseconds)).strftime(
+        '%Y-%m-%dT%H:%M:%S.%f')
+    return gga(time=gpstime.strftime('%H%M%S.%f')[:9],
+               prefix='RTK1_GPS DATA %s ' % stamp)
+
+def _monitor(lines):
+    monitor = RateMonitor()
+    events = []
+    for line in lines:
+        events.extend(monitor.add(line))
+    return monitor, events
+
+
+def test_monitor_gap():
+    monitor, events = _monitor(_line(i) for i in range(10) + range(15, 20))
+    assert [(event['clock'], event['event'], event['interval'])
+            for event in events] == [('gps', 'gap', 6.0), ('logger', 'gap', 6.0)]
+    assert events[0]['time'] == '2008-08-13T18:30:15'
+    stream = monitor.report()['GPGGA']
+    assert stream['count'] == 15
+    assert stream['gps']['gaps'] == 1 and stream['gps']['longestgap'] == 6.0
+
+def test_monitor_rate_change():
+    seconds = range(10) + range(10, 40, 2)
+    monitor, events = _monitor(_line(i) for i in seconds)
+    rates = [event for event in events if event['event'] == 'rate']
+    assert [(event['clock'], event['interval'], event['nominal'])
+            for event in rates] == [('gps', 2.0, 1.0), ('logger', 2.0, 1.0)]
+    assert not [event for event in events if event['event'] == 'gap']
+    assert monitor.report()['GPGGA']['gps']['nominal'] == 2.0
+
+def test_monitor_clock_drift():
+    # The logger clock gains 100 microseconds a second.
+    monitor, events = _monitor(_line(i, 60 + i * 1.0001) for i in range(100))
+    stream = monitor.report()['GPGGA']
+    assert abs(stream['offset'] - 60) < 1e-6
+    assert abs(stream['drift'] - 100) < 1
+    assert events == []
+
+def test_monitor_damaged_logger_stamp():
+    lines = [_line(i) for i in range(5)]
+    lines[2] = _line(2, stamp='2008-13-13T18:31:02.000000')
+    monitor, events = _monitor(lines)
+    stream = monitor.report()['GPGGA']
+    assert stream['count'] == 5
+    # Only the logger clock loses the damaged line.
+    assert stream['gps']['intervals'] == 4
+    assert stream['logger']['intervals'] == 3
+    assert events == []
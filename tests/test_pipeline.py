@@ -0,0 +1,64 @@
+'''
+Tests of the pipelined processing of logs.
+'''
+import itertools
+import threading
+import time
+import pytest
+from gpsparser.pipeline import Pipeline
+
+
+def _double(batch):
+    return [2 * item for item in batch]
+
+def _waitforthreads(count, timeout=5.0):
+    ''' Waits for the number of running threads to fall to count.'''
+    deadline = time.time() + timeout
+    while threading.active_count() > count and time.time() < deadline:
+        time.sleep(0.01)
+    return threading.active_count()
+
+
+def test_records_come_out_in_input_order():
+    # Small batches and queues, so the stages run well ahead of each other.
+    pipeline = Pipeline(range(1000), [_double, _double], batchsize=7,
+                        queuesize=2)
+    assert list(pipeline) == [4 * item for item in range(1000)]
+
+
+def test_stage_exception_reaches_the_caller():
+    def stage(batch):
+        if 50 in batch:
+            raise ValueError('bad batch')
+        return batch
+    before = threading.active_count()
+    results = []
+    with pytest.raises(ValueError, match='bad batch'):
+        for item in Pipeline(range(100), [stage], batchsize=10):
+            results.append(item)
+    # The batches before the failure are passed on first.
+    assert results == range(50)
+    assert _waitforthreads(before) == before
+
+
+def test_reader_exception_reaches_the_caller():
+    def lines():
+        yield 'a'
+        raise IOError('truncated')
+    with pytest.raises(IOError, match='truncated'):
+        list(Pipeline(lines(), [_double], batchsize=1))
+
+
+def test_stopping_early_shuts_the_threads_down():
+    before = threading.active_count()
+    source = itertools.count()
+    pipeline = iter(Pipeline(source, [_double, _double], batchsize=10,
+                             queuesize=2))
+    assert [next(pipeline) for idx in range(5)] == [0, 4, 8, 12, 16]
+    assert threading.active_count() == before + 3
+    pipeline.close()
+    assert _waitforthreads(before) == before
+    # The reader stopped reading rather than draining an endless log.
+    position = next(source)
+    time.sleep(3 * Pipeline.TIMEOUT)
+    assert next(source) == position + 1
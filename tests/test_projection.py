@@ -0,0 +1,35 @@
+'''
+Tests of the projection stage.
+'''
+import pytest
+np = pytest.importorskip('numpy')
+from gpsparser.projection import Projection
+
+NAN = float('nan')
+
+
+def test_utm_zone_from_first_fix():
+    projection = Projection('utm')
+    easting, northing, zone = projection([NAN, 71.335], [NAN, -156.862], [0, 0])
+    assert projection.zone == 4
+    assert np.isnan(easting[0]) and np.isnan(northing[0])
+    assert zone[1] == 4 and easting[1] > 0
+
+def test_utm_zone_deferred_until_a_fix():
+    projection = Projection('utm')
+    columns = projection([NAN], [NAN], [NAN])
+    assert projection.zone is None
+    assert all(np.isnan(column[0]) for column in columns)
+    projection([43.1], [-70.9], [0])
+    assert projection.zone == 19
+
+def test_enu_origin_from_first_fix():
+    projection = Projection('enu')
+    projection([NAN], [NAN], [NAN])
+    assert projection.origin is None
+    east, north, up = projection([NAN, 43.1, 43.1], [NAN, -70.9, -70.9],
+                                 [NAN, 10.0, 12.0])
+    assert projection.origin == (43.1, -70.9, 10.0)
+    assert np.isnan(east[0])
+    assert abs(east[1]) < 1e-6 and abs(north[1]) < 1e-6 and abs(up[1]) < 1e-6
+    assert abs(up[2] - 2.0) < 1e-6
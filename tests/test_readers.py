@@ -0,0 +1,200 @@
+'''
+Tests of reading and merging logs.
+'''
+import bz2
+import gzip
+import os
+import threading
+import time
+import pytest
+from gpsparser.readers import LogMerger, LogReader, Inventory, linetime
+from tests import gga, sentence
+
+
+def _line(second, stamp=None, talker='GP'):
+    ''' A GGA line logged at 18:31:SS, with the GPS time a minute earlier.'''
+    stamp = stamp or '2008-08-13T18:31:%02d.000000' % second
+    return gga(time='1830%02d.00' % second, talker=talker,
+               prefix='RTK1_GPS DATA %s ' % stamp) + '\n'
+
+def _writelogs(tmpdir, *logs):
+    paths = []
+    for idx, lines in enumerate(logs):
+        path = tmpdir.join('log%d.txt' % idx)
+        path.write(''.join(lines))
+        paths.append(str(path))
+    return paths
+
+def _merge(paths, key='logger'):
+    merger = LogMerger(paths, key)
+    try:
+        return list(merger)
+    finally:
+        merger.close()
+
+
+def test_merge_orders_lines_by_time(tmpdir):
+    paths = _writelogs(tmpdir, [_line(0), _line(2), _line(4)],
+                       [_line(1, talker='IN'), _line(3, talker='IN')])
+    for key in LogMerger.KEYS:
+        assert [linetime(line, key) % 60 for line in _merge(paths, key)] == \
+            [0, 1, 2, 3, 4]
+
+def test_merge_lines_without_time_follow_the_line_before(tmpdir):
+    paths = _writelogs(tmpdir, ['header\n', _line(0), 'comment\n', _line(3)],
+                       [_line(1, talker='IN'), _line(2, talker='IN')])
+    lines = _merge(paths)
+    assert lines[0] == 'header\n'
+    assert lines.index('comment\n') == lines.index(_line(0)) + 1
+    assert lines.index('comment\n') < lines.index(_line(1, talker='IN'))
+
+def test_merge_damaged_stamp_keeps_the_time_before(tmpdir):
+    damaged = _line(5, stamp='2008-13-13T18:31:01.000000')
+    assert linetime(damaged) is None
+    paths = _writelogs(tmpdir, [_line(0), damaged, _line(3)],
+                       [_line(1, talker='IN'), _line(2, talker='IN')])
+    lines = _merge(paths)
+    assert len(lines) == 5
+    assert lines.index(damaged) == lines.index(_line(0)) + 1
+
+
+def _inventorylines():
+    return [_line(0), 'a stray $ sign\n', _line(1, talker='IN'),
+            sentence('PTNL,GGK,183001.00,081308,7120.1,N,15651.7,W,3,11,0.8,'
+                     'EHT-1.06,M', 'RTK1_GPS DATA 2008-08-13T18:31:01.500000 ') + '\n',
+            sentence('PASHR,183001.00,1.0,T,0.1,0.2,0.0,0.1,0.1,0.1,1,1') + '\n',
+            _line(2), sentence('GPXYZ,1,2') + '\n']
+
+def _inventory(source, loggertimes=True):
+    inventory = Inventory(loggertimes)
+    inventory.scan(source)
+    return inventory
+
+
+def test_inventory_counts(tmpdir):
+    path = tmpdir.join('log.txt')
+    path.write(''.join(_inventorylines()))
+    inventory = _inventory(str(path))
+    assert dict(inventory.counts) == {'GPGGA': 2, 'INGGA': 1, 'PTNL,GGK': 1,
+                                      'PASHR': 1, 'GPXYZ': 1}
+    assert inventory.count('GGA') == 3
+    assert inventory.lines == 7
+    sentences = inventory.todict()['sentences']
+    assert sentences['PTNL,GGK']['talker'] == 'PTNL'
+    assert sentences['PTNL,GGK']['stringtype'] == 'GGK'
+    assert sentences['PASHR']['talker'] == ''
+    assert not sentences['GPXYZ']['supported']
+    assert sentences['GPGGA']['first'] == '2008-08-13T18:31:00'
+    assert sentences['GPGGA']['last'] == '2008-08-13T18:31:02'
+
+def test_inventory_counts_across_blocks(tmpdir, monkeypatch):
+    monkeypatch.setattr(LogReader, 'BLOCKSIZE', 50)
+    path = tmpdir.join('log.txt')
+    path.write(''.join(_inventorylines() * 3))
+    inventory = _inventory(str(path))
+    assert inventory.count('GGA') == 9
+    assert inventory.counts['PTNL,GGK'] == 3
+
+@pytest.mark.parametrize('opener', [gzip.open, bz2.BZ2File])
+def test_inventory_of_compressed_log(tmpdir, opener):
+    path = str(tmpdir.join('log.txt.z'))
+    fid = opener(path, 'wb')
+    fid.write(''.join(_inventorylines()))
+    fid.close()
+    inventory = _inventory(path)
+    assert inventory.count('GGA') == 3
+    assert inventory.bytes == len(''.join(_inventorylines()))
+
+def test_inventory_damaged_first_and_last_stamps(tmpdir):
+    path = tmpdir.join('log.txt')
+    path.write(_line(0, stamp='2008-13-13T18:31:00.000000') + _line(1) +
+               _line(2, stamp='2008-08-13T25:31:02.000000'))
+    sentences = _inventory(str(path)).todict()['sentences']
+    assert sentences['GPGGA']['count'] == 3
+    assert sentences['GPGGA']['first'] is None
+    assert sentences['GPGGA']['last'] is None
+
+
+def _readerlines(count=200):
+    return [_line(idx % 60) for idx in range(count)]
+
+def _compress(path, opener, lines):
+    fid = opener(path, 'wb')
+    fid.write(''.join(lines))
+    fid.close()
+    return path
+
+def _read(source, **options):
+    reader = LogReader(source, **options)
+    try:
+        return list(reader)
+    finally:
+        reader.close()
+
+
+@pytest.mark.parametrize('threaded', [True, False])
+@pytest.mark.parametrize('opener', [gzip.open, bz2.BZ2File])
+def test_logreader_compressed(tmpdir, opener, threaded):
+    lines = _readerlines()
+    path = _compress(str(tmpdir.join('log')), opener, lines)
+    reader = LogReader(path, threaded)
+    assert reader.compression == ('gzip' if opener is gzip.open else 'bzip2')
+    assert list(reader) == lines
+    reader.close()
+
+def test_logreader_concatenated_gzip(tmpdir):
+    lines = _readerlines()
+    first = _compress(str(tmpdir.join('a.gz')), gzip.open, lines[:50])
+    second = _compress(str(tmpdir.join('b.gz')), gzip.open, lines[50:])
+    path = tmpdir.join('ab.gz')
+    path.write(open(first, 'rb').read() + open(second, 'rb').read(), 'wb')
+    assert _read(str(path)) == lines
+    assert _read(str(path), threaded=False) == lines
+
+def _pipe(data, close=True):
+    read, write = os.pipe()
+    os.write(write, data)
+    if close:
+        os.close(write)
+    return os.fdopen(read, 'rb'), write
+
+@pytest.mark.parametrize('compressed', [False, True])
+def test_logreader_piped(tmpdir, compressed):
+    lines = _readerlines()
+    data = ''.join(lines)
+    if compressed:
+        data = open(_compress(str(tmpdir.join('log.gz')), gzip.open, lines),
+                    'rb').read()
+    fid, write = _pipe(data)
+    assert _read(fid) == lines
+
+def test_logreader_pipe_yields_lines_as_they_arrive():
+    # The writer stays open, as a live logger's would.
+    fid, write = _pipe(_line(0) + _line(1)[:10], close=False)
+    received = []
+    thread = threading.Thread(target=lambda: received.append(next(iter(LogReader(fid)))))
+    thread.daemon = True
+    thread.start()
+    thread.join(5)
+    try:
+        assert received == [_line(0)]
+    finally:
+        os.close(write)
+        thread.join(5)
+        fid.close()
+
+def test_logreader_close_stops_decompression_thread(tmpdir, monkeypatch):
+    monkeypatch.setattr(LogReader, 'BLOCKSIZE', 1024)
+    monkeypatch.setattr(LogReader, 'QUEUESIZE', 1)
+    monkeypatch.setattr(LogReader, 'POLLINTERVAL', 0.01)
+    path = _compress(str(tmpdir.join('log.gz')), gzip.open, _readerlines(20000))
+    reader = LogReader(path)
+    next(iter(reader))
+    # The thread is left waiting on a full queue.
+    for wait in range(500):
+        if reader._queue.full():
+            break
+        time.sleep(0.01)
+    reader.close()
+    reader._thread.join(5)
+    assert not reader._thread.is_alive()
@@ -0,0 +1,54 @@
+'''
+Tests of the replay of logs.
+'''
+from gpsparser.replay import Replay
+from tests import gga
+
+
+def _log(tmpdir, stamps):
+    path = tmpdir.join('log.txt')
+    path.write(''.join(gga(time='1830%02d.00' % idx,
+                           prefix='RTK1_GPS DATA %s ' % stamp) + '\n'
+                       for idx, stamp in enumerate(stamps)))
+    return str(path)
+
+def _stamps(count):
+    return ['2008-08-13T18:31:%02d.000000' % idx for idx in range(count)]
+
+def _replay(path, **options):
+    sent = []
+    replay = Replay(path, sent.append, **options)
+    replay.run()
+    return replay, sent
+
+
+def test_replay_as_fast_as_possible(tmpdir):
+    path = _log(tmpdir, _stamps(20))
+    replay, sent = _replay(path, speed=0)
+    with open(path) as fid:
+        assert sent == fid.readlines()
+    report = replay.report()
+    assert report['lines'] == 20 and report['corrupted'] == 0
+    assert report['maxlag'] == 0.0
+    assert replay.elapsed < 1.0
+
+def test_replay_paced_by_logger_time(tmpdir):
+    replay, sent = _replay(_log(tmpdir, _stamps(3)), speed=20)
+    # Two seconds of log at twenty times real time.
+    assert len(sent) == 3
+    assert 0.09 < replay.elapsed < 0.5
+
+def test_replay_damaged_stamp_sent_without_schedule(tmpdir):
+    stamps = _stamps(3)
+    stamps[1] = '2008-13-13T18:31:01.000000'
+    replay, sent = _replay(_log(tmpdir, stamps), speed=20)
+    assert len(sent) == 3
+    assert 'T18:31:01' in sent[1]
+    assert 0.09 < replay.elapsed < 0.5
+
+def test_replay_corruption_is_repeatable(tmpdir):
+    path = _log(tmpdir, _stamps(50))
+    first, sentfirst = _replay(path, speed=0, corrupt=0.5, seed=1)
+    second, sentsecond = _replay(path, speed=0, corrupt=0.5, seed=1)
+    assert 0 < first.corrupted < 50
+    assert sentfirst == sentsecond
@@ -0,0 +1,67 @@
+'''
+Tests of the ring buffer records are published to.
+'''
+import datetime
+import os
+import pytest
+from gpsparser.ringbuffer import RingWriter, RingReader
+
+
+@pytest.fixture
+def ring():
+    writer = RingWriter('GGA', name='test-ring-%d' % os.getpid(), slots=4)
+    reader = RingReader(writer.name)
+    yield writer, reader
+    reader.close()
+    writer.close(unlink=True)
+
+def _publish(writer, count):
+    start = datetime.datetime(2008, 8, 13, 18, 31)
+    for idx in range(count):
+        writer.publish({'pctime': start + datetime.timedelta(seconds=idx),
+                        'latitude': float(writer.published + 1)})
+
+def _latitudes(reader, records):
+    column = reader.fields.index('latitude')
+    return [values[column] for sequence, values in records]
+
+
+def test_reader_keeps_up(ring):
+    writer, reader = ring
+    _publish(writer, 3)
+    records = reader.read()
+    assert [sequence for sequence, values in records] == [1, 2, 3]
+    assert _latitudes(reader, records) == [1.0, 2.0, 3.0]
+    assert reader.lost == 0
+    assert reader.read() == []
+
+def test_overrun_skips_to_the_oldest_record_held(ring):
+    writer, reader = ring
+    _publish(writer, 10)
+    records = reader.read()
+    assert [sequence for sequence, values in records] == [7, 8, 9, 10]
+    assert _latitudes(reader, records) == [7.0, 8.0, 9.0, 10.0]
+    assert reader.lost == 6
+    # The records overwritten are gone, those held are still there.
+    assert reader.get(6) is None
+    assert reader.get(7) is not None
+    _publish(writer, 2)
+    assert [sequence for sequence, values in reader.read()] == [11, 12]
+    assert reader.lost == 6
+
+def test_reader_falling_behind_counts_only_the_records_overwritten(ring):
+    writer, reader = ring
+    _publish(writer, 3)
+    reader.read()
+    _publish(writer, 6)
+    records = reader.read()
+    assert [sequence for sequence, values in records] == [6, 7, 8, 9]
+    assert reader.lost == 2
+
+def test_latest(ring):
+    writer, reader = ring
+    assert reader.latest() is None
+    _publish(writer, 5)
+    sequence, values = reader.latest()
+    assert sequence == 5
+    assert values[reader.fields.index('latitude')] == 5.0
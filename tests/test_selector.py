@@ -0,0 +1,47 @@
+'''
+Tests of the selection of the best solution from several receivers.
+'''
+import pytest
+from gpsparser.gpsparser import Parser
+from gpsparser.selector import BestSolution, sourcename
+from tests import gga
+
+PREFIX = 'RTK1_GPS DATA 2008-08-13T18:30:00.000000 '
+
+
+def _lines(count):
+    ''' An autonomous GP fix and an RTK fixed IN fix, GP first, each second.'''
+    lines = []
+    for i in range(count):
+        time = '1830%02d.00' % i
+        lines.append(gga(time=time, quality='1', talker='GP', prefix=PREFIX))
+        lines.append(gga(time=time, quality='4', talker='IN', prefix=PREFIX))
+    return lines
+
+def _select(times, lines):
+    parser = Parser(['GGA'], numeric='float', times=times)
+    selector = BestSolution(times=times)
+    results = []
+    for line in lines:
+        record = parser.parse(line)._asdict()
+        results.extend(selector.add(sourcename(line, 'GGA'), record))
+    results.extend(selector.flush())
+    return selector, results
+
+
+@pytest.mark.parametrize('times', sorted(Parser.TIMES))
+def test_selector_chooses_best_source_in_every_time_format(times):
+    selector, results = _select(times, _lines(5))
+    assert selector.late == 0
+    assert [result['source'] for result in results] == ['IN'] * 5
+    assert selector.chosen == {'IN': 5}
+
+def test_selector_first_epoch_waits_for_unseen_sources():
+    parser = Parser(['GGA'], numeric='float', times='epoch')
+    selector = BestSolution(times='epoch')
+    first, second = _lines(1)
+    # Only GP has been seen, but IN may yet report for this epoch.
+    assert selector.add('GP', parser.parse(first)._asdict()) == []
+    assert selector.add('IN', parser.parse(second)._asdict()) == []
+    assert [result['source'] for result in selector.flush()] == ['IN']
+    assert selector.late == 0
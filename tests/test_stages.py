@@ -0,0 +1,262 @@
+'''
+Tests of the stages of a parse: the filters applied to raw fields before
+parsing, and the reduction of parsed records.
+'''
+import datetime
+import json
+import math
+import pytest
+from gpsparser.gpsparser import GPSString, Parser
+from gpsparser.stages import (Filter, Decimator, Deduplicator, BucketAverager,
+                              Summary, RunStats, ErrorAggregator)
+from tests import gga, sentence
+
+PREFIX = 'RTK1_GPS DATA 2008-08-13T18:31:00.000000 '
+
+
+def _status(recordfilter, line):
+    return Parser(['GGA'], filter=recordfilter).tryparse(line)[0]
+
+def _fields(line):
+    ''' The raw fields of a sentence, as they are filtered.'''
+    return line[line.index('$'):line.index('*')].split(',')
+
+
+def test_filter_where():
+    recordfilter = Filter(where=['quality>=4', ('svs', '>', 5)])
+    assert _status(recordfilter, gga(quality='4')) == GPSString.PARSED
+    assert _status(recordfilter, gga(quality='1')) == GPSString.FILTERED
+    # An empty field fails the condition.
+    assert _status(recordfilter, gga(quality='')) == GPSString.FILTERED
+
+@pytest.mark.parametrize('where', [['qualty>=4'], [('qualty', '>=', 4)]])
+def test_filter_unknown_field_raises(where):
+    with pytest.raises(ValueError):
+        Filter(where=where)
+
+def test_filter_malformed_condition_raises():
+    with pytest.raises(ValueError):
+        Filter(where=['quality'])
+
+def test_filter_condition_on_field_of_other_type_is_ignored():
+    # HDT has a heading, GGA does not.
+    assert _status(Filter(where=['heading<10']), gga()) == GPSString.PARSED
+
+def test_filter_bbox():
+    # The default fix is at 71.335 N, 156.862 W.
+    inside = Filter(bbox=(71, -157, 72, -156))
+    outside = Filter(bbox=(71, -156, 72, -155))
+    assert _status(inside, gga()) == GPSString.PARSED
+    assert _status(outside, gga()) == GPSString.FILTERED
+
+def test_filter_time_window():
+    recordfilter = Filter(start=datetime.datetime(2008, 8, 13, 18, 30, 0),
+                          end=datetime.datetime(2008, 8, 13, 18, 30, 30))
+    for time, status in [('182959.99', GPSString.FILTERED),
+                         ('183000.00', GPSString.PARSED),
+                         ('183030.00', GPSString.PARSED),
+                         ('183030.01', GPSString.FILTERED)]:
+        assert _status(recordfilter, gga(time=time, prefix=PREFIX)) == status
+    # Dated by the logger, so the wrong day.
+    line = gga(prefix=PREFIX.replace('08-13', '08-14'))
+    assert _status(recordfilter, line) == GPSString.FILTERED
+
+def test_filter_time_window_without_date():
+    recordfilter = Filter(start=datetime.datetime(2008, 8, 13, 18, 30))
+    fields = _fields(gga())
+    assert not recordfilter.accept('GGA', fields, None)
+    assert recordfilter.accept('GGA', fields, datetime.date(2008, 8, 13))
+    assert not recordfilter.accept('GGA', fields, datetime.date(2008, 8, 12))
+    # Without a time window, the date is not needed.
+    assert Filter(where=['quality>=4']).accept('GGA', fields, None)
+
+
+def _kept(decimator, lines):
+    parser = Parser(['GGA'], filter=decimator)
+    return [line for line in lines if parser.tryparse(line)[0] == GPSString.PARSED]
+
+def _interleaved(count):
+    ''' GP and IN fixes at 5 Hz, interleaved as in a merged log.'''
+    return [gga(time='1830%05.2f' % (idx * 0.2), talker=talker, prefix=PREFIX)
+            for idx in range(count) for talker in ('GP', 'IN')]
+
+
+def test_decimator_every():
+    lines = _interleaved(10)
+    kept = _kept(Decimator({'GGA': ('every', 5)}), lines)
+    # Every fifth fix of each receiver.
+    assert kept == [lines[0], lines[1], lines[10], lines[11]]
+
+def test_decimator_first_in_each_bucket_of_each_talker():
+    lines = _interleaved(15)
+    kept = _kept(Decimator({'GGA': ('first', 1.0)}), lines)
+    assert kept == [lines[0], lines[1], lines[10], lines[11], lines[20],
+                    lines[21]]
+
+def test_decimator_applies_its_filter_first():
+    lines = [gga(quality=quality, prefix=PREFIX) for quality in '1411444']
+    decimator = Decimator({'GGA': ('every', 2)},
+                          filter=Filter(where=['quality==4']))
+    assert _kept(decimator, lines) == [lines[1], lines[5]]
+
+def test_decimator_other_types_pass():
+    assert _kept(Decimator({'RMC': ('every', 10)}), _interleaved(3)) == \
+        _interleaved(3)
+
+def test_decimator_parsespec():
+    assert Decimator.parsespec('every:20') == (None, 'every', 20)
+    assert Decimator.parsespec('GGA:first:0.5') == ('GGA', 'first', 0.5)
+    # Averaging is done by a BucketAverager, after parsing.
+    assert Decimator.parsespec('mean:1') == (None, 'mean', 1.0)
+    with pytest.raises(ValueError):
+        Decimator({'GGA': ('mean', 1.0)})
+    for spec in ('every', 'median:1', 'every:0', 'GGA:first:-1'):
+        with pytest.raises(ValueError):
+            Decimator.parsespec(spec)
+
+
+def test_bucketaverager_takes_mode_of_categorical_fields():
+    averager = BucketAverager(10, times='epoch')
+    for seconds, quality, svs, latitude in [(0.0, 4.0, 11.0, 1.0),
+                                            (1.0, 4.0, 12.0, 2.0),
+                                            (2.0, 1.0, 12.0, float('nan')),
+                                            (3.0, 5.0, 9.0, 3.0)]:
+        assert averager.add({'datetime': seconds, 'quality': quality,
+                             'svs': svs, 'latitude': latitude}) is None
+    averaged = averager.flush()
+    # Averaging would give a quality of 3.5, which is not a fix quality.
+    assert averaged['quality'] == 4.0
+    assert averaged['svs'] == 12.0
+    assert averaged['latitude'] == 2.0
+    assert averaged['datetime'] == 1.5
+
+def test_bucketaverager_mode_tie_takes_latest_value():
+    averager = BucketAverager(10, times='epoch')
+    for seconds, quality in [(0.0, 4.0), (1.0, 5.0), (2.0, 5.0), (3.0, 4.0)]:
+        averager.add({'datetime': seconds, 'quality': quality})
+    assert averager.add({'datetime': 10.0, 'quality': 1.0})['quality'] == 4.0
+
+
+def test_deduplicator_time_key_keeps_each_talker():
+    deduplicator = Deduplicator(key='time')
+    parser = Parser(['GGA'], filter=deduplicator)
+    statuses = [parser.tryparse(line)[0] for line in
+                [gga(talker='GP'), gga(talker='IN', quality='5'),
+                 gga(talker='GP', quality='1')]]
+    assert statuses == [GPSString.PARSED, GPSString.PARSED, GPSString.FILTERED]
+    assert deduplicator.dropped == 1
+
+def test_deduplicator_time_key_keeps_each_day():
+    parser = Parser(['GGA'], filter=Deduplicator(key='time'))
+    lines = [gga(prefix='RTK1_GPS DATA 2008-08-%sT18:30:00.000000 ' % day)
+             for day in ('13', '14')]
+    assert [parser.tryparse(line)[0] for line in lines] == [GPSString.PARSED] * 2
+
+
+def _summaryrecords():
+    start = datetime.datetime(2008, 8, 13, 18, 30)
+    return [{'datetime': start + datetime.timedelta(seconds=i),
+             'latitude': 71.0 + i / 100.0, 'quality': 4 if i % 3 else 5}
+            for i in range(10)]
+
+def test_summary_merge_matches_single_pass():
+    records = _summaryrecords()
+    whole = Summary()
+    for record in records:
+        whole.add(record)
+    first, second = Summary(), Summary()
+    for record in records[:4]:
+        first.add(record)
+    for record in records[4:]:
+        second.add(record)
+    # Through JSON, as the summaries of parallel workers are.
+    merged = Summary.fromdict(json.loads(first.tojson()))
+    merged.merge(Summary.fromdict(json.loads(second.tojson())))
+    expected, result = whole.todict(), merged.todict()
+    assert result['records'] == expected['records'] == 10
+    assert result['gpstime'] == expected['gpstime']
+    assert result['histograms'] == expected['histograms']
+    for name in ('count', 'min', 'max'):
+        assert result['fields']['latitude'][name] == \
+            expected['fields']['latitude'][name]
+    for name in ('mean', 'std'):
+        assert math.fabs(result['fields']['latitude'][name] -
+                         expected['fields']['latitude'][name]) < 1e-9
+
+@pytest.mark.parametrize('times', ['epoch', 'datenum', 'gpsweek'])
+def test_summary_time_span_with_numeric_times(times):
+    parser = Parser(['GGA'], numeric='float', times=times)
+    summary = Summary(times)
+    for time in ('183000.00', '183010.50'):
+        summary.add(parser.parse(gga(
+            time=time, prefix='RTK1_GPS DATA 2008-08-13T18:30:00.000000 '))._asdict())
+    span = summary.todict()['gpstime']
+    assert span['start'].startswith('2008-08-13T18:30:00')
+    assert math.fabs(span['span'] - 10.5) < 1e-3
+
+
+def test_erroraggregator_counts_by_type_and_bounds_samples():
+    errors = ErrorAggregator(maxsamples=2)
+    for idx in range(5):
+        errors.add(GPSString.FAILED_CHECKSUM, 'GGA', 'gga %d\n' % idx)
+    errors.add(GPSString.FAILED_CHECKSUM, 'RMC', 'rmc\n')
+    errors.add(GPSString.UNRECOGNIZED, None, 'junk\n')
+    assert errors.counts == {('failed checksum', 'GGA'): 5, ('failed checksum', 'RMC'): 1,
+                             ('unrecognized', None): 1}
+    assert errors.samples == {'failed checksum': ['gga 0', 'gga 1'],
+                              'unrecognized': ['junk']}
+    assert errors.total() == 7
+    summary = errors.summary()
+    assert summary.startswith('7 lines were not parsed:')
+    assert 'gga 2' not in summary
+
+
+def _counted(stats, parser, lines):
+    for line in lines:
+        stats.countline(line)
+        parser.tryparse(line)
+
+
+def test_runstats_counts_an_instrumented_parser():
+    stats = RunStats()
+    parser = stats.instrument(Parser(['GGA'],
+                                     filter=Filter(where=['quality>=4'])))
+    good = gga()
+    lines = [good,
+             gga(time='183001.00'),
+             good[:good.index('*') + 1] + '00\n',
+             gga(latitude='71x0.1'),
+             gga(quality='1'),
+             sentence('GPHDT,123.4,T'),
+             'no sentence here\n']
+    _counted(stats, parser, lines)
+    assert stats.lines == 7
+    assert stats.bytes == sum(len(line) for line in lines)
+    assert stats.sentences == {'GGA': 5, 'HDT': 1}
+    assert stats.checksumfailures == 1
+    assert stats.parsefailures == 1
+    # Only the GGA rejected by the filter counts: HDT is not being parsed.
+    assert stats.filtered == 1
+    assert stats.unrecognized == 1
+    assert stats.stagetimes['parse'] > 0
+    assert stats.stagetimes['parse'] >= stats.stagetimes['identify']
+
+
+def test_runstats_json_report(tmpdir):
+    stats = RunStats()
+    parser = stats.instrument(Parser(['GGA']))
+    _counted(stats, parser, [gga(), 'junk\n'])
+    stats.records = 1
+    report = tmpdir.join('stats.json')
+    stats.write(str(report))
+    with open(str(report)) as fid:
+        loaded = json.load(fid)
+    assert sorted(loaded.keys()) == sorted(['lines', 'bytes', 'unrecognized',
+        'sentences', 'checksumfailures', 'parsefailures', 'filtered',
+        'duplicates', 'records', 'stagetimes', 'elapsed'])
+    assert loaded['lines'] == 2
+    assert loaded['sentences'] == {'GGA': 1}
+    assert loaded['unrecognized'] == 1
+    assert loaded['records'] == 1
+    assert loaded['elapsed'] > 0
+    assert 'parse' in loaded['stagetimes']
@@ -0,0 +1,148 @@
+'''
+Tests of the record writers.
+'''
+import os
+import sqlite3
+import subprocess
+import sys
+from collections import OrderedDict
+from gpsparser.writers import PartitionedWriter
+from gpsparser.ringbuffer import RingReader, ringpath
+from tests import gga
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'gpsparser', 'gpsparser.py')
+
+
+def _writelog(path, start, count, mode='w'):
+    with open(path, mode) as fid:
+        for i in range(start, start + count):
+            fid.write(gga(time='1830%02d.00' % i,
+                          prefix='RTK1_GPS DATA 2008-08-13T18:30:%02d.000000 ' % i)
+                      + '\n')
+
+def _parse(*args):
+    process = subprocess.Popen([sys.executable, SCRIPT, '-s', 'GGA'] + list(args),
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    assert process.returncode == 0, err
+    return out
+
+def _query(database, sql):
+    connection = sqlite3.connect(database)
+    try:
+        return connection.execute(sql).fetchall()
+    finally:
+        connection.close()
+
+def _rows(database, columns='gpstime'):
+    return _query(database, 'SELECT %s FROM GGA ORDER BY gpstime' % columns)
+
+
+def test_sqlite_reload_of_grown_log_stores_each_record_once(tmpdir):
+    log, database = str(tmpdir.join('gps.log')), str(tmpdir.join('gps.db'))
+    _writelog(log, 0, 10)
+    _parse('-f', log, '--sqlite', database)
+    assert len(_rows(database)) == 10
+    _writelog(log, 10, 5, 'a')
+    _parse('-f', log, '--sqlite', database)
+    times = [row[0] for row in _rows(database)]
+    assert len(times) == 15
+    assert len(set(times)) == 15
+
+def test_sqlite_reload_of_rewritten_log_replaces_its_rows(tmpdir):
+    log, database = str(tmpdir.join('gps.log')), str(tmpdir.join('gps.db'))
+    other = str(tmpdir.join('other.log'))
+    _writelog(log, 0, 10)
+    _writelog(other, 30, 3)
+    _parse('-f', log, '--sqlite', database)
+    _parse('-f', other, '--sqlite', database)
+    _writelog(log, 20, 4)
+    _parse('-f', log, '--sqlite', database)
+    counts = dict(_query(database,
+                         'SELECT logfile, COUNT(*) FROM GGA GROUP BY logfile'))
+    assert counts == {os.path.abspath(log): 4, os.path.abspath(other): 3}
+
+def test_sqlite_unchanged_log_is_skipped(tmpdir):
+    log, database = str(tmpdir.join('gps.log')), str(tmpdir.join('gps.db'))
+    _writelog(log, 0, 10)
+    _parse('-f', log, '--sqlite', database)
+    _parse('-f', log, '--sqlite', database)
+    assert len(_rows(database)) == 10
+
+def test_sqlite_stores_projected_columns(tmpdir):
+    log, database = str(tmpdir.join('gps.log')), str(tmpdir.join('gps.db'))
+    _writelog(log, 0, 3)
+    _parse('-f', log, '--sqlite', database, '--project', 'utm')
+    rows = _rows(database, 'easting, northing, zone')
+    assert len(rows) == 3
+    assert all(zone == 4 and easting > 0 and northing > 0
+               for easting, northing, zone in rows)
+
+def test_publish_includes_projected_columns(tmpdir):
+    log = str(tmpdir.join('gps.log'))
+    name = 'test-%d' % os.getpid()
+    _writelog(log, 0, 3)
+    _parse('-f', log, '--publish', name, '--project', 'utm')
+    try:
+        reader = RingReader(name)
+        sequence, values = reader.latest()
+        reader.close()
+    finally:
+        os.unlink(ringpath(name))
+    assert sequence == 3
+    record = dict(zip(reader.fields, values))
+    assert record['zone'] == 4 and record['easting'] > 0
+
+
+HOUR = 3600.0
+START = 1218650400.0
+'2008-08-13 18:00:00, the start of partition 2008-226-18.'
+
+def _writepartitions(directory, hours, maxopen=None, start=0):
+    writer = PartitionedWriter(directory, 'GGA', maxopen=maxopen, times='epoch')
+    for index, hour in enumerate(hours, start):
+        writer.write(OrderedDict([('datetime', START + hour * HOUR + index),
+                                  ('index', index)]))
+    writer.close()
+    return writer
+
+def _partitions(directory):
+    directory = os.path.join(directory, 'GGA')
+    result = {}
+    for name in os.listdir(directory):
+        with open(os.path.join(directory, name)) as fid:
+            result[name] = [int(line.split()[1]) for line in fid]
+    return result
+
+
+def test_partitions_by_hour(tmpdir):
+    _writepartitions(str(tmpdir), [0, 0, 1, 25])
+    assert _partitions(str(tmpdir)) == {'2008-226-18.txt': [0, 1],
+                                        '2008-226-19.txt': [2],
+                                        '2008-227-19.txt': [3]}
+
+def test_partition_evicted_file_is_appended_to(tmpdir):
+    hours = [0, 1, 0, 1, 0, 1]
+    writer = _writepartitions(str(tmpdir), hours, maxopen=1)
+    assert writer.opened == 6
+    assert _partitions(str(tmpdir)) == {'2008-226-18.txt': [0, 2, 4],
+                                        '2008-226-19.txt': [1, 3, 5]}
+
+def test_partition_evicts_least_recently_used_file(tmpdir):
+    # Opening hour 2 closes hour 1, which was used less recently than hour 0.
+    writer = _writepartitions(str(tmpdir), [0, 1, 0, 2, 0, 2], maxopen=2)
+    assert writer.opened == 3
+    writer = _writepartitions(str(tmpdir), [0, 1, 0, 2, 0, 1], maxopen=2)
+    assert writer.opened == 4
+
+def test_partition_existing_files_are_appended_to(tmpdir):
+    _writepartitions(str(tmpdir), [0, 1])
+    _writepartitions(str(tmpdir), [0, 1], start=2)
+    assert _partitions(str(tmpdir)) == {'2008-226-18.txt': [0, 2],
+                                        '2008-226-19.txt': [1, 3]}
+
+def test_partition_undated_records(tmpdir):
+    writer = PartitionedWriter(str(tmpdir), 'GGA', times='epoch')
+    record = OrderedDict([('pctime', None), ('datetime', None), ('index', 0)])
+    assert writer.partition(record) == 'undated'